@@ -1,7 +1,31 @@
+from unittest.mock import patch
+
 import pytest
 from core.fake_data import UserFactory
 from core.models import UserApiKey
+from django.core.cache import cache
 from rest_framework.test import APIClient
+from validations.tasks import ingest_validation_result
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Cached API keys and user flags are keyed by database ids, so they must not leak
+    between tests.
+    """
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def eager_ingestion():
+    """
+    Results of the validation modules are ingested right away instead of in the ingestion queue.
+    """
+    with patch.object(
+        ingest_validation_result, "delay", side_effect=ingest_validation_result
+    ) as delay:
+        yield delay
 
 
 @pytest.fixture
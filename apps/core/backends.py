@@ -0,0 +1,17 @@
+from django.contrib.auth.backends import ModelBackend
+
+from core.models import User
+
+
+class ValidatorModelBackend(ModelBackend):
+    """
+    Loads the user for session based requests together with the `_verified_email` annotation,
+    so that `User.verified_email` does not need an extra query.
+    """
+
+    def get_user(self, user_id):
+        try:
+            user = User.objects.annotate_verified_email().get(pk=user_id)
+        except User.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
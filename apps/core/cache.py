@@ -0,0 +1,65 @@
+"""
+Short-lived caches for data which is needed on (almost) every request.
+"""
+
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.core.cache import cache
+
+API_KEY_CACHE_KEY_PREFIX = "api_key_verified_"
+VERIFIED_EMAIL_CACHE_KEY_PREFIX = "user_verified_email_"
+
+
+def api_key_digest(key: str) -> str:
+    """
+    Fast digest of the API key as presented by the client. The digest is only used to
+    recognize an already verified key, the key itself is never stored in the cache.
+    """
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def api_key_cache_key(prefix: str) -> str:
+    return f"{API_KEY_CACHE_KEY_PREFIX}{prefix}"
+
+
+def get_cached_api_key(key: str) -> dict | None:
+    """
+    Returns the cached record of a successfully verified API key or None if the key
+    was not verified recently or the digest does not match.
+    """
+    prefix, _, _ = key.partition(".")
+    if not prefix or not (record := cache.get(api_key_cache_key(prefix))):
+        return None
+    if not hmac.compare_digest(record["digest"], api_key_digest(key)):
+        return None
+    return record
+
+
+def set_cached_api_key(key: str, user_id: int, prefix: str) -> None:
+    cache.set(
+        api_key_cache_key(prefix),
+        {"digest": api_key_digest(key), "user_id": user_id, "prefix": prefix},
+        settings.API_KEY_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_cached_api_key(prefix: str) -> None:
+    cache.delete(api_key_cache_key(prefix))
+
+
+def verified_email_cache_key(user_id: int) -> str:
+    return f"{VERIFIED_EMAIL_CACHE_KEY_PREFIX}{user_id}"
+
+
+def get_cached_verified_email(user_id: int) -> bool | None:
+    return cache.get(verified_email_cache_key(user_id))
+
+
+def set_cached_verified_email(user_id: int, verified: bool) -> None:
+    cache.set(verified_email_cache_key(user_id), verified, settings.VERIFIED_EMAIL_CACHE_TIMEOUT)
+
+
+def invalidate_cached_verified_email(user_id: int) -> None:
+    cache.delete(verified_email_cache_key(user_id))
@@ -3,9 +3,27 @@ from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Exists, OuterRef
 from rest_framework_api_key.crypto import KeyGenerator
 from rest_framework_api_key.models import AbstractAPIKey, BaseAPIKeyManager
 
+from core.cache import get_cached_verified_email, set_cached_verified_email
+
+
+def verified_email_exists(user_ref: str = "id", email_ref: str = "email") -> Exists:
+    """
+    Subquery telling whether the user referenced by `user_ref` has the email referenced by
+    `email_ref` verified. It is meant for annotating querysets with `_verified_email`.
+    """
+    # local import - allauth models depend on the user model defined here
+    from allauth.account.models import EmailAddress
+
+    return Exists(
+        EmailAddress.objects.filter(
+            user_id=OuterRef(user_ref), email=OuterRef(email_ref), verified=True
+        )
+    )
+
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
@@ -41,6 +59,12 @@ class UserManager(BaseUserManager):
 
         return self._create_user(email, password, **extra_fields)
 
+    def annotate_verified_email(self):
+        """
+        Provides the `_verified_email` annotation used by `User.verified_email`.
+        """
+        return self.annotate(_verified_email=verified_email_exists())
+
 
 class User(AbstractUser):
     objects = UserManager()
@@ -66,7 +90,10 @@ class User(AbstractUser):
         if hasattr(self, "_verified_email"):
             # the value was provided in the queryset as an annotation
             return self._verified_email
-        return self.emailaddress_set.filter(verified=True, email=self.email).exists()
+        if (verified := get_cached_verified_email(self.pk)) is None:
+            verified = self.emailaddress_set.filter(verified=True, email=self.email).exists()
+            set_cached_verified_email(self.pk, verified)
+        return verified
 
 
 class UserApiKeyManager(BaseAPIKeyManager):
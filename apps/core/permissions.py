@@ -4,7 +4,8 @@ from django.http import HttpRequest
 from rest_framework.permissions import BasePermission
 from rest_framework_api_key.permissions import BaseHasAPIKey
 
-from core.models import UserApiKey
+from core.cache import get_cached_api_key, invalidate_cached_api_key, set_cached_api_key
+from core.models import UserApiKey, verified_email_exists
 
 
 class HasUserAPIKey(BaseHasAPIKey):
@@ -13,16 +14,40 @@ class HasUserAPIKey(BaseHasAPIKey):
     def has_permission(self, request: HttpRequest, view: typing.Any) -> bool:
         """
         Based on upstream implementation, but with a custom model.
+
+        Verifying the key is deliberately slow (the key is hashed), so recently verified keys
+        are cached and for those we only need to fetch the key and its user from the database.
         """
         key = self.get_key(request)
         if not key:
             return False
-        if self.model.objects.is_valid(key):
-            api_key = self.model.objects.get_from_key(key)
-            request.user = api_key.user
-            request.api_key = api_key
-            return True
-        return False
+        if (api_key := self.get_recently_verified_key(key)) is None:
+            try:
+                api_key = self.model.objects.get_from_key(key)
+            except self.model.DoesNotExist:
+                return False
+            if api_key.has_expired:
+                return False
+            set_cached_api_key(key, api_key.user_id, api_key.prefix)
+        request.user = api_key.user
+        request.api_key = api_key
+        return True
+
+    def get_recently_verified_key(self, key: str) -> UserApiKey | None:
+        if not (record := get_cached_api_key(key)):
+            return None
+        api_key = (
+            self.model.objects.get_usable_keys()
+            .select_related("user")
+            .annotate(user_verified_email=verified_email_exists("user_id", "user__email"))
+            .filter(prefix=record["prefix"], user_id=record["user_id"])
+            .first()
+        )
+        if not api_key or api_key.has_expired:
+            invalidate_cached_api_key(record["prefix"])
+            return None
+        api_key.user._verified_email = api_key.user_verified_email
+        return api_key
 
 
 class IsValidatorAdminUser(BasePermission):
@@ -1,7 +1,10 @@
 from allauth.account.models import EmailAddress
-from allauth.account.signals import user_signed_up
+from allauth.account.signals import email_confirmed, user_signed_up
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import Signal, receiver
 
+from .cache import invalidate_cached_api_key, invalidate_cached_verified_email
+from .models import User, UserApiKey
 from .tasks import async_mail_admins
 
 password_reset_signal = Signal()
@@ -34,3 +37,38 @@ def verify_user_email(request, user, **kwargs):
         if not created:
             email_obj.verified = True
             email_obj.save()
+        invalidate_verified_email(User, user)
+
+
+@receiver(post_save, sender=UserApiKey)
+@receiver(post_delete, sender=UserApiKey)
+def invalidate_api_key_cache(sender, instance: UserApiKey, **kwargs):
+    """
+    Revoked or removed keys must not be accepted based on a cached verification.
+    """
+    invalidate_cached_api_key(instance.prefix)
+
+
+@receiver(email_confirmed)
+def invalidate_verified_email_on_confirmation(request, email_address, **kwargs):
+    invalidate_verified_email(User, email_address.user)
+
+
+@receiver(post_save, sender=EmailAddress)
+@receiver(post_delete, sender=EmailAddress)
+def invalidate_verified_email_on_email_change(sender, instance: EmailAddress, **kwargs):
+    """
+    Email addresses may also be removed or unverified (e.g. in the admin), in which case
+    the cached value would still grant access reserved for users with a verified email.
+    """
+    invalidate_cached_verified_email(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_verified_email(sender, instance: User, **kwargs):
+    """
+    The email of the user may have changed, so both the cached value and the value
+    remembered by the instance itself are no longer reliable.
+    """
+    instance.__dict__.pop("_verified_email", None)
+    invalidate_cached_verified_email(instance.pk)
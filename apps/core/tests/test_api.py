@@ -318,6 +318,49 @@ class TestApiKeyAPI:
         assert res.status_code == 200
         assert UserApiKey.objects.get(prefix=api_key.prefix).revoked
 
+    def test_api_key_verification_is_cached(self, client_with_api_key):
+        """
+        The slow key verification should be done only for the first request, subsequent
+        requests should use the cached verification result.
+        """
+        with patch.object(
+            UserApiKey.objects, "get_from_key", wraps=UserApiKey.objects.get_from_key
+        ) as get_from_key:
+            for _i in range(3):
+                res = client_with_api_key.get(reverse("validation-list"))
+                assert res.status_code == 200
+            assert get_from_key.call_count == 1
+
+    @pytest.mark.parametrize("delete", [True, False])
+    def test_api_key_revoke_invalidates_cache(
+        self, client_authenticated_user, normal_user, client_unauthenticated, delete
+    ):
+        api_key, key = UserApiKey.objects.create_key(name="foo", user=normal_user)
+        client_unauthenticated.credentials(HTTP_AUTHORIZATION=f"Api-Key {key}")
+        res = client_unauthenticated.get(reverse("validation-list"))
+        assert res.status_code == 200, "key is valid and verification is cached now"
+        if delete:
+            api_key.delete()
+        else:
+            res = client_authenticated_user.delete(
+                reverse("api-key-detail", kwargs={"prefix": api_key.prefix})
+            )
+            assert res.status_code == 200
+        res = client_unauthenticated.get(reverse("validation-list"))
+        assert res.status_code == 403, "revoked key must not be accepted from cache"
+
+    def test_api_key_cache_wrong_secret(self, client_with_api_key, client_unauthenticated):
+        """
+        Having the correct prefix in the cache must not be enough to get in.
+        """
+        res = client_with_api_key.get(reverse("validation-list"))
+        assert res.status_code == 200
+        client_unauthenticated.credentials(
+            HTTP_AUTHORIZATION=f"Api-Key {client_with_api_key.api_key_prefix_}.wrong-secret"
+        )
+        res = client_unauthenticated.get(reverse("validation-list"))
+        assert res.status_code == 403
+
 
 @pytest.mark.django_db
 class TestRegistrationAPI:
@@ -1,5 +1,9 @@
 import pytest
+from allauth.account.models import EmailAddress
+from allauth.account.signals import email_confirmed
+from django.urls import reverse
 
+from core.fake_data import UserFactory
 from core.models import User
 
 
@@ -14,3 +18,72 @@ class TestUserManager:
         user = User.objects.create_superuser(email="foo@bar.baz", password="password")
         assert user.email == "foo@bar.baz"
         assert user.is_superuser is True
+
+
+@pytest.mark.django_db
+class TestUserVerifiedEmail:
+    def test_verified_email_annotation(self, django_assert_num_queries):
+        user = UserFactory(verified_email=True)
+        with django_assert_num_queries(1):
+            user = User.objects.annotate_verified_email().get(pk=user.pk)
+            assert user.verified_email is True
+
+    def test_verified_email_cached(self, django_assert_num_queries):
+        user = UserFactory(verified_email=True)
+        assert User.objects.get(pk=user.pk).verified_email is True
+        with django_assert_num_queries(1):
+            # only the user is fetched, the flag comes from the cache
+            assert User.objects.get(pk=user.pk).verified_email is True
+
+    def test_verified_email_cache_invalidated_by_confirmation(self, rf):
+        user = UserFactory()
+        email = EmailAddress.objects.create(user=user, email=user.email, verified=False)
+        assert User.objects.get(pk=user.pk).verified_email is False
+        email.verified = True
+        email.save()
+        email_confirmed.send(sender=EmailAddress, request=rf.get("/"), email_address=email)
+        assert User.objects.get(pk=user.pk).verified_email is True
+
+    def test_verified_email_cache_invalidated_by_email_change(self):
+        user = UserFactory(verified_email=True)
+        assert user.verified_email is True
+        user.email = "new@bar.baz"
+        user.save()
+        assert user.verified_email is False
+        assert User.objects.get(pk=user.pk).verified_email is False
+
+    @pytest.mark.parametrize("delete", [True, False])
+    def test_verified_email_cache_invalidated_by_email_address_change(self, delete):
+        user = UserFactory(verified_email=True)
+        assert User.objects.get(pk=user.pk).verified_email is True
+        email = EmailAddress.objects.get(user=user)
+        if delete:
+            email.delete()
+        else:
+            email.verified = False
+            email.save()
+        assert User.objects.get(pk=user.pk).verified_email is False
+
+    def test_session_with_old_backend(self, client, normal_user):
+        """
+        Sessions created with the default model backend should remain valid.
+        """
+        client.force_login(normal_user, backend="django.contrib.auth.backends.ModelBackend")
+        res = client.get(reverse("current-user"))
+        assert res.status_code == 200
+
+    def test_session_user_is_annotated(self, client_authenticated_user, normal_user):
+        """
+        The user loaded by the authentication backend for session based requests
+        should carry the verified email annotation.
+        """
+        res = client_authenticated_user.get(reverse("current-user"))
+        assert res.status_code == 200
+        assert res.wsgi_request.user._verified_email is True
+
+    def test_api_key_user_is_annotated(self, client_with_api_key):
+        # first request verifies the key, the second one uses the cached verification
+        for _i in range(2):
+            res = client_with_api_key.get(reverse("validation-list"))
+            assert res.status_code == 200
+        assert res.wsgi_request.user._verified_email is True
@@ -5,7 +5,7 @@ from allauth.account.adapter import get_adapter
 from allauth.account.models import EmailAddress
 from dj_rest_auth.views import PasswordResetConfirmView
 from django.conf import settings
-from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models import Count, OuterRef, Subquery, Value
 from django.utils.timezone import now
 from rest_framework import status
 from rest_framework.decorators import action
@@ -96,16 +96,11 @@ class UserManagementViewSet(ModelViewSet):
         """
         Only superusers can see other superusers.
         """
-        qs = User.objects.all()
+        qs = User.objects.annotate_verified_email()
         if not self.request.user.is_superuser:
             qs = qs.exclude(is_superuser=True)
         cutoff_date = now() - timedelta(days=7)
         qs = qs.annotate(
-            _verified_email=Exists(
-                EmailAddress.objects.filter(
-                    user_id=OuterRef("id"), email=OuterRef("email"), verified=True
-                )
-            ),
             validations_total=Subquery(
                 ValidationCore.objects.filter(user_id=OuterRef("id"))
                 .order_by()
@@ -0,0 +1,33 @@
+"""
+Caching of the registry data served by the API. The data only changes when the registry sync
+runs, so the cached payloads are keyed by a registry version which the sync bumps.
+"""
+
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+REGISTRY_VERSION_CACHE_KEY = "registry_version"
+REGISTRY_PAYLOAD_CACHE_KEY_PREFIX = "registry_payload_"
+
+
+def get_registry_version() -> str:
+    # a random token (rather than a counter) stays unique even if the cache is cleared
+    return cache.get_or_set(REGISTRY_VERSION_CACHE_KEY, lambda: uuid4().hex, None)
+
+
+def bump_registry_version() -> None:
+    cache.set(REGISTRY_VERSION_CACHE_KEY, uuid4().hex, None)
+
+
+def registry_payload_cache_key(version: str, name: str) -> str:
+    return f"{REGISTRY_PAYLOAD_CACHE_KEY_PREFIX}{version}_{name}"
+
+
+def get_cached_registry_payload(version: str, name: str):
+    return cache.get(registry_payload_cache_key(version, name))
+
+
+def set_cached_registry_payload(version: str, name: str, data) -> None:
+    cache.set(registry_payload_cache_key(version, name), data, settings.REGISTRY_CACHE_TIMEOUT)
@@ -1,25 +1,122 @@
+import gzip
+import hashlib
+import json
 import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import IO
 
 import requests
 from django.conf import settings
-from django.db import models
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models import Prefetch
+from django.utils.timezone import now
+from requests.adapters import HTTPAdapter
 
-from counter.models import Platform, Report, SushiService
+from counter.cache import bump_registry_version
+from counter.enums import RegistryChangeAction, RegistryEntity
+from counter.models import Platform, RegistryChange, Report, ReportToPlatform, SushiService
 from counter.serializers import PlatformCreateSerializer, ReportSerializer, SushiServiceSerializer
 
 logger = logging.getLogger(__name__)
 
+SUSHI_CACHE_KEY_PREFIX = "registry_sushi_"
 
-def get_or_none(model_class: type[models.Model], *args, **kwargs):
-    try:
-        return model_class.objects.get(*args, **kwargs)
-    except model_class.DoesNotExist:
-        return None
+MODEL_TO_ENTITY = {
+    Platform: RegistryEntity.PLATFORM,
+    Report: RegistryEntity.REPORT,
+    SushiService: RegistryEntity.SUSHI_SERVICE,
+}
+
+
+def content_hash(obj: models.Model, **extra) -> str:
+    """
+    Hash of the data of a registry record (and `extra` data like its links to other records)
+    used to detect records which changed since the last sync.
+    """
+    data = {
+        f.attname: getattr(obj, f.attname)
+        for f in obj._meta.concrete_fields
+        if f.name != "content_hash"
+    }
+    encoded = json.dumps(data | extra, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class RegistryData:
+    """
+    Data downloaded from the registry - the platform list and SUSHI services by their URL.
+
+    It may also be stored into and loaded from a snapshot - a gzip compressed JSON file,
+    which allows to set up the registry data without access to the registry.
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    platforms: list[dict]
+    sushi_services: dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def from_db(cls) -> "RegistryData":
+        """
+        Creates the data in the registry format from the (non-deprecated) records in the database.
+        """
+        data = cls(platforms=[])
+        for platform in Platform.objects.filter(deprecated=False).prefetch_related(
+            "reports",
+            Prefetch("sushi_services", queryset=SushiService.objects.filter(deprecated=False)),
+        ):
+            platform_data = PlatformCreateSerializer(platform).data
+            platform_data["sushi_services"] = []
+            for service in platform.sushi_services.all():
+                url = f"{settings.REGISTRY_URL}/api/v1/sushi-service/{service.pk}/"
+                data.sushi_services[url] = SushiServiceSerializer(service).data
+                platform_data["sushi_services"].append(
+                    {"counter_release": service.counter_release, "url": url}
+                )
+            data.platforms.append(platform_data)
+        return data
+
+    def save_snapshot(self, fileobj: IO[bytes]):
+        with gzip.open(fileobj, "wt", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": self.SNAPSHOT_VERSION,
+                    "platforms": self.platforms,
+                    "sushi_services": self.sushi_services,
+                },
+                f,
+                cls=DjangoJSONEncoder,
+            )
+
+    @classmethod
+    def load_snapshot(cls, fileobj: IO[bytes]) -> "RegistryData":
+        with gzip.open(fileobj, "rt", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != cls.SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported registry snapshot version: {snapshot.get('version')}")
+        return cls(platforms=snapshot["platforms"], sushi_services=snapshot["sushi_services"])
 
 
 class RegistrySync:
+    """
+    Synchronizes platforms, reports and SUSHI services with the COUNTER Registry.
+
+    The sync has two phases - `fetch` downloads all the data from the registry (SUSHI services
+    concurrently) and `apply` writes it into the database in one transaction. Existing records
+    are loaded upfront and only new or changed ones are written.
+    """
+
     def __init__(self):
         self.client = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=settings.REGISTRY_SYNC_WORKERS)
+        self.client.mount("https://", adapter)
+        self.client.mount("http://", adapter)
         self.base_url = f"{settings.REGISTRY_URL}/api/v1/"
 
     def get_platforms(self):
@@ -30,55 +127,215 @@ class RegistrySync:
         return resp.json()
 
     def get_sushi(self, url):
-        resp = self.client.get(url)
+        """
+        Downloads a SUSHI service record. When the registry provided an ETag or Last-Modified
+        header the last time, a conditional request is made and unchanged records are not
+        downloaded again.
+        """
+        cache_key = f"{SUSHI_CACHE_KEY_PREFIX}{url}"
+        headers = {}
+        if cached := cache.get(cache_key):
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        resp = self.client.get(url, headers=headers)
+        if resp.status_code == 304 and cached:
+            return cached["data"]
         if resp.status_code != 200:
             raise RuntimeError(f"Failed to download sushi service {url}")
-        return resp.json()
-
-    def sync(self):
-        seen_platform_ids = set()
-        seen_sushi_service_ids = set()
+        data = resp.json()
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        if etag or last_modified:
+            cache.set(
+                cache_key,
+                {"etag": etag, "last_modified": last_modified, "data": data},
+                settings.REGISTRY_SYNC_CACHE_TIMEOUT,
+            )
+        return data
 
+    def fetch(self) -> RegistryData:
         logger.debug("Getting platform list")
-        platforms = self.get_platforms()
-        for i, platform_data in enumerate(platforms):
-            logger.debug("Processing platform %d/%d", i + 1, len(platforms))
-            serializer = PlatformCreateSerializer(
-                get_or_none(Platform, pk=platform_data["id"]), data=platform_data
+        data = RegistryData(platforms=self.get_platforms())
+        urls = list(
+            dict.fromkeys(
+                link["url"]
+                for platform_data in data.platforms
+                for link in platform_data.get("sushi_services", [])
             )
+        )
+        logger.debug("Getting %d sushi services", len(urls))
+        with ThreadPoolExecutor(max_workers=settings.REGISTRY_SYNC_WORKERS) as executor:
+            data.sushi_services = dict(zip(urls, executor.map(self.get_sushi, urls), strict=True))
+        return data
+
+    def sync(self) -> dict:
+        return self.apply(self.fetch())
+
+    @transaction.atomic
+    def apply(self, data: RegistryData) -> dict:
+        """
+        Writes the downloaded data into the database. Only records whose content hash differs
+        from the stored one are written and each change is recorded in the `RegistryChange`
+        journal. Returns the number of changes by their type.
+        """
+        stats = Counter()
+        journal = {}
+        platforms = {}
+        reports = {}
+        services = {}
+        platform_reports = {}
+
+        for platform_data in data.platforms:
+            serializer = PlatformCreateSerializer(data=platform_data)
             serializer.is_valid(raise_exception=True)
-            platform = serializer.save()
-            seen_platform_ids.add(platform.id)
+            platform = Platform(**serializer.validated_data)
+            platforms[platform.pk] = platform
 
-            # fill in and update report types
-            reports = []
+            # fill in report types
+            report_ids = set()
             for report_data in platform_data.get("reports", []):
-                rep_serializer = ReportSerializer(
-                    get_or_none(Report, pk=report_data["report_id"]),
-                    data=report_data,
-                )
+                rep_serializer = ReportSerializer(data=report_data)
                 rep_serializer.is_valid(raise_exception=True)
-                report = rep_serializer.save()
-                reports.append(report)
+                report = Report(**rep_serializer.validated_data)
+                reports[report.pk] = report
+                report_ids.add(report.pk)
+            platform_reports[platform.pk] = report_ids
 
-            platform.reports.set(reports)
-
-            # fill in and update sushi services
-            sushi_services = []
+            # fill in sushi services
+            service_ids = set()
             for sushi_service_link in platform_data.get("sushi_services", []):
-                service_data = self.get_sushi(sushi_service_link["url"])
                 ser_serializer = SushiServiceSerializer(
-                    get_or_none(SushiService, pk=service_data["id"]),
-                    data=service_data,
+                    data=data.sushi_services[sushi_service_link["url"]]
                 )
                 ser_serializer.is_valid(raise_exception=True)
-                sushi_service = ser_serializer.save()
-                seen_sushi_service_ids.add(sushi_service.id)
-                sushi_services.append(sushi_service)
-            platform.sushi_services.set(sushi_services)
+                service = SushiService(**ser_serializer.validated_data, platform=platform)
+                services[service.pk] = service
+                service_ids.add(str(service.pk))
+
+            # links are part of the hash, so they are only synced for changed platforms
+            platform.content_hash = content_hash(
+                platform, reports=sorted(report_ids), sushi_services=sorted(service_ids)
+            )
+
+        for obj in (*reports.values(), *services.values()):
+            obj.content_hash = content_hash(obj)
+
+        self.upsert(Report, reports.values(), stats, journal)
+        changed_platform_ids = self.upsert(Platform, platforms.values(), stats, journal)
+        self.upsert(SushiService, services.values(), stats, journal)
+        self.sync_report_links(
+            {pk: platform_reports[pk] for pk in changed_platform_ids}, stats, journal
+        )
+        # services no longer listed by the changed platforms are unlinked
+        stats["unlinked SushiService"] = (
+            SushiService.objects.filter(platform_id__in=changed_platform_ids)
+            .exclude(pk__in=services.keys())
+            .update(platform=None, content_hash="")
+        )
 
         # mark removed
-        Platform.objects.filter(id__in=seen_platform_ids).update(deprecated=False)
-        Platform.objects.exclude(id__in=seen_platform_ids).update(deprecated=True)
-        SushiService.objects.filter(id__in=seen_sushi_service_ids).update(deprecated=False)
-        SushiService.objects.exclude(id__in=seen_sushi_service_ids).update(deprecated=True)
+        for model, seen_ids in ((Platform, platforms.keys()), (SushiService, services.keys())):
+            removed = model.objects.exclude(pk__in=seen_ids).filter(deprecated=False)
+            for pk in removed.values_list("pk", flat=True):
+                self.record_change(journal, model, pk, RegistryChangeAction.DEPRECATED)
+            # resetting the hash makes the record "changed" when it appears again
+            stats[f"deprecated {model.__name__}"] = removed.update(deprecated=True, content_hash="")
+
+        RegistryChange.objects.bulk_create(journal.values())
+        if any(stats.values()):
+            # cached API responses must not outlive the data they were built from
+            transaction.on_commit(bump_registry_version)
+        logger.info("Registry sync finished: %s", dict(stats))
+        return dict(stats)
+
+    @classmethod
+    def prune_journal(cls) -> int:
+        """
+        Removes entries of the `RegistryChange` journal older than `REGISTRY_CHANGE_LIFETIME`
+        days. Returns the number of removed entries.
+        """
+        threshold = now() - timedelta(days=settings.REGISTRY_CHANGE_LIFETIME)
+        deleted, _ = RegistryChange.objects.filter(created__lt=threshold).delete()
+        if deleted:
+            logger.info("Removed %d old registry changes", deleted)
+        return deleted
+
+    @classmethod
+    def record_change(cls, journal: dict, model, pk, action, changes=None) -> RegistryChange:
+        entity = MODEL_TO_ENTITY[model]
+        change = journal[entity, str(pk)] = RegistryChange(
+            entity=entity, object_id=str(pk), action=action, changes=changes or {}
+        )
+        return change
+
+    @classmethod
+    def upsert(cls, model: type[models.Model], objs, stats: Counter, journal: dict) -> set:
+        """
+        Creates new and updates changed records in bulk - records with the same content hash
+        as the one stored in the database are skipped. Returns the primary keys of the written
+        records.
+        """
+        existing = dict(model.objects.values_list("pk", "content_hash"))
+        to_write = [obj for obj in objs if existing.get(obj.pk) != obj.content_hash]
+        if not to_write:
+            return set()
+        fields = [
+            f for f in model._meta.concrete_fields if not f.primary_key and f.name != "content_hash"
+        ]
+        current = model.objects.in_bulk([obj.pk for obj in to_write if obj.pk in existing])
+        for obj in to_write:
+            if (old := current.get(obj.pk)) is None:
+                stats[f"created {model.__name__}"] += 1
+                cls.record_change(journal, model, obj.pk, RegistryChangeAction.CREATED)
+            elif changes := {
+                f.name: [getattr(old, f.attname), getattr(obj, f.attname)]
+                for f in fields
+                if getattr(old, f.attname) != getattr(obj, f.attname)
+            }:
+                stats[f"updated {model.__name__}"] += 1
+                cls.record_change(journal, model, obj.pk, RegistryChangeAction.UPDATED, changes)
+        model.objects.bulk_create(
+            to_write,
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=[f.name for f in fields] + ["content_hash"],
+        )
+        return {obj.pk for obj in to_write}
+
+    @classmethod
+    def sync_report_links(cls, platform_reports: dict[str, set], stats: Counter, journal: dict):
+        """
+        Links the given platforms to exactly the given reports.
+        """
+        existing = {
+            (platform_id, report_id): pk
+            for pk, platform_id, report_id in ReportToPlatform.objects.filter(
+                platform_id__in=platform_reports.keys()
+            ).values_list("pk", "platform_id", "report_id")
+        }
+        report_links = {
+            (platform_id, report_id)
+            for platform_id, report_ids in platform_reports.items()
+            for report_id in report_ids
+        }
+        added = report_links - existing.keys()
+        removed = existing.keys() - report_links
+        ReportToPlatform.objects.bulk_create(
+            ReportToPlatform(platform_id=platform_id, report_id=report_id)
+            for platform_id, report_id in added
+        )
+        ReportToPlatform.objects.filter(pk__in=[existing[link] for link in removed]).delete()
+        stats["linked Report"] = len(added)
+        stats["unlinked Report"] = len(removed)
+
+        for platform_id in {link[0] for link in added | removed}:
+            # the platform itself might not have changed, only its reports
+            change = journal.get((RegistryEntity.PLATFORM, str(platform_id))) or cls.record_change(
+                journal, Platform, platform_id, RegistryChangeAction.UPDATED
+            )
+            if change.action == RegistryChangeAction.UPDATED:
+                change.changes["reports"] = {
+                    "added": sorted(r for p, r in added if p == platform_id),
+                    "removed": sorted(r for p, r in removed if p == platform_id),
+                }
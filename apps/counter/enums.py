@@ -0,0 +1,13 @@
+from django.db import models
+
+
+class RegistryEntity(models.TextChoices):
+    PLATFORM = "platform", "Platform"
+    REPORT = "report", "Report"
+    SUSHI_SERVICE = "sushi_service", "SUSHI service"
+
+
+class RegistryChangeAction(models.TextChoices):
+    CREATED = "created", "Created"
+    UPDATED = "updated", "Updated"
+    DEPRECATED = "deprecated", "Deprecated"
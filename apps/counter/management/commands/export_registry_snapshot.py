@@ -0,0 +1,25 @@
+import logging
+from pathlib import Path
+
+from django.core.management import BaseCommand
+
+from counter.classes.registry import RegistryData
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Exports the registry data (platforms, reports and SUSHI services) into a snapshot file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("outfile", type=str)
+
+    def handle(self, *args, **options):
+        data = RegistryData.from_db()
+        with Path(options["outfile"]).open("wb") as f:
+            data.save_snapshot(f)
+        logger.info(
+            "Exported %d platforms and %d sushi services",
+            len(data.platforms),
+            len(data.sushi_services),
+        )
@@ -0,0 +1,24 @@
+import logging
+from pathlib import Path
+
+from django.core.management import BaseCommand
+
+from counter.classes.registry import RegistryData, RegistrySync
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports the registry data from a snapshot file created by `export_registry_snapshot`. "
+        "The data is applied the same way as by the registry sync."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("infile", type=str)
+
+    def handle(self, *args, **options):
+        with Path(options["infile"]).open("rb") as f:
+            data = RegistryData.load_snapshot(f)
+        stats = RegistrySync().apply(data)
+        logger.info("Summary: %s", stats)
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:28
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("counter", "0002_alter_platform_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="platform",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                help_text="Hash of the data last synced from the registry",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="report",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                help_text="Hash of the data last synced from the registry",
+                max_length=64,
+            ),
+        ),
+        migrations.AddField(
+            model_name="sushiservice",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                help_text="Hash of the data last synced from the registry",
+                max_length=64,
+            ),
+        ),
+        migrations.CreateModel(
+            name="RegistryChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "entity",
+                    models.CharField(
+                        choices=[
+                            ("platform", "Platform"),
+                            ("report", "Report"),
+                            ("sushi_service", "SUSHI service"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("object_id", models.CharField(max_length=40)),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("created", "Created"),
+                            ("updated", "Updated"),
+                            ("deprecated", "Deprecated"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                (
+                    "changes",
+                    models.JSONField(
+                        blank=True,
+                        default=dict,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                        help_text="Changed attributes with their old and new values",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created", "-pk"],
+                "indexes": [
+                    models.Index(
+                        fields=["entity", "object_id"], name="counter_reg_entity_22dcdd_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -1,11 +1,17 @@
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
+from counter.enums import RegistryChangeAction, RegistryEntity
+
 
 # Create your models here.
 class Report(models.Model):
     counter_release = models.CharField(max_length=20)
     report_id = models.CharField(max_length=20, primary_key=True)
+    content_hash = models.CharField(
+        max_length=64, blank=True, help_text="Hash of the data last synced from the registry"
+    )
 
     def __str__(self):
         return f"{self.report_id} (C{self.counter_release})"
@@ -19,6 +25,9 @@ class Platform(models.Model):
     website = models.URLField(blank=True)
     reports = models.ManyToManyField(Report, through="ReportToPlatform", related_name="platforms")
     deprecated = models.BooleanField(default=False)
+    content_hash = models.CharField(
+        max_length=64, blank=True, help_text="Hash of the data last synced from the registry"
+    )
 
     class Meta:
         ordering = ["name", "abbrev"]
@@ -60,6 +69,33 @@ class SushiService(models.Model):
         null=True, blank=True, help_text="Is requestor_id required"
     )
     deprecated = models.BooleanField(default=False)
+    content_hash = models.CharField(
+        max_length=64, blank=True, help_text="Hash of the data last synced from the registry"
+    )
 
     def __str__(self):
         return f"{self.url or ''} (C{self.counter_release})"
+
+
+class RegistryChange(models.Model):
+    """
+    Journal of changes made to the registry data by the registry sync.
+    """
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    entity = models.CharField(max_length=20, choices=RegistryEntity)
+    object_id = models.CharField(max_length=40)
+    action = models.CharField(max_length=20, choices=RegistryChangeAction)
+    changes = models.JSONField(
+        default=dict,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        help_text="Changed attributes with their old and new values",
+    )
+
+    class Meta:
+        ordering = ["-created", "-pk"]
+        indexes = [models.Index(fields=["entity", "object_id"])]
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.entity} {self.object_id}"
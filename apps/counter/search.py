@@ -0,0 +1,129 @@
+"""
+In-memory search index of registry platforms used for autocomplete. The registry contains only
+a few thousand platforms, so the whole index easily fits into memory and searching it is much
+faster than a database query. The index is rebuilt whenever the registry version changes.
+"""
+
+import difflib
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass, field
+
+from counter.cache import get_registry_version
+from counter.models import Platform
+
+SEARCHED_FIELDS = ("name", "abbrev", "content_provider_name")
+
+# scores of different types of matches, the best match of a platform is used
+SCORE_EXACT = 4
+SCORE_PREFIX = 3
+SCORE_WORD_PREFIX = 2
+SCORE_SUBSTRING = 1
+# fuzzy matches are scored by their similarity ratio (< 1), so they always come last
+FUZZY_CUTOFF = 0.75
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase text without accents and punctuation, so that "Müller's" matches "mullers".
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", "", text.lower()).split())
+
+
+@dataclass
+class IndexEntry:
+    data: dict
+    values: list[str]
+    words: set[str]
+
+
+@dataclass
+class PlatformSearchIndex:
+    version: str
+    entries: list[IndexEntry] = field(default_factory=list)
+    # all words of all entries to find fuzzy matches in
+    words: list[str] = field(default_factory=list)
+
+    @classmethod
+    def build(cls, version: str) -> "PlatformSearchIndex":
+        index = cls(version=version)
+        all_words = set()
+        for rec in Platform.objects.values("id", "deprecated", *SEARCHED_FIELDS):
+            values = [value for name in SEARCHED_FIELDS if (value := normalize(rec[name]))]
+            words = {word for value in values for word in value.split()}
+            all_words |= words
+            data = {
+                "id": str(rec["id"]),
+                "name": rec["name"],
+                "abbrev": rec["abbrev"],
+                "deprecated": rec["deprecated"],
+            }
+            index.entries.append(IndexEntry(data=data, values=values, words=words))
+        index.words = sorted(all_words)
+        return index
+
+    @classmethod
+    def score(cls, entry: IndexEntry, query: str, query_words: list[str]) -> float:
+        best = 0
+        for value in entry.values:
+            if value == query:
+                return SCORE_EXACT
+            if value.startswith(query):
+                best = max(best, SCORE_PREFIX)
+            elif query in value:
+                best = max(best, SCORE_SUBSTRING)
+        if best < SCORE_WORD_PREFIX and all(
+            any(word.startswith(query_word) for word in entry.words) for query_word in query_words
+        ):
+            best = SCORE_WORD_PREFIX
+        return best
+
+    def search(self, query: str, limit: int = 20) -> list[dict]:
+        """
+        Returns data of up to `limit` best matching platforms. Non-deprecated platforms
+        are preferred.
+        """
+        if not (query := normalize(query)):
+            return []
+        query_words = query.split()
+        scored = [
+            (score, entry)
+            for entry in self.entries
+            if (score := self.score(entry, query, query_words))
+        ]
+        if len(scored) < limit and len(query) >= 3:
+            # fill the rest with fuzzy matches of the words (typos, etc.)
+            similar = {
+                word: difflib.SequenceMatcher(None, query, word).ratio()
+                for word in difflib.get_close_matches(
+                    query, self.words, n=limit, cutoff=FUZZY_CUTOFF
+                )
+            }
+            found = {id(entry) for _, entry in scored}
+            scored.extend(
+                (max(similar[word] for word in entry.words & similar.keys()), entry)
+                for entry in self.entries
+                if id(entry) not in found and entry.words & similar.keys()
+            )
+        scored.sort(key=lambda rec: (rec[1].data["deprecated"], -rec[0], rec[1].data["name"]))
+        return [entry.data | {"score": score} for score, entry in scored[:limit]]
+
+
+_index: PlatformSearchIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> PlatformSearchIndex:
+    """
+    Returns the index for the current registry version, building it if needed.
+    """
+    global _index
+    version = get_registry_version()
+    if _index is None or _index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = PlatformSearchIndex.build(version)
+    return _index
@@ -4,6 +4,8 @@ import counter.models
 
 
 class SushiServiceSerializer(serializers.ModelSerializer):
+    # explicit field so that the registry sync does not check uniqueness record by record
+    id = serializers.UUIDField()
     deprecated = serializers.ReadOnlyField()
 
     class Meta:
@@ -21,6 +23,8 @@ class SushiServiceSerializer(serializers.ModelSerializer):
 
 
 class ReportSerializer(serializers.ModelSerializer):
+    report_id = serializers.CharField(max_length=20)
+
     class Meta:
         model = counter.models.Report
         fields = (
@@ -64,6 +68,7 @@ class PlatformCreateSerializer(serializers.ModelSerializer):
     Used for syncing data from the registry, so the structure matches the registry API
     """
 
+    id = serializers.UUIDField()
     reports = ReportSerializer(many=True, read_only=True)
     sushi_services = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
 
@@ -78,3 +83,10 @@ class PlatformCreateSerializer(serializers.ModelSerializer):
             "website",
             "sushi_services",
         )
+
+
+class RegistryChangeSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = counter.models.RegistryChange
+        fields = ("id", "created", "entity", "object_id", "action", "changes")
+        read_only_fields = fields
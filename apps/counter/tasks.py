@@ -1,12 +1,13 @@
 import celery
-from django.db import transaction
 
 from counter.classes.registry import RegistrySync
 
 
 @celery.shared_task
-@transaction.atomic
 def update_registry_models(cls=None):
+    # the data is downloaded outside of a transaction, `sync` applies it in a single one
     if cls is None:
         cls = RegistrySync()
     cls.sync()
+    # the journal grows with every sync, so it is pruned here as well
+    cls.prune_journal()
@@ -1,7 +1,11 @@
 import pytest
 from django.urls import reverse
+from freezegun import freeze_time
 
+from counter.cache import bump_registry_version
+from counter.enums import RegistryChangeAction, RegistryEntity
 from counter.fake_data import PlatformFactory, SushiServiceFactory
+from counter.models import RegistryChange
 
 
 @pytest.mark.django_db
@@ -36,6 +40,83 @@ class TestPlatformAPI:
         assert type(data["sushi_services"]) is list
         assert type(data["sushi_services"][0]) is dict
 
+    def test_platform_detail_queries(
+        self, client_authenticated_user, django_assert_max_num_queries
+    ):
+        platform = PlatformFactory()
+        SushiServiceFactory.create_batch(3, platform=platform)
+        # session + user + platform lookup + platform + reports + sushi services + savepoint
+        # and its release
+        with django_assert_max_num_queries(8):
+            res = client_authenticated_user.get(
+                reverse("platform-detail", kwargs={"pk": platform.pk})
+            )
+        assert res.status_code == 200
+        assert len(res.json()["sushi_services"]) == 3
+
+    @pytest.mark.parametrize("url_name", ["platform-list", "sushi-list"])
+    def test_list_is_cached(
+        self, client_authenticated_user, django_assert_max_num_queries, url_name
+    ):
+        SushiServiceFactory.create_batch(3)
+        res = client_authenticated_user.get(reverse(url_name))
+        assert res.status_code == 200
+        data = res.json()
+        PlatformFactory()  # not visible until the version is bumped
+        # only session + user + savepoint and its release
+        with django_assert_max_num_queries(4):
+            res = client_authenticated_user.get(reverse(url_name))
+        assert res.json() == data
+
+        bump_registry_version()
+        res = client_authenticated_user.get(reverse(url_name))
+        assert res.status_code == 200
+        if url_name == "platform-list":
+            assert len(res.json()) == len(data) + 1
+
+    def test_platform_list_etag(self, client_authenticated_user):
+        PlatformFactory.create_batch(3)
+        res = client_authenticated_user.get(reverse("platform-list"))
+        etag = res["ETag"]
+        assert etag
+        res = client_authenticated_user.get(reverse("platform-list"), HTTP_IF_NONE_MATCH=etag)
+        assert res.status_code == 304
+        assert res["ETag"] == etag
+
+        bump_registry_version()
+        res = client_authenticated_user.get(reverse("platform-list"), HTTP_IF_NONE_MATCH=etag)
+        assert res.status_code == 200
+        assert res["ETag"] != etag
+        assert len(res.json()) == 3
+
+    def test_platform_detail_not_found(self, client_authenticated_user):
+        res = client_authenticated_user.get(
+            reverse("platform-detail", kwargs={"pk": "60d34416-9666-4b09-8d58-220ffc04901e"})
+        )
+        assert res.status_code == 404
+
+    @pytest.mark.parametrize("pk", ["60d34416-9666-4b09-8d58-220ffc04901e", "foo"])
+    def test_platform_detail_not_found_with_etag(self, client_authenticated_user, pk):
+        res = client_authenticated_user.get(reverse("platform-list"))
+        res = client_authenticated_user.get(
+            reverse("platform-detail", kwargs={"pk": pk}), HTTP_IF_NONE_MATCH=res["ETag"]
+        )
+        assert res.status_code == 404
+
+    def test_platform_detail_is_cached(
+        self, client_authenticated_user, django_assert_max_num_queries
+    ):
+        platform = PlatformFactory()
+        SushiServiceFactory.create_batch(3, platform=platform)
+        url = reverse("platform-detail", kwargs={"pk": platform.pk})
+        data = client_authenticated_user.get(url).json()
+        # session + user + platform lookup + savepoint and its release
+        with django_assert_max_num_queries(5):
+            res = client_authenticated_user.get(url)
+        assert res.json() == data
+        res = client_authenticated_user.get(url, HTTP_IF_NONE_MATCH=res["ETag"])
+        assert res.status_code == 304
+
     def test_platform_create(self, client_authenticated_user):
         """
         Creating of platforms through the API should not be possible.
@@ -68,3 +149,125 @@ class TestPlatformAPI:
         assert res.status_code == 405
         assert "detail" in res.json()
         assert res.json()["detail"] == 'Method "DELETE" not allowed.'
+
+
+@pytest.mark.django_db
+class TestRegistryChangeAPI:
+    def test_list(self, client_authenticated_user):
+        RegistryChange.objects.create(
+            entity=RegistryEntity.PLATFORM,
+            object_id="60d34416-9666-4b09-8d58-220ffc04901e",
+            action=RegistryChangeAction.UPDATED,
+            changes={"name": ["Old", "New"]},
+        )
+        res = client_authenticated_user.get(reverse("registry-change-list"))
+        assert res.status_code == 200
+        assert res.json()["count"] == 1
+        rec = res.json()["results"][0]
+        assert rec["entity"] == "platform"
+        assert rec["action"] == "updated"
+        assert rec["changes"] == {"name": ["Old", "New"]}
+
+    def test_list_unauthenticated(self, client_unauthenticated):
+        res = client_unauthenticated.get(reverse("registry-change-list"))
+        assert res.status_code == 403
+
+    def test_list_filters(self, client_authenticated_user):
+        with freeze_time("2025-01-01T10:00:00Z"):
+            RegistryChange.objects.create(
+                entity=RegistryEntity.REPORT, object_id="TR", action=RegistryChangeAction.CREATED
+            )
+        with freeze_time("2025-01-02T10:00:00Z"):
+            RegistryChange.objects.create(
+                entity=RegistryEntity.REPORT, object_id="DR", action=RegistryChangeAction.CREATED
+            )
+            RegistryChange.objects.create(
+                entity=RegistryEntity.PLATFORM,
+                object_id="60d34416-9666-4b09-8d58-220ffc04901e",
+                action=RegistryChangeAction.CREATED,
+            )
+        url = reverse("registry-change-list")
+        res = client_authenticated_user.get(url, {"since": "2025-01-01T12:00:00Z"})
+        assert res.json()["count"] == 2
+        res = client_authenticated_user.get(
+            url, {"since": "2025-01-01T12:00:00Z", "entity": "report"}
+        )
+        assert [rec["object_id"] for rec in res.json()["results"]] == ["DR"]
+        res = client_authenticated_user.get(url, {"object_id": "TR"})
+        assert res.json()["count"] == 1
+
+    def test_list_invalid_since(self, client_authenticated_user):
+        res = client_authenticated_user.get(reverse("registry-change-list"), {"since": "foo"})
+        assert res.status_code == 400
+
+
+@pytest.mark.django_db
+class TestPlatformSearchAPI:
+    @pytest.fixture
+    def platforms(self):
+        return {
+            "exact": PlatformFactory(name="Springer", abbrev=""),
+            "prefix": PlatformFactory(name="SpringerLink", abbrev=""),
+            "word": PlatformFactory(name="Nature Springer Journals", abbrev=""),
+            "provider": PlatformFactory(
+                name="Foo", abbrev="", content_provider_name="Société Springer"
+            ),
+            "deprecated": PlatformFactory(name="Springer Old", abbrev="", deprecated=True),
+            "other": PlatformFactory(name="Elsevier", abbrev="SD"),
+        }
+
+    def search(self, client, **params):
+        res = client.get(reverse("platform-search"), params)
+        assert res.status_code == 200
+        return res.json()
+
+    def test_search_ranking(self, client_authenticated_user, platforms):
+        data = self.search(client_authenticated_user, q="springer")
+        assert [rec["id"] for rec in data] == [
+            # "word" and "provider" have the same score, so they are ordered by name
+            str(platforms[key].pk)
+            for key in ("exact", "prefix", "provider", "word", "deprecated")
+        ]
+        assert set(data[0].keys()) == {"id", "name", "abbrev", "deprecated", "score"}
+
+    @pytest.mark.parametrize(
+        ["query", "expected"],
+        [
+            ("nature spr", ["word"]),
+            ("societe", ["provider"]),
+            ("sd", ["other"]),
+            ("elsevir", ["other"]),  # fuzzy
+            ("", []),
+            ("xyzxyz", []),
+        ],
+    )
+    def test_search(self, client_authenticated_user, platforms, query, expected):
+        data = self.search(client_authenticated_user, q=query)
+        assert [rec["id"] for rec in data] == [str(platforms[key].pk) for key in expected]
+
+    def test_search_limit(self, client_authenticated_user, platforms):
+        assert len(self.search(client_authenticated_user, q="springer", limit=2)) == 2
+        res = client_authenticated_user.get(reverse("platform-search"), {"limit": "foo"})
+        assert res.status_code == 400
+
+    @pytest.mark.parametrize("limit", [0, -1])
+    def test_search_limit_not_positive(self, client_authenticated_user, platforms, limit):
+        res = client_authenticated_user.get(
+            reverse("platform-search"), {"q": "springer", "limit": limit}
+        )
+        assert res.status_code == 400
+
+    def test_search_index_rebuilt_after_registry_change(
+        self, client_authenticated_user, platforms, django_assert_max_num_queries
+    ):
+        self.search(client_authenticated_user, q="springer")
+        PlatformFactory(name="Wiley")
+        # the index is reused - no query for platforms
+        with django_assert_max_num_queries(4):
+            assert self.search(client_authenticated_user, q="wiley") == []
+        bump_registry_version()
+        assert len(self.search(client_authenticated_user, q="wiley")) == 1
+
+    def test_search_unauthenticated(self, client_unauthenticated):
+        res = client_unauthenticated.get(reverse("platform-search"), {"q": "foo"})
+        assert res.status_code == 403
@@ -2,13 +2,20 @@
 Platform, report and SUSHI service synchronisation tests (with the COUNTER Registry).
 """
 
+import gzip
 import json
+from datetime import timedelta
 from pathlib import Path
+from unittest.mock import patch
 
 import pytest
+from django.core.management import call_command
+from django.utils.timezone import now
 
-from counter.classes.registry import RegistrySync
-from counter.models import Platform, Report, ReportToPlatform, SushiService
+from counter.cache import get_registry_version
+from counter.classes.registry import RegistryData, RegistrySync
+from counter.enums import RegistryChangeAction, RegistryEntity
+from counter.models import Platform, RegistryChange, Report, ReportToPlatform, SushiService
 from counter.serializers import PlatformSerializer, SushiServiceSerializer
 from counter.tasks import update_registry_models
 
@@ -87,3 +94,151 @@ class TestRegistry:
             ).count()
             == 1
         ), "removed sushi services should be deprecated"
+
+    def test_sync_unchanged_data_is_not_written(self, settings, django_assert_max_num_queries):
+        RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+
+        mock = RegistrySyncMock(settings.BASE_DIR, "platform1.json")
+        # the number of queries does not depend on the number of records
+        with django_assert_max_num_queries(10) as ctx:
+            stats = mock.sync()
+        assert not any(stats.values())
+        assert not [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        mock.check()
+
+    def test_sync_changed_data(self, settings):
+        RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+
+        mock = RegistrySyncMock(settings.BASE_DIR, "platform1.json")
+        mock.get_platforms()[0]["name"] = "New name"
+        stats = mock.sync()
+        assert stats["updated Platform"] == 1
+        assert "created Platform" not in stats
+        assert Platform.objects.get(pk=mock.platform_data[0]["id"]).name == "New name"
+        mock.check()
+
+    def test_get_sushi_conditional_request(self, requests_mock, settings):
+        url = "https://registry.example.com/api/v1/sushi-service/1/"
+        requests_mock.get(url, json={"id": "1"}, headers={"ETag": '"abc"'})
+        sync = RegistrySync()
+        assert sync.get_sushi(url) == {"id": "1"}
+
+        requests_mock.get(url, status_code=304)
+        assert sync.get_sushi(url) == {"id": "1"}
+        assert requests_mock.last_request.headers["If-None-Match"] == '"abc"'
+
+    def test_fetch_downloads_each_sushi_service_once(self, settings):
+        mock = RegistrySyncMock(settings.BASE_DIR, "platform1.json")
+        urls = {link["url"] for p in mock.get_platforms() for link in p.get("sushi_services", [])}
+        with patch.object(
+            RegistrySyncMock, "get_sushi", autospec=True, side_effect=RegistrySyncMock.get_sushi
+        ) as get_sushi:
+            data = mock.fetch()
+        assert set(data.sushi_services) == urls
+        assert get_sushi.call_count == len(urls)
+
+    def test_sync_change_journal(self, settings):
+        RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+        assert RegistryChange.objects.filter(action=RegistryChangeAction.UPDATED).count() == 0
+        created = RegistryChange.objects.filter(action=RegistryChangeAction.CREATED)
+        assert created.filter(entity=RegistryEntity.PLATFORM).count() == Platform.objects.count()
+        assert created.filter(entity=RegistryEntity.REPORT).count() == Report.objects.count()
+
+        # nothing changed - nothing is recorded
+        RegistryChange.objects.all().delete()
+        RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+        assert RegistryChange.objects.count() == 0
+
+        mock = RegistrySyncMock(settings.BASE_DIR, "platform1.json")
+        platform_data = mock.get_platforms()[0]
+        old_name = platform_data["name"]
+        platform_data["name"] = "New name"
+        removed_report = platform_data["reports"].pop()["report_id"]
+        mock.sync()
+        change = RegistryChange.objects.get()
+        assert change.entity == RegistryEntity.PLATFORM
+        assert change.object_id == platform_data["id"]
+        assert change.action == RegistryChangeAction.UPDATED
+        assert change.changes == {
+            "name": [old_name, "New name"],
+            "reports": {"added": [], "removed": [removed_report]},
+        }
+
+    def test_sync_change_journal_deprecated(self, settings):
+        RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+        RegistryChange.objects.all().delete()
+        RegistrySyncMock(settings.BASE_DIR, "platform2.json").sync()
+        assert RegistryChange.objects.filter(
+            entity=RegistryEntity.PLATFORM,
+            object_id="60d34416-9666-4b09-8d58-220ffc04901e",
+            action=RegistryChangeAction.DEPRECATED,
+        ).exists()
+        # the platform is "changed" when it appears in the registry again
+        RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+        assert not Platform.objects.get(id="60d34416-9666-4b09-8d58-220ffc04901e").deprecated
+
+    def test_task_prunes_change_journal(self, settings):
+        settings.REGISTRY_CHANGE_LIFETIME = 30
+        old, recent = RegistryChange.objects.bulk_create(
+            [
+                RegistryChange(
+                    entity=RegistryEntity.PLATFORM,
+                    object_id=str(i),
+                    action=RegistryChangeAction.CREATED,
+                )
+                for i in range(2)
+            ]
+        )
+        RegistryChange.objects.filter(pk=old.pk).update(created=now() - timedelta(days=31))
+        RegistryChange.objects.filter(pk=recent.pk).update(created=now() - timedelta(days=29))
+        update_registry_models(RegistrySyncMock(settings.BASE_DIR, "platform1.json"))
+        assert not RegistryChange.objects.filter(pk=old.pk).exists()
+        assert RegistryChange.objects.filter(pk=recent.pk).exists()
+        # the changes of the sync itself are kept
+        assert RegistryChange.objects.filter(action=RegistryChangeAction.CREATED).count() > 1
+
+    def test_snapshot_export_import(self, settings, tmp_path):
+        mock = RegistrySyncMock(settings.BASE_DIR, "platform1.json")
+        mock.sync()
+        path = tmp_path / "registry.json.gz"
+        call_command("export_registry_snapshot", str(path))
+
+        ReportToPlatform.objects.all().delete()
+        SushiService.objects.all().delete()
+        Platform.objects.all().delete()
+        Report.objects.all().delete()
+
+        call_command("import_registry_snapshot", str(path))
+        mock.check()
+        assert Platform.objects.count() == len(mock.platform_data)
+
+    def test_snapshot_import_is_incremental(self, settings, tmp_path):
+        RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+        path = tmp_path / "registry.json.gz"
+        with path.open("wb") as f:
+            RegistryData.from_db().save_snapshot(f)
+        RegistryChange.objects.all().delete()
+
+        with path.open("rb") as f:
+            stats = RegistrySync().apply(RegistryData.load_snapshot(f))
+        assert not any(stats.values())
+        assert RegistryChange.objects.count() == 0
+
+    def test_snapshot_unsupported_version(self, tmp_path):
+        path = tmp_path / "registry.json.gz"
+        with gzip.open(path, "wt") as f:
+            json.dump({"version": 1000, "platforms": [], "sushi_services": {}}, f)
+        with path.open("rb") as f, pytest.raises(ValueError):
+            RegistryData.load_snapshot(f)
+
+    def test_sync_bumps_registry_version(self, settings, django_capture_on_commit_callbacks):
+        version = get_registry_version()
+        with django_capture_on_commit_callbacks(execute=True):
+            RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+        new_version = get_registry_version()
+        assert new_version != version
+
+        # nothing changed, the version stays the same
+        with django_capture_on_commit_callbacks(execute=True):
+            RegistrySyncMock(settings.BASE_DIR, "platform1.json").sync()
+        assert get_registry_version() == new_version
@@ -6,5 +6,6 @@ router = SimpleRouter()
 
 router.register(r"platform", views.PlatformViewSet, basename="platform")
 router.register(r"sushi", views.SushiServiceViewSet, basename="sushi")
+router.register(r"registry-change", views.RegistryChangeViewSet, basename="registry-change")
 
 urlpatterns = router.urls
@@ -1,13 +1,71 @@
 # Create your views here.
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
 import counter.serializers
-from counter.models import Platform, SushiService
+from counter.cache import (
+    get_cached_registry_payload,
+    get_registry_version,
+    set_cached_registry_payload,
+)
+from counter.models import Platform, RegistryChange, SushiService
+from counter.search import get_search_index
 
 
-class PlatformViewSet(ReadOnlyModelViewSet):
+class CachedRegistryViewSet(ReadOnlyModelViewSet):
+    """
+    Read-only viewset for registry data which only changes when the registry is synced.
+    Serialized responses are cached by the registry version which is also used as the `ETag`,
+    so that clients may use `If-None-Match` to avoid downloading the data again.
+    """
+
+    cache_name = None
+
+    def cached_response(self, name: str, get_data) -> Response:
+        version = get_registry_version()
+        etag = f'"{version}"'
+        # browsers keep the response, but revalidate it using the ETag on each use
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in {
+            tag.strip() for tag in self.request.headers.get("If-None-Match", "").split(",")
+        }:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        data = get_cached_registry_payload(version, name)
+        if data is None:
+            data = get_data()
+            set_cached_registry_payload(version, name, data)
+        return Response(data, headers=headers)
+
+    def list(self, request, *args, **kwargs):
+        get_list = super().list
+        return self.cached_response(
+            f"{self.cache_name}_list", lambda: get_list(request, *args, **kwargs).data
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        # the object is looked up first, so that unknown ids lead to 404 and are not cached -
+        # only its pk is loaded, the related objects only when the response is not cached
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        pk = get_object_or_404(
+            self.filter_queryset(self.get_queryset()).values_list("pk", flat=True),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        get_detail = super().retrieve
+        return self.cached_response(
+            f"{self.cache_name}_{pk}", lambda: get_detail(request, *args, **kwargs).data
+        )
+
+
+class PlatformViewSet(CachedRegistryViewSet):
     permission_classes = (IsAuthenticated,)
+    cache_name = "platform"
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -16,21 +74,66 @@ class PlatformViewSet(ReadOnlyModelViewSet):
 
     def get_queryset(self):
         qs = Platform.objects.all()
-        if self.action == "detail":
+        if self.action == "retrieve":
             qs = qs.prefetch_related("reports", "sushi_services")
         return qs
 
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        """
+        Autocomplete search of platforms by name, abbreviation and content provider name
+        using the `q` query param. Returns up to `limit` best matches.
+        """
+        try:
+            limit = int(request.query_params.get("limit", 20))
+        except ValueError:
+            raise ValidationError({"limit": "Integer is expected"}) from None
+        if limit < 1:
+            raise ValidationError({"limit": "Positive integer is expected"})
+        limit = min(limit, 100)
+        return Response(get_search_index().search(request.query_params.get("q", ""), limit))
 
-class SushiServiceViewSet(ReadOnlyModelViewSet):
+
+class SushiServiceViewSet(CachedRegistryViewSet):
     permission_classes = (IsAuthenticated,)
+    cache_name = "sushi"
 
     def get_serializer_class(self):
-        if self.action == "list":
-            return counter.serializers.SushiServiceSerializer
         return counter.serializers.SushiServiceSerializer
 
     def get_queryset(self):
-        qs = SushiService.objects.all()
-        # if self.action == "detail":
-        # 	qs = qs.prefetch_related("reports", "sushi_services")
+        return SushiService.objects.all()
+
+
+class RegistryChangePagination(PageNumberPagination):
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class RegistryChangeViewSet(ReadOnlyModelViewSet):
+    """
+    Journal of changes made by the registry sync. It may be filtered using the `since`
+    (ISO datetime), `entity` and `object_id` query params.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    serializer_class = counter.serializers.RegistryChangeSerializer
+    pagination_class = RegistryChangePagination
+
+    def get_queryset(self):
+        qs = RegistryChange.objects.all()
+        params = self.request.query_params
+        if since := params.get("since"):
+            try:
+                since_dt = parse_datetime(since)
+            except ValueError:
+                since_dt = None
+            if not since_dt:
+                raise ValidationError({"since": "ISO datetime is expected"})
+            qs = qs.filter(created__gt=since_dt)
+        if entity := params.get("entity"):
+            qs = qs.filter(entity=entity)
+        if object_id := params.get("object_id"):
+            qs = qs.filter(object_id=object_id)
         return qs
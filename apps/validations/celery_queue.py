@@ -1,14 +1,114 @@
+"""
+Live state of the validation queue kept in Redis. Instead of inspecting the broker (which does
+not see tasks already reserved by the workers) and the task results in the database, the state
+is updated as the validation tasks move through the queue:
+
+* queued - the task was sent to the broker
+* reserved - a worker received the task, but has not started it yet
+* running - the validation is being processed by a validation module; one entry per module
+  with the id of the validation, the time it started and the token of the module lock
+
+Queued and reserved tasks are kept in sorted sets by their ids (scored by the time they got
+there), so that a task delivered again after a crash of its worker is not counted twice.
+Tasks which never leave a state (e.g. because they were purged from the broker) are dropped
+after `VALIDATION_QUEUE_STATE_MAX_AGE` seconds, so the state cannot drift away for good.
+
+Reading the state is therefore cheap regardless of the number of past tasks.
+"""
+
+import json
+import logging
+import time
+
+from celery.signals import after_task_publish, task_prerun, task_received
 from django.conf import settings
-from django_celery_results.models import TaskResult
-from redis import Redis
+from redis import Redis, RedisError
+
+logger = logging.getLogger(__name__)
+
+TASK_STATE_KEYS = {
+    "queued": "validation_queue_queued",
+    "reserved": "validation_queue_reserved",
+}
+RUNNING_KEY = "validation_queue_running"
+# only tasks which process validations are counted
+TRACKED_TASKS = ("validations.tasks.run_next_validation",)
+
+
+def get_state_redis() -> Redis:
+    return Redis.from_url(settings.REDIS_URL)
+
+
+def move_task(task_id: str, source: str | None, target: str | None) -> None:
+    """
+    Moves the task `task_id` from `source` to `target` state. Errors are only logged - the state
+    is informative and must never break the processing of validations.
+    """
+    try:
+        with get_state_redis().pipeline() as pipe:
+            if source:
+                pipe.zrem(TASK_STATE_KEYS[source], task_id)
+            if target:
+                pipe.zadd(TASK_STATE_KEYS[target], {task_id: time.time()})
+            pipe.execute()
+    except RedisError as e:
+        logger.warning("Could not update the validation queue state: %s", e)
+
+
+def validation_started(validation_id, vm_url: str, lock_token: str | None = None) -> None:
+    try:
+        get_state_redis().hset(
+            RUNNING_KEY,
+            vm_url,
+            json.dumps(
+                {"validation": str(validation_id), "started": time.time(), "token": lock_token}
+            ),
+        )
+    except RedisError as e:
+        logger.warning("Could not update the validation queue state: %s", e)
+
+
+def validation_finished(vm_url: str) -> None:
+    try:
+        get_state_redis().hdel(RUNNING_KEY, vm_url)
+    except RedisError as e:
+        logger.warning("Could not update the validation queue state: %s", e)
+
+
+def get_queue_state() -> dict:
+    """
+    Returns the number of queued and reserved tasks and the validation running on each
+    validation module (`None` for idle modules).
+    """
+    stale = time.time() - settings.VALIDATION_QUEUE_STATE_MAX_AGE
+    with get_state_redis().pipeline() as pipe:
+        for key in TASK_STATE_KEYS.values():
+            pipe.zremrangebyscore(key, "-inf", stale)
+            pipe.zcard(key)
+        pipe.hgetall(RUNNING_KEY)
+        _, queued, _, reserved, running = pipe.execute()
+    running = {key.decode(): json.loads(value) for key, value in running.items()}
+    return {
+        "queued": queued,
+        "reserved": reserved,
+        "running": len(running),
+        "modules": {vm_url: running.get(vm_url) for vm_url in settings.VALIDATION_MODULES_URLS},
+    }
+
+
+@after_task_publish.connect(dispatch_uid="validation_queue_published")
+def on_task_published(sender=None, headers=None, **kwargs):
+    if sender in TRACKED_TASKS and (task_id := (headers or {}).get("id")):
+        move_task(task_id, None, "queued")
 
 
-def get_validation_queue_length():
-    redis = Redis(
-        host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_CELERY_DB_NUMBER
-    )
-    return redis.llen(settings.CELERY_VALIDATION_QUEUE)
+@task_received.connect(dispatch_uid="validation_queue_received")
+def on_task_received(request=None, **kwargs):
+    if request is not None and request.name in TRACKED_TASKS:
+        move_task(request.id, "queued", "reserved")
 
 
-def get_number_of_running_validations():
-    return TaskResult.objects.filter(status="STARTED").count()
+@task_prerun.connect(dispatch_uid="validation_queue_started")
+def on_task_started(sender=None, task_id=None, **kwargs):
+    if sender is not None and sender.name in TRACKED_TASKS:
+        move_task(task_id, "reserved", None)
@@ -0,0 +1,239 @@
+"""
+Dispatching of validations to the validation modules by a single process (the
+`run_validation_dispatcher` command) instead of by the workers of the validation queue.
+
+A worker of the validation queue is blocked for the whole time the validation module works on
+a validation, so there has to be one worker per module and the workers cannot do anything else.
+The dispatcher keeps a request in flight on every free module from one asyncio event loop,
+stores the responses of the modules (see `store_module_response`) and leaves their
+processing (which is CPU bound) to the `ingest_validation_result` task in the ingestion queue.
+Waiting for the modules and ingesting the results are thus scaled independently.
+
+The requests themselves are made by `requests` in a thread pool with one thread per module -
+the event loop only coordinates them. The dispatcher is woken up when validations are enqueued
+(see `scheduling`) and checks the queue periodically as well. It renews the leases of the
+dispatched validations and the locks of the modules the same way the heartbeat of a worker
+does (see `leases`).
+"""
+
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from redis import RedisError
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import LockError
+from redis.lock import Lock
+
+from validations.celery_queue import validation_finished, validation_started
+from validations.enums import ValidationStatus
+from validations.leases import Heartbeat, renew_leases
+from validations.models import CounterAPIValidation, Validation
+from validations.module_health import record_success
+from validations.notifications import report_failure
+from validations.scheduling import DISPATCH_CHANNEL, claim_next_validation
+from validations.tasks import COUNTER_API_VALIDATION_PATH, module_failed, queue_ingestion
+from validations.validation_module_api import store_module_response
+from validations.validation_modules import (
+    create_validation_module_lock,
+    get_available_validation_module_url,
+    lock_token,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Dispatch:
+    """
+    A validation sent to a validation module.
+    """
+
+    validation: Validation
+    vm_url: str
+    lock: Lock
+    start: float = field(default_factory=time.monotonic)
+
+
+def start_dispatch() -> Dispatch | None:
+    """
+    Locks a free validation module and claims the next waiting validation for it. Returns None
+    when there is no free module or no waiting validation.
+    """
+    if not (vm_url := get_available_validation_module_url()):
+        return None
+    lock = create_validation_module_lock(vm_url)
+    if not lock.acquire(blocking=False):
+        # a worker of the validation queue took the module in the meantime
+        return None
+    try:
+        validation = claim_next_validation()
+    except Exception:
+        lock.release()
+        raise
+    if validation is None:
+        lock.release()
+        return None
+    if validation.is_counter_api_validation:
+        validation = CounterAPIValidation.objects.select_related("core").get(pk=validation.pk)
+    logger.info("Dispatching validation %s to %s", validation.pk, vm_url)
+    validation_started(validation.pk, vm_url, lock_token(lock))
+    return Dispatch(validation, vm_url, lock)
+
+
+def request_module(dispatch: Dispatch, session: requests.Session) -> str:
+    """
+    Sends the validation to the validation module and stores the response (see
+    `store_module_response`). Returns the name of the stored response. It blocks until
+    the module responds, so it is run in a thread.
+    """
+    validation, vm_url = dispatch.validation, dispatch.vm_url
+    if isinstance(validation, CounterAPIValidation):
+        response = session.post(
+            vm_url + COUNTER_API_VALIDATION_PATH, json={"url": validation.get_url()}, stream=True
+        )
+    else:
+        with validation.file.open("rb") as fp:
+            response = session.post(
+                vm_url + "file.php",
+                params={"extension": os.path.splitext(validation.filename)[1].lstrip(".")},
+                data=fp,
+                stream=True,
+            )
+    with response:
+        response.raise_for_status()
+        return store_module_response(validation, response)
+
+
+def hand_over(dispatch: Dispatch, result_name: str) -> None:
+    record_success(dispatch.vm_url)
+    queue_ingestion(dispatch.validation, result_name, time.monotonic() - dispatch.start)
+
+
+def dispatch_failed(dispatch: Dispatch, exc: Exception) -> None:
+    obj = dispatch.validation
+    if module_failed(obj, dispatch.vm_url, exc):
+        return
+    logger.warning("Validation %s failed: %s", obj.pk, exc)
+    obj.core.status = ValidationStatus.FAILURE
+    obj.core.error_message = str(exc)
+    obj.core.duration = time.monotonic() - dispatch.start
+    obj.core.save(update_fields=["status", "error_message", "duration"])
+    report_failure(
+        "Validation failed",
+        f"Validation {obj.id} failed: {obj.core.error_message}",
+    )
+
+
+def end_dispatch(dispatch: Dispatch) -> None:
+    validation_finished(dispatch.vm_url)
+    try:
+        dispatch.lock.release()
+    except LockError as e:
+        logger.warning("Could not release lock %s: %s", dispatch.lock.name, e)
+
+
+def renew_dispatches(dispatches: list[Dispatch]) -> None:
+    try:
+        renew_leases([dispatch.validation.core_id for dispatch in dispatches])
+    except Exception as e:
+        logger.warning("Could not renew leases of dispatched validations: %s", e)
+    for dispatch in dispatches:
+        try:
+            dispatch.lock.reacquire()
+        except Exception as e:
+            logger.warning("Could not extend lock %s: %s", dispatch.lock.name, e)
+
+
+class Dispatcher:
+    def __init__(self):
+        # dispatches in flight by the url of the module
+        self.dispatches: dict[str, Dispatch] = {}
+        self.tasks: set[asyncio.Task] = set()
+        self.wakeup = asyncio.Event()
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(
+            max_workers=len(settings.VALIDATION_MODULES_URLS) or 1,
+            thread_name_prefix="validation-dispatch",
+        )
+
+    async def run(self):
+        background = [asyncio.create_task(self.listen()), asyncio.create_task(self.heartbeat())]
+        try:
+            while True:
+                self.wakeup.clear()
+                # the database is used from one thread which lives as long as the dispatcher
+                await sync_to_async(close_old_connections)()
+                await self.dispatch_waiting()
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(
+                        self.wakeup.wait(), settings.VALIDATION_DISPATCHER_POLL_INTERVAL
+                    )
+        finally:
+            for task in background:
+                task.cancel()
+            # validations still in flight are recovered when their leases expire
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.session.close()
+
+    async def dispatch_waiting(self) -> list[asyncio.Task]:
+        """
+        Sends waiting validations to all the free modules. Returns the tasks processing them.
+        """
+        started = []
+        while dispatch := await sync_to_async(start_dispatch)():
+            self.dispatches[dispatch.vm_url] = dispatch
+            task = asyncio.create_task(self.process(dispatch))
+            # the event loop keeps only weak references to the tasks
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            started.append(task)
+        return started
+
+    async def process(self, dispatch: Dispatch):
+        loop = asyncio.get_running_loop()
+        try:
+            try:
+                result_name = await loop.run_in_executor(
+                    self.executor, request_module, dispatch, self.session
+                )
+            except Exception as e:
+                await sync_to_async(dispatch_failed)(dispatch, e)
+            else:
+                await sync_to_async(hand_over)(dispatch, result_name)
+            finally:
+                del self.dispatches[dispatch.vm_url]
+                await sync_to_async(end_dispatch)(dispatch)
+                # the module is free for another validation
+                self.wakeup.set()
+        except Exception:
+            # the validation is recovered when its lease expires
+            logger.exception("Dispatch of validation %s failed", dispatch.validation.pk)
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(Heartbeat.interval())
+            if self.dispatches:
+                await sync_to_async(renew_dispatches)(list(self.dispatches.values()))
+
+    async def listen(self):
+        while True:
+            try:
+                async with (
+                    AsyncRedis.from_url(settings.REDIS_URL) as redis,
+                    redis.pubsub(ignore_subscribe_messages=True) as pubsub,
+                ):
+                    await pubsub.subscribe(DISPATCH_CHANNEL)
+                    async for _ in pubsub.listen():
+                        self.wakeup.set()
+            except RedisError as e:
+                logger.warning("Cannot listen for enqueued validations: %s", e)
+                await asyncio.sleep(settings.VALIDATION_DISPATCHER_POLL_INTERVAL)
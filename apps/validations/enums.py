@@ -34,6 +34,27 @@ class ValidationStatus(models.IntegerChoices):
     FAILURE = 3
 
 
+class ValidationPriority(models.IntegerChoices):
+    """
+    Priority of a waiting validation - validations submitted interactively in the web UI
+    go first, large batches last.
+    """
+
+    BULK = 0
+    API = 10
+    INTERACTIVE = 20
+
+
+class CircuitState(models.TextChoices):
+    """
+    State of the circuit breaker of a validation module (see `module_health`).
+    """
+
+    CLOSED = "closed", "Closed"
+    OPEN = "open", "Open"
+    HALF_OPEN = "half_open", "Half-open"
+
+
 class MessageKeys(Enum):
     level = "l"
 
@@ -0,0 +1,84 @@
+"""
+Estimation of the duration of validations. The time a validation module needs depends mostly
+on the format and size of the file, so a linear regression of the duration on the file size is
+fitted for each format from recently finished validations. The size of a COUNTER API report is
+not known before it is downloaded, so the mean duration is used for COUNTER API validations.
+
+The model is refreshed periodically and kept in the cache, so that estimating is cheap.
+"""
+
+import statistics
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.core.cache import cache
+
+from validations.enums import ValidationStatus
+from validations.models import ValidationCore
+
+COUNTER_API_FORMAT = "counter_api"
+# number of recently finished validations the model is fitted on
+DURATION_SAMPLE_SIZE = 5000
+# with less samples of a format, its mean duration is used instead of the regression
+MIN_REGRESSION_SAMPLES = 5
+DURATION_MODEL_CACHE_KEY = "validation_duration_model"
+# the model is refreshed more often (see `refresh_duration_model` task), this is a safety net
+DURATION_MODEL_CACHE_TIMEOUT = 3600
+
+
+@dataclass
+class DurationModel:
+    # intercept and slope (seconds per byte) of the duration for each format
+    coefficients: dict[str, tuple[float, float]] = field(default_factory=dict)
+    # mean duration of all validations - used for formats without any samples
+    default: float | None = None
+
+    @classmethod
+    def build(cls) -> "DurationModel":
+        samples = defaultdict(list)
+        for file_format, file_size, duration in (
+            ValidationCore.objects.filter(status=ValidationStatus.SUCCESS, duration__gt=0)
+            .order_by("-created")
+            .values_list("file_format", "file_size", "duration")[:DURATION_SAMPLE_SIZE]
+        ):
+            samples[file_format or COUNTER_API_FORMAT].append((file_size, duration))
+        model = cls()
+        if durations := [duration for recs in samples.values() for _, duration in recs]:
+            model.default = statistics.fmean(durations)
+        for file_format, recs in samples.items():
+            model.coefficients[file_format] = cls.fit(
+                recs, regression=file_format != COUNTER_API_FORMAT
+            )
+        return model
+
+    @classmethod
+    def fit(cls, samples: list[tuple[int, float]], regression: bool) -> tuple[float, float]:
+        sizes, durations = zip(*samples, strict=True)
+        if regression and len(samples) >= MIN_REGRESSION_SAMPLES and len(set(sizes)) > 1:
+            slope, intercept = statistics.linear_regression(sizes, durations)
+            # bigger files never take less time - the data is too noisy in such case
+            if slope >= 0:
+                return intercept, slope
+        return statistics.fmean(durations), 0.0
+
+    def predict(self, file_format: str, file_size: int) -> float | None:
+        """
+        Estimated duration in seconds of a validation of a file with the given format and size
+        (empty format for COUNTER API validations). None when there is no data to estimate from.
+        """
+        if (coefficients := self.coefficients.get(file_format or COUNTER_API_FORMAT)) is None:
+            return self.default
+        intercept, slope = coefficients
+        return max(intercept + slope * file_size, 0.0)
+
+
+def update_duration_model() -> DurationModel:
+    model = DurationModel.build()
+    cache.set(DURATION_MODEL_CACHE_KEY, model, DURATION_MODEL_CACHE_TIMEOUT)
+    return model
+
+
+def get_duration_model() -> DurationModel:
+    if (model := cache.get(DURATION_MODEL_CACHE_KEY)) is None:
+        model = update_duration_model()
+    return model
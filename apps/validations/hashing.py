@@ -1,5 +1,6 @@
 import hashlib
 import json
+import os
 from typing import IO
 
 from django.conf import settings
@@ -20,17 +21,34 @@ def checksum_fileobj(fileobj: IO) -> (str, int):
     """
     orig_pos = fileobj.tell()
     fileobj.seek(0)
-    hasher = create_hasher()
-    size = 0
-    while chunk := fileobj.read(1024 * 1024):
-        if isinstance(chunk, str):
-            chunk = chunk.encode("utf-8")
-        hasher.update(chunk)
-        size += len(chunk)
+    try:
+        # reads binary files into a reusable buffer (or uses the buffer of BytesIO directly)
+        hasher = hashlib.file_digest(fileobj, create_hasher)
+        size = fileobj.seek(0, os.SEEK_END)
+    except ValueError:
+        # text files
+        fileobj.seek(0)
+        hasher = create_hasher()
+        size = 0
+        while chunk := fileobj.read(1024 * 1024):
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            hasher.update(chunk)
+            size += len(chunk)
     fileobj.seek(orig_pos)
     return hasher.hexdigest(), size
 
 
+def checksum_uploaded_file(file: IO) -> (str, int):
+    """
+    Returns the checksum and size of an uploaded file. The checksum is usually computed already
+    by the upload handlers while the file is being received (see `upload_handlers`).
+    """
+    if checksum := getattr(file, "checksum", None):
+        return checksum, file.size
+    return checksum_fileobj(file)
+
+
 def checksum_string(string: str) -> str:
     """
     Calculate the checksum of a string.
@@ -0,0 +1,145 @@
+"""
+Leases of running validations. A worker which claims a validation gets a lease on it for
+`VALIDATION_LEASE_TIMEOUT` seconds and renews it from a background thread (the heartbeat) for
+as long as it processes the validation. The heartbeat also extends the lock of the validation
+module used by the validation, so the lock is held only while the worker is alive.
+
+When a worker dies, its leases expire and the reaper (`reap_expired_leases` task) returns
+the validations to the queue or marks them as failed, and frees the validation modules they
+were using.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from redis.lock import Lock
+
+from validations.celery_queue import get_queue_state, validation_finished
+from validations.enums import ValidationStatus
+from validations.models import ValidationCore
+from validations.validation_modules import release_validation_module_lock
+
+logger = logging.getLogger(__name__)
+
+
+def lease_expiration():
+    return now() + timedelta(seconds=settings.VALIDATION_LEASE_TIMEOUT)
+
+
+def renew_lease(core_id) -> bool:
+    return bool(renew_leases([core_id]))
+
+
+def renew_leases(core_ids) -> int:
+    return ValidationCore.objects.filter(pk__in=core_ids, status=ValidationStatus.RUNNING).update(
+        lease_expires=lease_expiration()
+    )
+
+
+class Heartbeat:
+    """
+    Context manager renewing the lease of a running validation (and extending the lock of
+    the validation module in `lock`, if any) from a background thread.
+    """
+
+    def __init__(self, core_id):
+        self.core_id = core_id
+        self.lock: Lock | None = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stopped.set()
+        self.thread.join()
+
+    @classmethod
+    def interval(cls) -> float:
+        # several beats fit into the lease, so that one delayed beat does not lose it
+        return min(settings.VALIDATION_LEASE_TIMEOUT, settings.VALIDATION_MODULE_LOCK_TIMEOUT) / 3
+
+    def run(self):
+        try:
+            while not self.stopped.wait(self.interval()):
+                self.beat()
+        finally:
+            # the thread has its own database connection
+            connection.close()
+
+    def beat(self):
+        close_old_connections()
+        try:
+            renew_lease(self.core_id)
+        except Exception as e:
+            logger.warning("Could not renew lease of validation %s: %s", self.core_id, e)
+        if (lock := self.lock) is not None:
+            try:
+                lock.reacquire()
+            except Exception as e:
+                logger.warning("Could not extend lock %s: %s", lock.name, e)
+
+
+def release_validation_module(validation_id) -> None:
+    """
+    Frees the validation module used by the validation - if it still uses one. The lock of
+    the module is released only with the token the validation acquired it with, so a lock
+    which was taken over by another validation in the meantime is kept.
+    """
+    for vm_url, rec in get_queue_state()["modules"].items():
+        if rec and rec["validation"] == str(validation_id):
+            validation_finished(vm_url)
+            if rec.get("token"):
+                release_validation_module_lock(vm_url, rec["token"])
+
+
+def expired_leases():
+    # validations started before the leases were introduced do not have any
+    threshold = now() - timedelta(seconds=settings.VALIDATION_LEASE_TIMEOUT)
+    return ValidationCore.objects.filter(
+        Q(lease_expires__lt=now()) | Q(lease_expires__isnull=True, last_updated__lt=threshold),
+        status=ValidationStatus.RUNNING,
+    )
+
+
+def reap_validation(core: ValidationCore) -> bool:
+    """
+    Returns a validation whose lease expired back to the queue, or marks it as failed if
+    it was returned too many times already. Returns True if it was returned to the queue.
+    """
+    if hasattr(core, "validation"):
+        release_validation_module(core.validation.pk)
+    if core.retries < settings.VALIDATION_MAX_RETRIES and hasattr(core, "validation"):
+        core.status = ValidationStatus.WAITING
+        core.retries += 1
+        core.save(update_fields=["status", "retries", "last_updated"])
+        return True
+    core.status = ValidationStatus.FAILURE
+    core.error_message = "Processing of the validation was interrupted"
+    core.save(update_fields=["status", "error_message", "last_updated"])
+    return False
+
+
+def recover_expired_leases() -> list[ValidationCore]:
+    """
+    Recovers all the validations with expired leases. Returns those which were returned to
+    the queue.
+    """
+    requeued = []
+    with transaction.atomic():
+        for core in (
+            expired_leases()
+            .select_related("validation")
+            .select_for_update(skip_locked=True, of=("self",))
+        ):
+            logger.warning("Lease of validation %s expired", core.pk)
+            if reap_validation(core):
+                requeued.append(core)
+    return requeued
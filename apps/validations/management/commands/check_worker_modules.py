@@ -2,10 +2,10 @@ import logging
 import sys
 from collections import Counter
 
-import requests
-from django.conf import settings
 from django.core.management import BaseCommand
 
+from validations.module_health import probe_modules
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,17 +14,15 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         stats = Counter()
-        for worker_url in settings.VALIDATION_MODULES_URLS:
-            logger.info(f"Worker URL: {worker_url}")
-            try:
-                response = requests.get(worker_url)
-                response.raise_for_status()
-            except requests.RequestException as e:
-                logger.error(f"  Error connecting to worker: {e}")
-                stats["error"] += 1
-            else:
-                logger.info("  Worker is running")
-                logger.info("  Data: %s", response.json())
+        # the modules are checked concurrently and the results are recorded as their health
+        for result in probe_modules():
+            logger.info(f"Worker URL: {result['url']}")
+            if result["ok"]:
+                logger.info("  Worker is running (%.3f s)", result["latency"])
+                logger.info("  Data: %s", result["data"])
                 stats["ok"] += 1
+            else:
+                logger.error(f"  Error connecting to worker: {result['error']}")
+                stats["error"] += 1
         logger.info("Summary: %s", stats)
         sys.exit(stats["error"] and 1)
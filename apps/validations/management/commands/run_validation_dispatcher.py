@@ -0,0 +1,22 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from validations.dispatcher import Dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Sends waiting validations to the validation modules (see `validations.dispatcher`)"
+
+    def handle(self, *args, **options):
+        if not settings.VALIDATION_DISPATCHER:
+            logger.warning(
+                "VALIDATION_DISPATCHER is not set - validations are processed by the celery "
+                "workers of the validation queue as well"
+            )
+        logger.info("Dispatching validations to %s", ", ".join(settings.VALIDATION_MODULES_URLS))
+        asyncio.run(Dispatcher().run())
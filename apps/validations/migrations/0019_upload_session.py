@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:37
+
+import django.db.models.deletion
+import uuid6
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0018_alter_validationcore_report_code"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UploadSession",
+            fields=[
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("last_updated", models.DateTimeField(auto_now=True)),
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid6.uuid7, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                ("filename", models.CharField(help_text="Original filename", max_length=256)),
+                (
+                    "size",
+                    models.PositiveBigIntegerField(help_text="Total size of the uploaded file"),
+                ),
+                (
+                    "received",
+                    models.PositiveBigIntegerField(default=0, help_text="Number of received bytes"),
+                ),
+                ("user_note", models.TextField(blank=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="upload_sessions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "validation",
+                    models.OneToOneField(
+                        blank=True,
+                        help_text="Validation created from the uploaded file",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="validations.validation",
+                    ),
+                ),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:41
+
+from django.db import migrations, models
+
+import validations.models
+import validations.storage
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0019_upload_session"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="validation",
+            name="file",
+            field=models.FileField(
+                null=True,
+                storage=validations.storage.validation_file_storage,
+                upload_to=validations.models.validation_upload_to,
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:45
+
+import django.db.models.deletion
+import uuid6
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0020_validation_file_storage"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ValidationBatch",
+            fields=[
+                ("created", models.DateTimeField(auto_now_add=True)),
+                ("last_updated", models.DateTimeField(auto_now=True)),
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid6.uuid7, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="validation_batches",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["pk"],
+            },
+        ),
+        migrations.AddField(
+            model_name="validation",
+            name="batch",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Batch in which the validation was submitted",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="validations",
+                to="validations.validationbatch",
+            ),
+        ),
+    ]
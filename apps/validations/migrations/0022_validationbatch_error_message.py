@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0021_validation_batch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="validationbatch",
+            name="error_message",
+            field=models.TextField(
+                blank=True,
+                help_text="Error preventing some validations of the batch from being created",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0022_validationbatch_error_message"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="validationcore",
+            name="priority",
+            field=models.SmallIntegerField(
+                choices=[(0, "Bulk"), (10, "Api"), (20, "Interactive")],
+                default=20,
+                help_text="Priority of the validation while it is waiting to be processed",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="validationcore",
+            index=models.Index(
+                condition=models.Q(("status", 0)),
+                fields=["priority", "created"],
+                name="validationcore_waiting_idx",
+            ),
+        ),
+    ]
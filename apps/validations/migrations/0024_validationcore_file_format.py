@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:59
+
+import os
+
+from django.db import migrations, models
+
+
+def fill_file_format(apps, schema_editor):
+    Validation = apps.get_model("validations", "Validation")
+    ValidationCore = apps.get_model("validations", "ValidationCore")
+    cores = []
+    for core_id, filename in Validation.objects.filter(
+        core__sushi_credentials_checksum=""
+    ).values_list("core_id", "filename"):
+        file_format = os.path.splitext(filename)[1].lstrip(".").lower()[:16]
+        cores.append(ValidationCore(pk=core_id, file_format=file_format))
+    ValidationCore.objects.bulk_update(cores, ["file_format"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0023_validation_priority"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="validationcore",
+            name="file_format",
+            field=models.CharField(
+                blank=True,
+                help_text="Extension of the validated file, empty for COUNTER API validations",
+                max_length=16,
+            ),
+        ),
+        migrations.RunPython(fill_file_format, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0024_validationcore_file_format"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="validationcore",
+            name="retries",
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text="Number of times the validation was returned to the queue after a failure",
+            ),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0025_validationcore_retries"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="validationcore",
+            name="lease_expires",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Time until which the worker processing the validation is known to be alive",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="validationcore",
+            index=models.Index(
+                condition=models.Q(("status", 1)),
+                fields=["lease_expires"],
+                name="validationcore_running_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0026_validationcore_lease_expires"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="validationcore",
+            name="retry_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Time before which a validation returned to the queue is not processed again",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-19 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("validations", "0027_validationcore_retry_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="validationbatch",
+            name="sweep",
+            field=models.BooleanField(
+                default=False,
+                help_text="The batch validates all the reports listed by its validation of `/reports`",
+            ),
+        ),
+    ]
@@ -1,22 +1,33 @@
+import hashlib
 import os
 import string
+from collections import OrderedDict
 from datetime import timedelta
+from pathlib import Path
 from typing import IO
 from urllib.parse import urlencode, urljoin
-from uuid import uuid4
+from uuid import UUID, uuid4
 
 from core.mixins import CreatedUpdatedMixin, UUIDPkMixin
 from core.models import User
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Case, F, Q, Value, When
+from django.urls import reverse
 from django.utils.crypto import get_random_string
 from django.utils.timezone import now
 from rest_framework_api_key.models import APIKey
 from tailslide import Median
 
-from validations.enums import SeverityLevel, ValidationStatus
-from validations.hashing import checksum_dict, checksum_fileobj, checksum_string
+from validations.enums import SeverityLevel, ValidationPriority, ValidationStatus
+from validations.hashing import (
+    checksum_dict,
+    checksum_string,
+    checksum_uploaded_file,
+    create_hasher,
+)
+from validations.status_channel import publish_status
+from validations.storage import is_compressed, validation_file_storage
 
 
 # Create your models here.
@@ -27,7 +38,14 @@ def validation_upload_to(instance: "Validation", filename):
     return f"file_validations/{ts}-{random_suffix}{ext}"
 
 
+def file_format(filename: str) -> str:
+    return os.path.splitext(filename)[1].lstrip(".").lower()[:16]
+
+
 class ValidationCoreQuerySet(models.QuerySet):
+    def current(self):
+        return self.filter(Q(expiration_date__isnull=True) | Q(expiration_date__gte=now()))
+
     def annotate_source(self):
         return self.annotate(
             source=Case(
@@ -69,6 +87,11 @@ class ValidationCore(UUIDPkMixin, CreatedUpdatedMixin, models.Model):
         help_text="Code of the report as reported by the validation module",
     )
     status = models.SmallIntegerField(choices=ValidationStatus, default=ValidationStatus.WAITING)
+    priority = models.SmallIntegerField(
+        choices=ValidationPriority,
+        default=ValidationPriority.INTERACTIVE,
+        help_text="Priority of the validation while it is waiting to be processed",
+    )
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
     )
@@ -86,6 +109,11 @@ class ValidationCore(UUIDPkMixin, CreatedUpdatedMixin, models.Model):
     file_size = models.PositiveBigIntegerField(
         help_text="Size of the validated file in bytes", default=0
     )
+    file_format = models.CharField(
+        max_length=16,
+        blank=True,
+        help_text="Extension of the validated file, empty for COUNTER API validations",
+    )
     used_memory = models.PositiveBigIntegerField(
         help_text="Memory in bytes used by the validation module", default=0
     )
@@ -101,20 +129,69 @@ class ValidationCore(UUIDPkMixin, CreatedUpdatedMixin, models.Model):
         max_length=2 * settings.HASHING_DIGEST_SIZE, blank=True
     )
     error_message = models.TextField(blank=True)
+    retries = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Number of times the validation was returned to the queue after a failure",
+    )
+    lease_expires = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Time until which the worker processing the validation is known to be alive",
+    )
+    retry_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Time before which a validation returned to the queue is not processed again",
+    )
 
     objects = ValidationCoreQuerySet.as_manager()
 
     class Meta:
         ordering = ["pk"]
+        indexes = [
+            # used to pick the next validation to process
+            models.Index(
+                fields=["priority", "created"],
+                condition=Q(status=ValidationStatus.WAITING),
+                name="validationcore_waiting_idx",
+            ),
+            # used to find running validations whose worker died
+            models.Index(
+                fields=["lease_expires"],
+                condition=Q(status=ValidationStatus.RUNNING),
+                name="validationcore_running_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.pk}: {self.created} - {self.get_status_display()}"
 
     def save(self, *args, **kwargs):
+        self.prepare_for_save()
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "status" in update_fields:
+            # let clients waiting for the result know about the (potential) change of status
+            pk, status = self.pk, self.status
+            transaction.on_commit(lambda: publish_status(pk, status))
+
+    def prepare_for_save(self):
+        """
+        Fills in the derived values - it is also used when cores are created in bulk.
+        """
         if not self.expiration_date and settings.VALIDATION_LIFETIME:
             self.expiration_date = now() + timedelta(days=settings.VALIDATION_LIFETIME)
         self.error_message = self.error_message[: self.MAX_ERROR_MESSAGE_LENGTH]
-        super().save(*args, **kwargs)
+
+    @classmethod
+    def submission_priority(
+        cls, api_key: APIKey | None = None, batch: "ValidationBatch | None" = None
+    ) -> ValidationPriority:
+        if batch:
+            return ValidationPriority.BULK
+        if api_key:
+            return ValidationPriority.API
+        return ValidationPriority.INTERACTIVE
 
     @classmethod
     def get_stats(cls, user: User | None = None) -> dict:
@@ -230,8 +307,56 @@ class ValidationQuerySet(models.QuerySet):
         )
 
 
+class ValidationBatch(UUIDPkMixin, CreatedUpdatedMixin, models.Model):
+    """
+    A group of validations submitted together in one request.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="validation_batches")
+    error_message = models.TextField(
+        blank=True, help_text="Error preventing some validations of the batch from being created"
+    )
+    sweep = models.BooleanField(
+        default=False,
+        help_text="The batch validates all the reports listed by its validation of `/reports`",
+    )
+
+    class Meta:
+        ordering = ["pk"]
+
+    def __str__(self):
+        return f"{self.pk}: {self.created}"
+
+    def get_validation_result(self) -> SeverityLevel:
+        """
+        The worst result of all the validations in the batch.
+        """
+        result = ValidationCore.objects.filter(validation__batch=self).aggregate(
+            result=models.Max("validation_result")
+        )["result"]
+        return SeverityLevel(result or SeverityLevel.UNKNOWN)
+
+    def get_status_counts(self) -> dict[ValidationStatus, int]:
+        counts = dict.fromkeys(ValidationStatus, 0)
+        counts.update(
+            ValidationCore.objects.filter(validation__batch=self)
+            .values_list("status")
+            .annotate(count=models.Count("pk"))
+            .order_by()
+        )
+        return counts
+
+
 class Validation(UUIDPkMixin, models.Model):
     core = models.OneToOneField(ValidationCore, on_delete=models.CASCADE)
+    batch = models.ForeignKey(
+        ValidationBatch,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="validations",
+        help_text="Batch in which the validation was submitted",
+    )
 
     task_id = models.CharField(
         max_length=getattr(settings, "DJANGO_CELERY_RESULTS_TASK_ID_MAX_LENGTH", 255),
@@ -241,7 +366,9 @@ class Validation(UUIDPkMixin, models.Model):
     )
 
     filename = models.CharField(max_length=256, blank=True, help_text="Original filename")
-    file = models.FileField(upload_to=validation_upload_to, null=True)
+    file = models.FileField(
+        upload_to=validation_upload_to, storage=validation_file_storage, null=True
+    )
     result_data = models.JSONField(null=True)
     user_note = models.TextField(blank=True)
     public_id = models.UUIDField(null=True, blank=True, unique=True)
@@ -277,26 +404,63 @@ class Validation(UUIDPkMixin, models.Model):
         user_note: str = "",
         api_key: APIKey | None = None,
     ) -> "Validation":
-        file_checksum, file_size = checksum_fileobj(file)
+        validation = cls.build_from_file(user, file, user_note=user_note, api_key=api_key)
+        validation.core.save()
+        validation.save()
+        return validation
+
+    @classmethod
+    def build_from_file(
+        cls,
+        user: User,
+        file: IO,
+        user_note: str = "",
+        api_key: APIKey | None = None,
+        batch: "ValidationBatch | None" = None,
+    ) -> "Validation":
+        """
+        Returns a new unsaved validation (and its core) of the uploaded file.
+        """
+        file_checksum, file_size = checksum_uploaded_file(file)
         api_key_prefix = api_key.prefix if api_key else ""
-        core = ValidationCore.objects.create(
+        core = ValidationCore(
             status=ValidationStatus.WAITING,
+            priority=ValidationCore.submission_priority(api_key=api_key, batch=batch),
             file_size=file_size,
             file_checksum=file_checksum,
+            file_format=file_format(file.name),
             user=user,
             user_email_checksum=checksum_string(user.email),
             api_key_prefix=api_key_prefix,
         )
-        validation = cls.objects.create(
-            core=core,
-            filename=file.name,
-            file=file,
-            user_note=user_note,
-        )
-        return validation
+        return cls(core=core, filename=file.name, file=file, user_note=user_note, batch=batch)
 
-    def file_url(self):
+    @classmethod
+    def bulk_create_with_cores(cls, validations: list["Validation"]) -> list["Validation"]:
+        """
+        Creates new validations together with their cores in bulk. COUNTER API validations
+        cannot be inserted in bulk as they use multi-table inheritance, so they are saved one
+        by one - but without the overridden `save` methods, which would save the core again.
+        """
+        for validation in validations:
+            validation.core.prepare_for_save()
+            validation.core.validation_result = validation.extract_validation_result()
+        ValidationCore.objects.bulk_create([validation.core for validation in validations])
+        Validation.objects.bulk_create([v for v in validations if type(v) is Validation])
+        for validation in validations:
+            if type(validation) is not Validation:
+                models.Model.save(validation)
+        return validations
+
+    def file_url(self, public: bool = False):
+        """
+        URL of the file. With `public`, the public id is used, so that the file can be
+        downloaded by everyone who can view the public validation.
+        """
         if self.file:
+            if is_compressed(self.file.name):
+                # the stored data is decompressed by the API
+                return reverse("validation-download", args=[self.public_id if public else self.pk])
             return self.file.url
         return None
 
@@ -409,6 +573,42 @@ class CounterAPIValidation(Validation):
         self.core.save()
         super().save(*args, **kwargs)
 
+    @property
+    def is_sweep_report_list(self) -> bool:
+        """
+        The validation of `/reports` in a sweep, which lists the reports to validate.
+        """
+        return self.core.api_endpoint == "/reports" and bool(self.batch_id) and self.batch.sweep
+
+    def build_report_validation(self, report_code: str) -> "CounterAPIValidation":
+        """
+        Returns a new unsaved validation (and its core) of the report `report_code` with the
+        same server, credentials and attributes as this validation.
+        """
+        core = ValidationCore(
+            status=ValidationStatus.WAITING,
+            priority=self.core.priority,
+            user=self.core.user,
+            user_email_checksum=self.core.user_email_checksum,
+            api_key_prefix=self.core.api_key_prefix,
+            api_endpoint="/reports/[id]",
+            cop_version=self.requested_cop_version,
+            sushi_credentials_checksum=self.core.sushi_credentials_checksum,
+        )
+        return CounterAPIValidation(
+            core=core,
+            batch=self.batch,
+            url=self.url,
+            credentials=self.credentials,
+            requested_cop_version=self.requested_cop_version,
+            requested_report_code=report_code,
+            requested_begin_date=self.requested_begin_date,
+            requested_end_date=self.requested_end_date,
+            use_short_dates=self.use_short_dates,
+            requested_extra_attributes=self.requested_extra_attributes,
+            user_note=self.user_note,
+        )
+
     def _format_date(self, dt):
         if isinstance(dt, str):
             return dt[:7] if self.use_short_dates else dt
@@ -476,3 +676,94 @@ class ValidationMessage(UUIDPkMixin, models.Model):
                 attr = attr["attr"]
             kwargs[attr] = value or ""  # None is not allowed
         return cls(validation=validation, number=number, **kwargs)
+
+
+# checksums (see `hashing`) of the data of chunked uploads received by this process, so that
+# the data does not have to be read again when the upload is finalized - by the id of the
+# session with the number of bytes they cover; the state of the hashers cannot be stored,
+# so when the chunks of a session are received by different processes, it is not used
+UPLOAD_HASHERS_MAX_SIZE = 100
+upload_hashers: OrderedDict[UUID, tuple[int, "hashlib._Hash"]] = OrderedDict()
+
+
+class UploadSession(UUIDPkMixin, CreatedUpdatedMixin, models.Model):
+    """
+    Chunked (and resumable) upload of a file which becomes a file validation once all the data
+    is received. The received data is stored in a file in `UPLOAD_SESSION_DIR`, which must be
+    shared by all the hosts serving the API.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="upload_sessions")
+    filename = models.CharField(max_length=256, help_text="Original filename")
+    size = models.PositiveBigIntegerField(help_text="Total size of the uploaded file")
+    received = models.PositiveBigIntegerField(default=0, help_text="Number of received bytes")
+    user_note = models.TextField(blank=True)
+    validation = models.OneToOneField(
+        Validation,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        help_text="Validation created from the uploaded file",
+    )
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def data_path(self) -> Path:
+        return Path(settings.UPLOAD_SESSION_DIR) / f"{self.pk}.part"
+
+    def append_chunk(self, stream: IO[bytes], length: int, checksum: str = "") -> None:
+        """
+        Writes `length` bytes from `stream` after the already received data. When `checksum`
+        (SHA-256 hex digest) is given, it is checked against the received chunk. Raises
+        ValueError when the chunk is incomplete or does not match the checksum.
+        """
+        self.data_path.parent.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        file_hasher = self.pop_file_hasher()
+        written = 0
+        with self.data_path.open("r+b" if self.data_path.exists() else "wb") as f:
+            # data left after a failed request is overwritten
+            f.seek(self.received)
+            f.truncate()
+            while written < length and (chunk := stream.read(min(1024 * 1024, length - written))):
+                hasher.update(chunk)
+                if file_hasher:
+                    file_hasher.update(chunk)
+                f.write(chunk)
+                written += len(chunk)
+        if written != length:
+            raise ValueError(f"Incomplete chunk: {written} of {length} bytes received")
+        if checksum and checksum.lower() != hasher.hexdigest():
+            raise ValueError("Chunk checksum does not match")
+        self.received += length
+        if file_hasher:
+            upload_hashers[self.pk] = (self.received, file_hasher)
+            while len(upload_hashers) > UPLOAD_HASHERS_MAX_SIZE:
+                upload_hashers.popitem(last=False)
+
+    def pop_file_hasher(self):
+        """
+        Returns the hasher of the data received so far if it was received by this process.
+        Compressed files are checksummed after they are decompressed, so they are not hashed.
+        """
+        offset, hasher = upload_hashers.pop(self.pk, (None, None))
+        if is_compressed(self.filename):
+            return None
+        if offset == self.received:
+            return hasher
+        return create_hasher() if self.received == 0 else None
+
+    def file_checksum(self) -> str | None:
+        """
+        Checksum of the whole uploaded file if all of it was hashed when it was received.
+        """
+        offset, hasher = upload_hashers.get(self.pk, (None, None))
+        if hasher and offset == self.received == self.size:
+            return hasher.hexdigest()
+        return None
+
+    def delete_data(self) -> None:
+        upload_hashers.pop(self.pk, None)
+        self.data_path.unlink(missing_ok=True)
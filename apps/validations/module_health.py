@@ -0,0 +1,166 @@
+"""
+Health of the validation modules. Each module has a circuit breaker whose state is kept in
+Redis, so that it is shared by all the workers:
+
+* closed - the module works and validations are sent to it
+* open - the module failed several times in a row and no validations are sent to it
+* half-open - some time passed since the circuit was opened, so one validation may try
+  the module again; its success closes the circuit, its failure opens it again
+
+Failures are reported both by the validation tasks and by background probes which check all
+the modules periodically and also track their response times.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from redis import Redis, RedisError
+
+from validations.enums import CircuitState
+
+logger = logging.getLogger(__name__)
+
+health_key_prefix = "vm_health_"
+trial_key_prefix = "vm_trial_"
+# weight of the last measurement in the moving average of the module latency
+LATENCY_SMOOTHING = 0.3
+# response codes of the module (or a proxy in front of it) meaning that it is not available
+UNAVAILABLE_STATUS_CODES = (502, 503, 504)
+
+
+def get_health_redis() -> Redis:
+    return Redis.from_url(settings.REDIS_URL)
+
+
+def health_key(vm_url: str) -> str:
+    return f"{health_key_prefix}{vm_url}"
+
+
+def is_module_failure(exc: Exception) -> bool:
+    """
+    Tells if the exception raised while talking to a validation module means that the module
+    itself does not work (rather than that the validated data is wrong).
+    """
+    if isinstance(exc, requests.ConnectionError | requests.Timeout):
+        return True
+    return (
+        isinstance(exc, requests.HTTPError)
+        and exc.response is not None
+        and exc.response.status_code in UNAVAILABLE_STATUS_CODES
+    )
+
+
+def get_module_health(vm_url: str, redis: Redis | None = None) -> dict:
+    redis = redis or get_health_redis()
+    data = {
+        key.decode(): value.decode() for key, value in redis.hgetall(health_key(vm_url)).items()
+    }
+    state = CircuitState(data.get("state", CircuitState.CLOSED))
+    opened_at = float(data.get("opened_at", 0))
+    if (
+        state == CircuitState.OPEN
+        and time.time() - opened_at >= settings.VALIDATION_MODULE_OPEN_TIMEOUT
+    ):
+        state = CircuitState.HALF_OPEN
+    return {
+        "state": state,
+        "failures": int(data.get("failures", 0)),
+        "latency": float(data["latency"]) if "latency" in data else None,
+        "last_check": float(data["last_check"]) if "last_check" in data else None,
+        "last_error": data.get("last_error", ""),
+    }
+
+
+def is_module_available(vm_url: str, redis: Redis) -> bool:
+    """
+    Tells if validations may be sent to the module. When the circuit is half-open, only the
+    first caller gets the permission to try the module.
+    """
+    try:
+        state = get_module_health(vm_url, redis)["state"]
+        if state == CircuitState.HALF_OPEN:
+            return bool(
+                redis.set(
+                    f"{trial_key_prefix}{vm_url}",
+                    1,
+                    nx=True,
+                    ex=settings.VALIDATION_MODULE_OPEN_TIMEOUT,
+                )
+            )
+    except RedisError as e:
+        # without the health information the module is assumed to work
+        logger.warning("Could not get health of validation module %s: %s", vm_url, e)
+        return True
+    return state == CircuitState.CLOSED
+
+
+def record_success(vm_url: str, latency: float | None = None) -> None:
+    redis = get_health_redis()
+    key = health_key(vm_url)
+    try:
+        mapping = {"state": CircuitState.CLOSED.value, "failures": 0, "last_check": time.time()}
+        if latency is not None:
+            previous = redis.hget(key, "latency")
+            mapping["latency"] = (
+                latency
+                if previous is None
+                else LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * float(previous)
+            )
+        with redis.pipeline() as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.delete(f"{trial_key_prefix}{vm_url}")
+            pipe.execute()
+    except RedisError as e:
+        logger.warning("Could not update health of validation module %s: %s", vm_url, e)
+
+
+def record_failure(vm_url: str, error: str) -> None:
+    """
+    Counts a failure of the module and opens its circuit when the module failed
+    `VALIDATION_MODULE_FAILURE_THRESHOLD` times in a row (or when it failed a trial).
+    """
+    redis = get_health_redis()
+    key = health_key(vm_url)
+    try:
+        was_half_open = get_module_health(vm_url, redis)["state"] == CircuitState.HALF_OPEN
+        with redis.pipeline() as pipe:
+            pipe.hincrby(key, "failures", 1)
+            pipe.hset(key, mapping={"last_check": time.time(), "last_error": error[:500]})
+            failures = pipe.execute()[0]
+        if was_half_open or failures >= settings.VALIDATION_MODULE_FAILURE_THRESHOLD:
+            logger.warning("Validation module %s is not available: %s", vm_url, error)
+            with redis.pipeline() as pipe:
+                pipe.hset(key, mapping={"state": CircuitState.OPEN.value, "opened_at": time.time()})
+                pipe.delete(f"{trial_key_prefix}{vm_url}")
+                pipe.execute()
+    except RedisError as e:
+        logger.warning("Could not update health of validation module %s: %s", vm_url, e)
+
+
+def probe_module(vm_url: str, session: requests.Session) -> dict:
+    """
+    Checks that the module responds and records the result.
+    """
+    start = time.monotonic()
+    try:
+        response = session.get(vm_url, timeout=settings.VALIDATION_MODULE_PROBE_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+    except requests.RequestException as e:
+        record_failure(vm_url, str(e))
+        return {"url": vm_url, "ok": False, "error": str(e)}
+    latency = time.monotonic() - start
+    record_success(vm_url, latency)
+    return {"url": vm_url, "ok": True, "latency": latency, "data": data}
+
+
+def probe_modules() -> list[dict]:
+    """
+    Probes all the modules concurrently.
+    """
+    urls = settings.VALIDATION_MODULES_URLS
+    with requests.Session() as session, ThreadPoolExecutor(max_workers=len(urls) or 1) as executor:
+        return list(executor.map(lambda vm_url: probe_module(vm_url, session), urls))
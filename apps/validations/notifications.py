@@ -0,0 +1,65 @@
+"""
+Notifications of the admins about failed validations. Failures tend to come in bursts (e.g. when
+a validation module is being redeployed), so instead of sending one email per failure, they are
+collected in Redis and sent as one summary periodically (see `mail_validation_failures` task).
+"""
+
+import json
+import logging
+import time
+from collections import Counter
+from datetime import UTC, datetime
+
+from core.tasks import async_mail_admins
+from django.conf import settings
+from django.core.mail import mail_admins
+from redis import Redis, RedisError
+
+logger = logging.getLogger(__name__)
+
+FAILURES_KEY = "validation_failure_reports"
+# the summary lists only the first failures, the rest is only counted
+MAX_LISTED_FAILURES = 50
+
+
+def get_notification_redis() -> Redis:
+    return Redis.from_url(settings.REDIS_URL)
+
+
+def report_failure(subject: str, message: str) -> None:
+    """
+    Adds a failure to the next summary. When it cannot be stored, it is sent right away.
+    """
+    record = {"subject": subject, "message": message, "time": time.time()}
+    try:
+        get_notification_redis().rpush(FAILURES_KEY, json.dumps(record))
+    except RedisError as e:
+        logger.warning("Could not store validation failure report: %s", e)
+        async_mail_admins.delay(subject, message)
+
+
+def pop_failures() -> list[dict]:
+    with get_notification_redis().pipeline() as pipe:
+        pipe.lrange(FAILURES_KEY, 0, -1)
+        pipe.delete(FAILURES_KEY)
+        records, _ = pipe.execute()
+    return [json.loads(record) for record in records]
+
+
+def mail_failures() -> int:
+    """
+    Sends the summary of the failures reported since the last summary. Returns the number
+    of the failures.
+    """
+    if not (failures := pop_failures()):
+        return 0
+    counts = Counter(failure["subject"] for failure in failures)
+    lines = [f"{count}x {subject}" for subject, count in counts.most_common()]
+    lines.append("")
+    for failure in failures[:MAX_LISTED_FAILURES]:
+        reported = datetime.fromtimestamp(failure["time"], UTC).strftime("%Y-%m-%d %H:%M:%S")
+        lines.append(f"{reported} {failure['subject']}: {failure['message']}")
+    if (rest := len(failures) - MAX_LISTED_FAILURES) > 0:
+        lines.append(f"... and {rest} more")
+    mail_admins(f"Validation failures ({len(failures)})", "\n".join(lines))
+    return len(failures)
@@ -0,0 +1,13 @@
+from rest_framework.parsers import BaseParser
+
+
+class ChunkParser(BaseParser):
+    """
+    Passes the raw request body through, so that a chunk of an uploaded file can be
+    streamed directly to its destination.
+    """
+
+    media_type = "application/octet-stream"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return stream
@@ -0,0 +1,192 @@
+"""
+Scheduling of waiting validations. Instead of processing validations in the order in which
+they were submitted, each worker picks the next validation from the database when it is free:
+
+* validations with a higher priority (interactive before API before bulk) go first
+* within the same priority, users are served round-robin - the n-th waiting validation of
+  a user goes before the (n+1)-th waiting validation of anyone else; validations which are
+  already running count as well, so a user cannot occupy all the validation modules
+* otherwise, older validations go first
+
+Validations returned to the queue after a failure of a validation module wait until their
+`retry_at` passes before they are processed again (see `tasks.module_failed`).
+
+One `run_next_validation` task is queued for each submitted validation, so there are always
+as many tasks as waiting validations, but the task does not decide which validation it runs.
+When the validations are processed by the dispatcher (see `dispatcher`), no tasks are queued -
+the dispatcher is woken up through a Redis pub/sub channel instead.
+
+Knowing the order, the start and finish of the waiting validations can be estimated from their
+estimated durations (see `estimation`) and the validations currently running on the modules.
+Estimating goes through the whole queue, so it is done periodically (see
+`refresh_queue_estimates` task) and the estimates are read from the cache.
+"""
+
+import heapq
+import logging
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, QuerySet, Subquery, Window
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils.timezone import now
+from redis import Redis, RedisError
+
+from validations.celery_queue import get_queue_state
+from validations.enums import ValidationStatus
+from validations.estimation import get_duration_model
+from validations.leases import lease_expiration
+from validations.models import Validation, ValidationCore
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_CHANNEL = "validation_dispatch"
+# number of the first waiting validations read at once when claiming the next one - more are
+# only read when all of them are being claimed by other workers
+CLAIM_CANDIDATES = 10
+
+
+def waiting_queue() -> QuerySet[ValidationCore]:
+    """
+    Waiting validations (their cores) in the order in which they should be processed.
+    """
+    running = (
+        ValidationCore.objects.filter(user=OuterRef("user"), status=ValidationStatus.RUNNING)
+        .order_by()
+        .values("user")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return (
+        ValidationCore.objects.filter(status=ValidationStatus.WAITING, validation__isnull=False)
+        .filter(Q(retry_at__isnull=True) | Q(retry_at__lte=now()))
+        .annotate(
+            user_rank=Window(
+                RowNumber(), partition_by=[F("user"), F("priority")], order_by=F("created").asc()
+            ),
+            user_running=Coalesce(Subquery(running), 0),
+        )
+        .annotate(share=F("user_rank") + F("user_running"))
+        .order_by("-priority", "share", "created")
+    )
+
+
+def claim_next_validation() -> Validation | None:
+    """
+    Marks the next waiting validation as running and returns it. Validations claimed by other
+    workers at the same time are skipped.
+    """
+    # window functions cannot be combined with row locking, so the candidates are locked
+    # one by one in the right order
+    tried = []
+    while candidates := list(
+        waiting_queue().exclude(pk__in=tried).values_list("pk", flat=True)[:CLAIM_CANDIDATES]
+    ):
+        for pk in candidates:
+            with transaction.atomic():
+                if (
+                    core := ValidationCore.objects.select_for_update(skip_locked=True)
+                    .filter(pk=pk, status=ValidationStatus.WAITING)
+                    .first()
+                ):
+                    core.status = ValidationStatus.RUNNING
+                    core.lease_expires = lease_expiration()
+                    core.save(update_fields=["status", "lease_expires", "last_updated"])
+                    return Validation.objects.select_related("core", "counterapivalidation").get(
+                        core=core
+                    )
+        tried += candidates
+    return None
+
+
+def wake_dispatcher() -> None:
+    """
+    Lets the dispatcher know that there are new waiting validations. Errors are only logged -
+    the dispatcher checks the queue periodically anyway.
+    """
+    try:
+        Redis.from_url(settings.REDIS_URL).publish(DISPATCH_CHANNEL, 1)
+    except RedisError as e:
+        logger.warning("Could not wake up the validation dispatcher: %s", e)
+
+
+@dataclass
+class QueueEstimate:
+    # 1-based position in the queue, None for running validations
+    queue_position: int | None
+    estimated_start: datetime | None
+    estimated_finish: datetime | None
+
+
+def estimate_queue() -> dict[UUID, QueueEstimate]:
+    """
+    Estimates when the running and waiting validations start and finish (by the id of their
+    core). The processing of the queue is simulated - each waiting validation is assigned to
+    the validation module which becomes free first, starting with the validations which are
+    currently running on the modules.
+    """
+    model = get_duration_model()
+    current_time = now()
+    estimates = {}
+    running = {
+        rec["validation"]: rec for rec in get_queue_state()["modules"].values() if rec is not None
+    }
+    free_at = []
+    for rec in Validation.objects.filter(pk__in=running.keys()).values(
+        "pk", "core_id", "core__file_format", "core__file_size"
+    ):
+        started = datetime.fromtimestamp(running[str(rec["pk"])]["started"], UTC)
+        duration = model.predict(rec["core__file_format"], rec["core__file_size"])
+        finish = (
+            None if duration is None else max(started + timedelta(seconds=duration), current_time)
+        )
+        estimates[rec["core_id"]] = QueueEstimate(None, started, finish)
+        free_at.append(finish or current_time)
+    free_at += [current_time] * (len(settings.VALIDATION_MODULES_URLS) - len(free_at))
+    heapq.heapify(free_at)
+
+    for position, (pk, file_format, file_size) in enumerate(
+        waiting_queue().values_list("pk", "file_format", "file_size"), 1
+    ):
+        if (duration := model.predict(file_format, file_size)) is None or not free_at:
+            estimates[pk] = QueueEstimate(position, None, None)
+            continue
+        start = heapq.heappop(free_at)
+        finish = start + timedelta(seconds=duration)
+        heapq.heappush(free_at, finish)
+        estimates[pk] = QueueEstimate(position, start, finish)
+    return estimates
+
+
+QUEUE_ESTIMATE_CACHE_PREFIX = "validation_queue_estimate:"
+
+
+def queue_estimate_key(core_id: UUID) -> str:
+    return f"{QUEUE_ESTIMATE_CACHE_PREFIX}{core_id}"
+
+
+def update_queue_estimates() -> int:
+    """
+    Stores the estimates of the whole queue in the cache. They expire after a few refresh
+    intervals, so that no estimates are shown when they are not refreshed. Returns the number
+    of the estimated validations.
+    """
+    estimates = estimate_queue()
+    cache.set_many(
+        {queue_estimate_key(core_id): estimate for core_id, estimate in estimates.items()},
+        timeout=4 * settings.VALIDATION_QUEUE_ESTIMATE_INTERVAL,
+    )
+    return len(estimates)
+
+
+def get_queue_estimates(core_ids: list[UUID]) -> dict[UUID, QueueEstimate]:
+    """
+    Returns the last estimates of validations by the ids of their cores (see
+    `update_queue_estimates`). Validations which were not estimated yet are missing.
+    """
+    keys = {queue_estimate_key(core_id): core_id for core_id in core_ids}
+    return {keys[key]: estimate for key, estimate in cache.get_many(keys).items()}
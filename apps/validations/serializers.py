@@ -1,15 +1,30 @@
 import logging
+import re
+from datetime import datetime
 from io import BytesIO
 
 import magic
 from core.serializers import UserSerializerSimple
 from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Model, Prefetch, QuerySet
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 
-from .enums import ValidationStatus
-from .hashing import checksum_string
-from .models import CounterAPIValidation, Validation, ValidationCore, ValidationMessage
+from .enums import SeverityLevel, ValidationStatus
+from .hashing import checksum_dict, checksum_string
+from .models import (
+    CounterAPIValidation,
+    UploadSession,
+    Validation,
+    ValidationBatch,
+    ValidationCore,
+    ValidationMessage,
+)
+from .scheduling import QueueEstimate, get_queue_estimates
+from .status_channel import UNFINISHED_STATUSES
+from .storage import is_compressed
+from .upload_handlers import UPLOAD_HEAD_SIZE, decompress_uploaded_file
 
 logger = logging.getLogger(__name__)
 
@@ -21,9 +36,106 @@ class CredentialsSerializer(serializers.Serializer):
     platform = serializers.CharField(required=False, allow_blank=True, allow_null=True)
 
 
-class ValidationSerializer(serializers.ModelSerializer):
+def parse_field_names(value: str | None) -> set[str]:
+    return {name.strip() for name in value.split(",") if name.strip()} if value else set()
+
+
+def source_to_lookup(model: type[Model], source_attrs: list[str]) -> str | None:
+    """
+    Translates the source of a serializer field to a model lookup (e.g. `core.status` to
+    `core__status`). Returns None if the source is not a model field.
+    """
+    parts = []
+    for attr in source_attrs:
+        try:
+            field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            # `get_FOO_display` is backed by the `FOO` field
+            if not (m := re.fullmatch(r"get_(\w+)_display", attr)):
+                return None
+            field = model._meta.get_field(m.group(1))
+        parts.append(field.name)
+        if not field.is_relation:
+            break
+        model = field.related_model
+    return "__".join(parts)
+
+
+class SparseFieldsetsMixin:
+    """
+    Lets clients select the fields to serialize using the `fields` and `omit` query params
+    (comma separated field names). `optimize_queryset` then makes sure only the columns and
+    relations needed for the selected fields are loaded from the database.
+    """
+
+    # model lookups of fields whose source is not a model field (methods, properties, ...)
+    field_lookups: dict[str, tuple[str, ...]] = {}
+    # reverse one-to-one relations which are prefetched rather than joined
+    prefetched_relations: dict[str, type[Model]] = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not (request := self.context.get("request")):
+            return
+        selected = parse_field_names(request.query_params.get("fields"))
+        omitted = parse_field_names(request.query_params.get("omit"))
+        for name in list(self.fields):
+            if (selected and name not in selected) or name in omitted:
+                self.fields.pop(name)
+
+    def get_model_lookups(self) -> set[str]:
+        lookups = set()
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            if name in self.field_lookups:
+                lookups.update(self.field_lookups[name])
+            elif (lookup := source_to_lookup(self.Meta.model, field.source_attrs)) is not None:
+                lookups.add(lookup)
+            else:
+                raise ImproperlyConfigured(
+                    f"Field '{name}' of {self.__class__.__name__} must be listed in `field_lookups`"
+                )
+        return lookups
+
+    def optimize_queryset(self, queryset: QuerySet) -> QuerySet:
+        lookups = self.get_model_lookups()
+        for relation, model in self.prefetched_relations.items():
+            related = {
+                lookup.removeprefix(f"{relation}__")
+                for lookup in lookups
+                if lookup == relation or lookup.startswith(f"{relation}__")
+            }
+            lookups -= {f"{relation}__{lookup}" for lookup in related} | {relation}
+            if relation in related:
+                queryset = queryset.prefetch_related(relation)
+            elif related:
+                queryset = queryset.prefetch_related(
+                    Prefetch(relation, queryset=model.objects.only(*related))
+                )
+        # forward relations are loaded in the same query, but only those which are needed
+        queryset = queryset.select_related(None)
+        if joined := self.get_joined_relations(lookups):
+            queryset = queryset.select_related(*joined)
+        return queryset.only(*lookups)
+
+    def get_joined_relations(self, lookups: set[str]) -> set[str]:
+        joined = set()
+        for lookup in lookups:
+            model, path = self.Meta.model, []
+            for attr in lookup.split("__"):
+                field = model._meta.get_field(attr)
+                if not field.is_relation:
+                    break
+                path.append(attr)
+                joined.add("__".join(path))
+                model = field.related_model
+        return joined
+
+
+class ValidationSerializer(SparseFieldsetsMixin, serializers.ModelSerializer):
     file = serializers.FileField(write_only=True)
-    file_url = serializers.URLField(read_only=True)
+    file_url = serializers.SerializerMethodField()
     validation_result = serializers.CharField(
         read_only=True, source="core.get_validation_result_display"
     )
@@ -60,6 +172,10 @@ class ValidationSerializer(serializers.ModelSerializer):
     use_short_dates = serializers.BooleanField(
         read_only=True, source="counterapivalidation.use_short_dates"
     )
+    # estimates of unfinished validations
+    queue_position = serializers.SerializerMethodField()
+    estimated_start = serializers.SerializerMethodField()
+    estimated_finish = serializers.SerializerMethodField()
 
     class Meta:
         model = Validation
@@ -91,11 +207,58 @@ class ValidationSerializer(serializers.ModelSerializer):
             "requested_begin_date",
             "requested_end_date",
             "use_short_dates",
+            "queue_position",
+            "estimated_start",
+            "estimated_finish",
         ]
 
+    field_lookups = {
+        "file_url": ("file", "public_id"),
+        "data_source": ("core__sushi_credentials_checksum",),
+        "queue_position": ("core__status",),
+        "estimated_start": ("core__status",),
+        "estimated_finish": ("core__status",),
+    }
+    prefetched_relations = {"counterapivalidation": CounterAPIValidation}
+
+    def get_file_url(self, obj: Validation) -> str | None:
+        # a validation viewed by its public id is downloaded by the public id as well
+        lookup = None
+        if view := self.context.get("view"):
+            lookup = view.kwargs.get(view.lookup_url_kwarg or view.lookup_field)
+        return obj.file_url(public=obj.public_id is not None and lookup == str(obj.public_id))
+
     def get_data_source(self, obj):
         return obj.core.sushi_credentials_checksum and "counter_api" or "file"
 
+    def get_queue_estimate(self, obj: Validation) -> QueueEstimate | None:
+        if obj.core.status not in UNFINISHED_STATUSES:
+            return None
+        # the estimates of all the serialized validations (the child of a list serializer
+        # gets all of them as well) are read from the cache at once
+        if (estimates := self.context.get("queue_estimates")) is None:
+            instances = self.instance if isinstance(self.instance, list | QuerySet) else [obj]
+            estimates = self.context["queue_estimates"] = get_queue_estimates(
+                [v.core_id for v in instances if v.core.status in UNFINISHED_STATUSES]
+            )
+        return estimates.get(obj.core_id)
+
+    def get_queue_position(self, obj: Validation) -> int | None:
+        estimate = self.get_queue_estimate(obj)
+        return estimate.queue_position if estimate else None
+
+    def get_estimated_start(self, obj: Validation) -> str | None:
+        estimate = self.get_queue_estimate(obj)
+        return self.format_datetime(estimate.estimated_start if estimate else None)
+
+    def get_estimated_finish(self, obj: Validation) -> str | None:
+        estimate = self.get_queue_estimate(obj)
+        return self.format_datetime(estimate.estimated_finish if estimate else None)
+
+    @classmethod
+    def format_datetime(cls, value: datetime | None) -> str | None:
+        return serializers.DateTimeField().to_representation(value) if value else None
+
 
 class ValidationDetailSerializer(ValidationSerializer):
     result_data = serializers.ReadOnlyField()
@@ -105,6 +268,11 @@ class ValidationDetailSerializer(ValidationSerializer):
     class Meta(ValidationSerializer.Meta):
         fields = ValidationSerializer.Meta.fields + ["result_data", "user", "full_url"]
 
+    field_lookups = ValidationSerializer.field_lookups | {
+        # the COUNTER API validation finds the core in the cache of the parent validation
+        "full_url": ("counterapivalidation", "core__api_endpoint"),
+    }
+
     def get_full_url(self, obj: Validation):
         if obj.is_counter_api_validation:
             return obj.counterapivalidation.get_url()
@@ -126,6 +294,11 @@ class PublicValidationDetailSerializer(ValidationSerializer):
     class Meta(ValidationSerializer.Meta):
         fields = ValidationSerializer.Meta.fields + ["result_data", "full_url"]
 
+    field_lookups = ValidationSerializer.field_lookups | {
+        "credentials": (),
+        "full_url": (),
+    }
+
     def get_credentials(self, obj):
         return None
 
@@ -153,7 +326,10 @@ class FileValidationCreateSerializer(serializers.Serializer):
 
     @classmethod
     def file_to_type(cls, fileobj: BytesIO):
-        buffer = fileobj.read(16384)
+        # the upload handlers keep the start of the file, so it does not have to be read again
+        if (buffer := getattr(fileobj, "head", None)) is None:
+            buffer = fileobj.read(UPLOAD_HEAD_SIZE)
+            fileobj.seek(0)
         detected_type = magic.from_buffer(buffer, mime=True)
         if detected_type == "text/plain":
             # this can be CSV, TSV, etc., but also JSON :( - we need to make the best guess
@@ -171,10 +347,16 @@ class FileValidationCreateSerializer(serializers.Serializer):
                 detected_type = "text/plain"
 
         logger.info(f"Detected file type: {detected_type}")
-        fileobj.seek(0)
         return cls.mime_to_type.get(detected_type, "default")
 
     def validate_file(self, value):
+        if is_compressed(value.name):
+            try:
+                value = decompress_uploaded_file(value, max(settings.FILE_SIZE_LIMITS.values()))
+            except ValueError as e:
+                raise ValidationError(detail=str(e)) from e
+            if not value.size:
+                raise ValidationError(detail="The submitted file is empty.")
         # empty files are handled by the FileField itself, so we just check the max size
         file_type = self.file_to_type(value)
         size_limit = settings.FILE_SIZE_LIMITS.get(file_type, settings.FILE_SIZE_LIMITS["default"])
@@ -197,6 +379,29 @@ class FileValidationCreateSerializer(serializers.Serializer):
         )
 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Serializer used to start a chunked upload and to report its progress.
+    """
+
+    class Meta:
+        model = UploadSession
+        fields = ("id", "filename", "size", "received", "user_note", "created", "validation")
+        read_only_fields = ("id", "received", "created", "validation")
+
+    def validate_size(self, value):
+        # the limit for the actual file type is checked once the whole file is uploaded
+        size_limit = max(settings.FILE_SIZE_LIMITS.values())
+        if not value:
+            raise ValidationError("The file is empty")
+        if value > size_limit:
+            raise ValidationError(f"Max file size exceeded: {value} > {size_limit} bytes")
+        return value
+
+    def create(self, validated_data) -> UploadSession:
+        return UploadSession.objects.create(user=self.context["request"].user, **validated_data)
+
+
 class CounterAPIValidationCreateSerializer(serializers.Serializer):
     """
     Serializer to create a new COUNTER API validation from a POST request.
@@ -237,10 +442,20 @@ class CounterAPIValidationCreateSerializer(serializers.Serializer):
         return attrs
 
     def create(self, validated_data) -> CounterAPIValidation:
+        validation = self.build(validated_data)
+        validation.core.save()
+        validation.save()
+        return validation
+
+    def build(self, validated_data, batch: ValidationBatch | None = None) -> CounterAPIValidation:
+        """
+        Returns a new unsaved validation (and its core) from the validated data.
+        """
         user = self.context["request"].user
         api_key = getattr(self.context["request"], "api_key", None)
-        core = ValidationCore.objects.create(
+        core = ValidationCore(
             status=ValidationStatus.WAITING,
+            priority=ValidationCore.submission_priority(api_key=api_key, batch=batch),
             user=user,
             user_email_checksum=checksum_string(user.email),
             api_key_prefix=api_key.prefix if api_key else "",
@@ -253,9 +468,11 @@ class CounterAPIValidationCreateSerializer(serializers.Serializer):
                 credentials.pop("platform")
         else:
             credentials = None
+        core.sushi_credentials_checksum = checksum_dict(credentials)
 
-        return CounterAPIValidation.objects.create(
+        return CounterAPIValidation(
             core=core,
+            batch=batch,
             url=validated_data["url"],
             requested_cop_version=validated_data["cop_version"],
             requested_report_code=validated_data.get("report_code", ""),
@@ -268,6 +485,160 @@ class CounterAPIValidationCreateSerializer(serializers.Serializer):
         )
 
 
+class ValidationBatchCreateSerializer(serializers.Serializer):
+    """
+    Serializer used to create a batch of validations - either from files or from COUNTER API
+    requests. All the validations are created in bulk.
+    """
+
+    files = serializers.ListField(child=serializers.FileField(), required=False)
+    counter_api = CounterAPIValidationCreateSerializer(many=True, required=False)
+    user_note = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_files(self, value):
+        file_serializer = FileValidationCreateSerializer()
+        files, errors = [], {}
+        for i, file in enumerate(value):
+            try:
+                files.append(file_serializer.validate_file(file))
+            except ValidationError as e:
+                errors[i] = e.detail
+        if errors:
+            raise ValidationError(errors)
+        return files
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        items = [key for key in ("files", "counter_api") if attrs.get(key)]
+        if len(items) != 1:
+            raise ValidationError("Exactly one of 'files' and 'counter_api' must be given")
+        if (count := len(attrs[items[0]])) > settings.VALIDATION_BATCH_MAX_SIZE:
+            raise ValidationError(
+                f"Max batch size exceeded: {count} > {settings.VALIDATION_BATCH_MAX_SIZE}"
+            )
+        return attrs
+
+    def create(self, validated_data) -> ValidationBatch:
+        request = self.context["request"]
+        user_note = validated_data.get("user_note", "")
+        batch = ValidationBatch.objects.create(user=request.user)
+        validations = [
+            Validation.build_from_file(
+                request.user,
+                file,
+                user_note=user_note,
+                api_key=getattr(request, "api_key", None),
+                batch=batch,
+            )
+            for file in validated_data.get("files", [])
+        ]
+        counter_api_serializer = CounterAPIValidationCreateSerializer(context=self.context)
+        for spec in validated_data.get("counter_api", []):
+            if user_note and not spec.get("user_note"):
+                spec["user_note"] = user_note
+            validations.append(counter_api_serializer.build(spec, batch=batch))
+        Validation.bulk_create_with_cores(validations)
+        batch.created_validations = validations
+        return batch
+
+
+class CounterAPISweepCreateSerializer(CounterAPIValidationCreateSerializer):
+    """
+    Serializer used to create a sweep of a COUNTER API - a batch of validations of the
+    `/status`, `/members` and `/reports` endpoints and of all the reports listed by the
+    `/reports` endpoint.
+    """
+
+    SWEPT_ENDPOINTS = ("/status", "/members", "/reports")
+
+    api_endpoint = None
+    report_code = None
+    begin_date = serializers.DateField()
+    end_date = serializers.DateField()
+
+    def validate(self, attrs):
+        if not attrs.get("credentials"):
+            raise ValidationError("Credentials are required for this endpoint")
+        return attrs
+
+    def create(self, validated_data) -> ValidationBatch:
+        batch = ValidationBatch.objects.create(user=self.context["request"].user, sweep=True)
+        batch.created_validations = Validation.bulk_create_with_cores(
+            [
+                self.build(validated_data | {"api_endpoint": endpoint}, batch=batch)
+                for endpoint in self.SWEPT_ENDPOINTS
+            ]
+        )
+        return batch
+
+
+class ValidationBatchSerializer(serializers.ModelSerializer):
+    """
+    Batch of validations with the aggregate status of its validations.
+    """
+
+    status = serializers.SerializerMethodField()
+    status_counts = serializers.SerializerMethodField()
+    validations = serializers.SerializerMethodField()
+
+    validation_result = serializers.CharField(source="get_validation_result.label", read_only=True)
+
+    class Meta:
+        model = ValidationBatch
+        fields = (
+            "id",
+            "created",
+            "status",
+            "status_counts",
+            "validation_result",
+            "error_message",
+            "validations",
+        )
+
+    def get_counts(self, obj: ValidationBatch) -> dict:
+        # computed only once for both status fields
+        if not hasattr(obj, "_status_counts"):
+            obj._status_counts = obj.get_status_counts()
+        return obj._status_counts
+
+    def get_status(self, obj: ValidationBatch) -> ValidationStatus:
+        """
+        The batch is waiting until any of its validations runs and finished once all of them
+        are finished - successfully only if none of them failed.
+        """
+        counts = self.get_counts(obj)
+        if counts[ValidationStatus.WAITING] == sum(counts.values()):
+            return ValidationStatus.WAITING
+        if counts[ValidationStatus.WAITING] or counts[ValidationStatus.RUNNING]:
+            return ValidationStatus.RUNNING
+        if counts[ValidationStatus.FAILURE]:
+            return ValidationStatus.FAILURE
+        return ValidationStatus.SUCCESS
+
+    def get_status_counts(self, obj: ValidationBatch) -> dict:
+        return {status.name.lower(): count for status, count in self.get_counts(obj).items()}
+
+    def get_validations(self, obj: ValidationBatch) -> list[dict]:
+        return [
+            {
+                "id": pk,
+                "status": status,
+                "validation_result": SeverityLevel(result).label,
+                "api_endpoint": api_endpoint,
+                "report_code": report_code,
+            }
+            for pk, status, result, api_endpoint, report_code in obj.validations.order_by(
+                "pk"
+            ).values_list(
+                "pk",
+                "core__status",
+                "core__validation_result",
+                "core__api_endpoint",
+                "counterapivalidation__requested_report_code",
+            )
+        ]
+
+
 class ValidationCoreSerializer(serializers.ModelSerializer):
     validation_result = serializers.CharField(
         read_only=True, source="get_validation_result_display"
@@ -0,0 +1,73 @@
+"""
+Status changes of validations are published into a Redis pub/sub channel. This allows
+clients waiting for a validation to finish to get the result as soon as it is available
+without repeatedly polling the API (and the database).
+"""
+
+import logging
+import time
+from functools import cache
+
+from django.conf import settings
+from redis import Redis, RedisError
+
+from validations.enums import ValidationStatus
+
+logger = logging.getLogger(__name__)
+
+UNFINISHED_STATUSES = (ValidationStatus.WAITING, ValidationStatus.RUNNING)
+
+
+@cache
+def get_pubsub_redis() -> Redis:
+    # status is published on every save of a validation, so the client (and its connection
+    # pool) is created only once per process
+    return Redis.from_url(settings.REDIS_URL)
+
+
+def status_channel_name(core_id) -> str:
+    return f"validation_status_{core_id}"
+
+
+def publish_status(core_id, status: ValidationStatus) -> None:
+    """
+    Publishes the current status of a validation. Errors are only logged - failing to notify
+    waiting clients must never break the validation itself.
+    """
+    try:
+        get_pubsub_redis().publish(status_channel_name(core_id), int(status))
+    except RedisError as e:
+        logger.warning("Could not publish status of validation %s: %s", core_id, e)
+
+
+class StatusSubscription:
+    """
+    Context manager subscribing to status changes of one validation.
+
+    The subscription should be made before the current status is read from the database,
+    so that no change can slip through between reading the status and starting to wait.
+    """
+
+    def __init__(self, core_id):
+        self.channel = status_channel_name(core_id)
+        self.pubsub = None
+
+    def __enter__(self):
+        self.pubsub = get_pubsub_redis().pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(self.channel)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.pubsub.close()
+
+    def wait(self, current_status: ValidationStatus, timeout: float) -> bool:
+        """
+        Waits until a status different from `current_status` is published or until
+        `timeout` seconds pass. Returns True if the status changed.
+        """
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = self.pubsub.get_message(timeout=remaining)
+            if message and int(message["data"]) != current_status:
+                return True
+        return False
@@ -0,0 +1,102 @@
+"""
+Storage of uploaded report files. COUNTER reports compress very well, so the files are stored
+gzip compressed and transparently decompressed when they are read. Files stored before the
+compression was enabled (without the `.gz` suffix) are read as they are.
+
+Responses of the validation modules waiting for the ingestion are stored the same way.
+"""
+
+import gzip
+import os
+import struct
+import zlib
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, storages
+
+COMPRESSED_SUFFIX = ".gz"
+
+
+def is_compressed(name: str) -> bool:
+    return name.endswith(COMPRESSED_SUFFIX)
+
+
+class CompressingFile(File):
+    """
+    Wraps a file so that its chunks are gzip compressed when it is written by a storage.
+    """
+
+    def __init__(self, file, compresslevel: int):
+        super().__init__(file, name=file.name)
+        self.compresslevel = compresslevel
+
+    def chunks(self, chunk_size=None):
+        # wbits=31 produces the gzip format including the trailer with the original size
+        compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+        for chunk in self.file.chunks(chunk_size):
+            if data := compressor.compress(chunk):
+                yield data
+        yield compressor.flush()
+
+
+class DecompressingFile(File):
+    """
+    A stored compressed file which reads the original data. It is not seekable, so that
+    its size is not determined by decompressing the whole file - `size` is used instead.
+    """
+
+    def __init__(self, path: str, size: int):
+        super().__init__(gzip.open(path, "rb"), name=path)  # noqa: SIM115 - closed by File
+        self.size = size
+
+    def open(self, mode=None):
+        if self.closed:
+            self.file = gzip.open(self.name, "rb")  # noqa: SIM115
+        else:
+            self.seek(0)
+        return self
+
+    def seekable(self) -> bool:
+        return False
+
+
+class CompressedFileSystemStorage(FileSystemStorage):
+    """
+    File system storage which stores files gzip compressed under their name with the `.gz`
+    suffix. Reading such files returns the original data.
+    """
+
+    def __init__(self, *args, compresslevel: int = 6, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compresslevel = compresslevel
+
+    def generate_filename(self, filename):
+        return super().generate_filename(filename) + COMPRESSED_SUFFIX
+
+    def _save(self, name, content):
+        if is_compressed(name):
+            content = CompressingFile(content, self.compresslevel)
+        return super()._save(name, content)
+
+    def _open(self, name, mode="rb"):
+        if not is_compressed(name):
+            return super()._open(name, mode)
+        if "w" in mode or "a" in mode:
+            raise ValueError("Compressed files can only be opened for reading")
+        return DecompressingFile(self.path(name), self.size(name))
+
+    def size(self, name):
+        if not is_compressed(name):
+            return super().size(name)
+        # the gzip trailer contains the size of the original data (modulo 2**32)
+        with open(self.path(name), "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack("<I", f.read(4))[0]
+
+
+def validation_file_storage():
+    return storages["validation_files"]
+
+
+def validation_result_storage():
+    return storages["validation_results"]
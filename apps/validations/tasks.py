@@ -1,19 +1,52 @@
+import json
 import logging
 import os
 import time
 import uuid
+from datetime import timedelta
 
 import celery
 import requests
 from celery.contrib.django.task import DjangoTask
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 
-from apps.core.tasks import async_mail_admins
+from validations.celery_queue import validation_finished, validation_started
 from validations.enums import ValidationStatus
-from validations.models import CounterAPIValidation, Validation
-from validations.validation_module_api import update_validation_result
+from validations.estimation import update_duration_model
+from validations.leases import Heartbeat, recover_expired_leases
+from validations.models import (
+    CounterAPIValidation,
+    UploadSession,
+    Validation,
+    ValidationBatch,
+    ValidationCore,
+)
+from validations.module_health import (
+    is_module_failure,
+    probe_modules,
+    record_failure,
+    record_success,
+)
+from validations.notifications import mail_failures, report_failure
+from validations.scheduling import (
+    claim_next_validation,
+    update_queue_estimates,
+    wake_dispatcher,
+)
+from validations.validation_module_api import (
+    delete_module_response,
+    delete_stale_module_responses,
+    load_module_response,
+    store_module_response,
+    update_validation_result,
+)
 from validations.validation_modules import (
     create_validation_module_lock,
     get_available_validation_module_url,
+    lock_token,
 )
 
 logger = logging.getLogger(__name__)
@@ -26,8 +59,49 @@ class ValidationTask(DjangoTask):
         obj.save()
 
 
+def retry_delay(retries: int) -> int:
+    """
+    Delay in seconds before a validation is retried after a failure of the validation module -
+    it grows exponentially with the number of retries and is randomized (full jitter), so that
+    the validations which failed at the same time are not retried at the same time.
+    """
+    return get_exponential_backoff_interval(
+        settings.VALIDATION_RETRY_BACKOFF,
+        retries,
+        settings.VALIDATION_RETRY_BACKOFF_MAX,
+        full_jitter=True,
+    )
+
+
+def module_failed(obj: Validation, vm_url: str, exc: Exception) -> bool:
+    """
+    Handles an error of the request to the validation module. When the module itself failed
+    (see `is_module_failure`), the failure is recorded and the validation is returned to
+    the queue to be retried after a delay (unless it was retried too many times already).
+    Modules which failed recently are used last, so the retry goes to another module when one
+    is available. Other errors are permanent. Returns True if the validation will be retried.
+    """
+    if not is_module_failure(exc):
+        return False
+    record_failure(vm_url, str(exc))
+    if obj.core.retries >= settings.VALIDATION_MAX_RETRIES:
+        return False
+    delay = retry_delay(obj.core.retries)
+    logger.warning(
+        "Validation module %s failed, retrying %s in %s s: %s", vm_url, obj.pk, delay, exc
+    )
+    obj.core.status = ValidationStatus.WAITING
+    obj.core.retries += 1
+    obj.core.retry_at = timezone.now() + timedelta(seconds=delay)
+    obj.core.save(update_fields=["status", "retries", "retry_at", "last_updated"])
+    # the dispatcher finds the validation when it checks the queue after the delay
+    if not settings.VALIDATION_DISPATCHER:
+        run_next_validation.apply_async(countdown=delay)
+    return True
+
+
 @celery.shared_task(base=ValidationTask)
-def validate_file(pk: uuid.UUID):
+def validate_file(pk: uuid.UUID, heartbeat: Heartbeat | None = None):
     while not (vm_url := get_available_validation_module_url()):
         logger.info("No available validation module, waiting...")
         time.sleep(1)
@@ -41,47 +115,47 @@ def validate_file(pk: uuid.UUID):
     start = time.monotonic()
     lock = create_validation_module_lock(vm_url)
     lock.acquire(blocking=True)
+    validation_started(obj.pk, vm_url, lock_token(lock))
+    if heartbeat:
+        heartbeat.lock = lock
     try:
         with obj.file.open("rb") as fp:
             req = requests.post(
                 vm_url + "file.php",
                 params={"extension": os.path.splitext(obj.filename)[1].lstrip(".")},
                 data=fp,
+                stream=True,
             )
         req.raise_for_status()
+        result_name = store_module_response(obj, req)
+        record_success(vm_url)
     except Exception as e:
+        if module_failed(obj, vm_url, e):
+            return
         obj.core.status = ValidationStatus.FAILURE
         obj.core.error_message = str(e)
         end = time.monotonic()
         obj.core.duration = end - start
         obj.core.save(update_fields=["status", "error_message", "duration"])
-        async_mail_admins.delay(
+        report_failure(
             "Validation failed",
             f"Validation {obj.id} failed: {obj.core.error_message}",
         )
         return
     finally:
+        if heartbeat:
+            heartbeat.lock = None
+        validation_finished(vm_url)
         lock.release()
 
-    end = time.monotonic()
-    try:
-        logger.debug("Validation result: %s", req.json())
-        update_validation_result(obj, req.json(), end - start)
-    except Exception as e:
-        obj.core.status = ValidationStatus.FAILURE
-        obj.core.error_message = str(e)
-        obj.core.save(update_fields=["status", "error_message", "duration"])
-        async_mail_admins.delay(
-            "Validation update failed",
-            f"Validation {obj.id} update failed: {obj.core.error_message}",
-        )
+    queue_ingestion(obj, result_name, time.monotonic() - start)
 
 
 COUNTER_API_VALIDATION_PATH = "api.php"
 
 
 @celery.shared_task(base=ValidationTask)
-def validate_counter_api(pk):
+def validate_counter_api(pk, heartbeat: Heartbeat | None = None):
     while not (vm_url := get_available_validation_module_url()):
         logger.info("No available validation module, waiting...")
         time.sleep(1)
@@ -98,10 +172,19 @@ def validate_counter_api(pk):
     resp = None
     lock = create_validation_module_lock(vm_url)
     lock.acquire(blocking=True)
+    validation_started(obj.pk, vm_url, lock_token(lock))
+    if heartbeat:
+        heartbeat.lock = lock
     try:
-        resp = requests.post(vm_url + COUNTER_API_VALIDATION_PATH, json={"url": req_url})
+        resp = requests.post(
+            vm_url + COUNTER_API_VALIDATION_PATH, json={"url": req_url}, stream=True
+        )
         resp.raise_for_status()
+        result_name = store_module_response(obj, resp)
+        record_success(vm_url)
     except Exception as e:
+        if module_failed(obj, vm_url, e):
+            return
         obj.core.status = ValidationStatus.FAILURE
         obj.core.error_message = str(e)
         logger.warning("Error while requesting URL: %s", e)
@@ -111,27 +194,211 @@ def validate_counter_api(pk):
         obj.core.duration = end - start
         obj.core.save()
         obj.save()
-        async_mail_admins.delay(
+        report_failure(
             "Validation failed",
             f"Validation {obj.id} failed: {obj.core.error_message}",
         )
         return
     finally:
+        if heartbeat:
+            heartbeat.lock = None
+        validation_finished(vm_url)
         lock.release()
 
-    end = time.monotonic()
+    queue_ingestion(obj, result_name, time.monotonic() - start)
+
+
+@celery.shared_task
+def run_next_validation():
+    """
+    Processes the next waiting validation as chosen by the scheduler (see `scheduling`).
+    """
+    if not (validation := claim_next_validation()):
+        logger.info("No waiting validation to process")
+        return
+    try:
+        # the heartbeat keeps the validation leased while it is being processed
+        with Heartbeat(validation.core_id) as heartbeat:
+            if validation.is_counter_api_validation:
+                validate_counter_api(validation.pk, heartbeat=heartbeat)
+            else:
+                validate_file(validation.pk, heartbeat=heartbeat)
+    except Exception as e:
+        validation.core.refresh_from_db()
+        validation.core.status = ValidationStatus.FAILURE
+        validation.core.error_message = str(e)
+        validation.core.save(update_fields=["status", "error_message", "last_updated"])
+        report_failure(
+            "Validation failed",
+            f"Validation {validation.pk} failed: {validation.core.error_message}",
+        )
+        raise
+
+
+def enqueue_validation():
+    """
+    Schedules a new validation once the current transaction is committed.
+    """
+    if settings.VALIDATION_DISPATCHER:
+        transaction.on_commit(wake_dispatcher)
+    else:
+        run_next_validation.delay_on_commit()
+
+
+def enqueue_validations(validations: list[Validation]):
+    """
+    Schedules new validations as one group of tasks once the current transaction is committed.
+    """
+    if settings.VALIDATION_DISPATCHER:
+        transaction.on_commit(wake_dispatcher)
+        return
+    group = celery.group(run_next_validation.si() for _ in validations)
+    transaction.on_commit(group.apply_async)
+
+
+def queue_ingestion(obj: Validation, result_name: str, duration: float):
+    """
+    Passes the stored response of the validation module to the ingestion queue, so that
+    the module (and the worker) may process another validation in the meantime.
+    """
+    # the result may wait in the ingestion queue for a while
+    ValidationCore.objects.filter(pk=obj.core_id, status=ValidationStatus.RUNNING).update(
+        lease_expires=timezone.now() + timedelta(seconds=settings.VALIDATION_INGESTION_TIMEOUT)
+    )
+    ingest_validation_result.delay(obj.pk, result_name, duration)
+
+
+@celery.shared_task
+def ingest_validation_result(pk: uuid.UUID, result_name: str, duration: float):
+    """
+    Stores the result of a validation from the response of the validation module stored by
+    `store_module_response`. The response is removed afterwards.
+    """
+    obj = Validation.objects.select_related("core").filter(pk=pk).first()
+    if obj and obj.is_counter_api_validation:
+        obj = CounterAPIValidation.objects.select_related("core").get(pk=pk)
+    if obj is None or obj.core.status != ValidationStatus.RUNNING:
+        # the validation was deleted or recovered (see `leases`) while the result was waiting
+        logger.warning("Validation %s is not running anymore, dropping its result", pk)
+        delete_module_response(result_name)
+        return
     try:
-        update_validation_result(obj, resp.json(), end - start)
+        with Heartbeat(obj.core_id):
+            update_validation_result(obj, load_module_response(result_name), duration)
     except Exception as e:
         obj.core.status = ValidationStatus.FAILURE
         obj.core.error_message = str(e)
+        obj.core.duration = duration
         obj.core.save(update_fields=["status", "error_message", "duration"])
-        async_mail_admins.delay(
+        report_failure(
             "Validation update failed",
             f"Validation {obj.id} update failed: {obj.core.error_message}",
         )
+    finally:
+        delete_module_response(result_name)
+    if isinstance(obj, CounterAPIValidation) and obj.is_sweep_report_list:
+        # right away, so that the batch does not look finished before the reports are added
+        sweep_counter_api(obj.pk)
+
+
+def get_report_codes(report_list: CounterAPIValidation) -> list[str]:
+    """
+    Returns codes of the reports listed by the `/reports` endpoint in the response stored by
+    the validation of `report_list`. The response is fetched by the validation module, the
+    COUNTER API (given by the user) is never requested from here.
+    """
+    if report_list.core.status != ValidationStatus.SUCCESS or not report_list.file:
+        raise ValueError("The validation of the /reports endpoint did not succeed")
+    with report_list.file.open("rb") as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError("The /reports endpoint did not return a list of reports")
+    max_length = CounterAPIValidation._meta.get_field("requested_report_code").max_length
+    return list(
+        dict.fromkeys(
+            code.upper()
+            for item in data
+            if isinstance(item, dict)
+            and isinstance(code := item.get("Report_ID"), str)
+            and 0 < len(code) <= max_length
+        )
+    )
+
+
+@celery.shared_task
+def sweep_counter_api(report_list_pk: uuid.UUID):
+    """
+    Creates and schedules validations of all the reports listed by the `/reports` endpoint
+    of a COUNTER API sweep. `report_list_pk` is the validation of the `/reports` endpoint
+    which is a part of the sweep batch - it is called once its result is ingested.
+    """
+    report_list = CounterAPIValidation.objects.select_related("core", "batch").get(
+        pk=report_list_pk
+    )
+    batch = report_list.batch
+    try:
+        report_codes = get_report_codes(report_list)
+    except Exception as e:
+        # the response is not a part of the message, it may contain anything
+        logger.warning("Could not get reports for sweep %s: %s", batch.pk, type(e).__name__)
+        batch.error_message = (
+            "Could not get the list of reports from the validation of the /reports endpoint"
+        )
+        batch.save(update_fields=["error_message", "last_updated"])
+        return
+    logger.info("Sweep %s: validating reports %s", batch.pk, report_codes)
+    with transaction.atomic():
+        enqueue_validations(
+            Validation.bulk_create_with_cores(
+                [report_list.build_report_validation(code) for code in report_codes]
+            )
+        )
 
 
 @celery.shared_task(base=ValidationTask)
 def expired_validations_cleanup():
     logger.info("Removed expired validations: %s", Validation.objects.expired().delete()[1])
+    # abandoned (and finalized) chunked uploads
+    threshold = timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_LIFETIME)
+    sessions = UploadSession.objects.filter(last_updated__lt=threshold)
+    for session in sessions:
+        session.delete_data()
+    logger.info("Removed expired upload sessions: %s", sessions.delete()[0])
+    batches = ValidationBatch.objects.filter(validations__isnull=True)
+    logger.info("Removed empty validation batches: %s", batches.delete()[0])
+    logger.info("Removed stale validation results: %s", delete_stale_module_responses())
+
+
+@celery.shared_task
+def mail_validation_failures():
+    """
+    Sends the summary of failed validations to the admins - see `notifications`.
+    """
+    if count := mail_failures():
+        logger.info("Reported validation failures: %s", count)
+
+
+@celery.shared_task
+def refresh_duration_model():
+    update_duration_model()
+
+
+@celery.shared_task
+def refresh_queue_estimates():
+    update_queue_estimates()
+
+
+@celery.shared_task
+def probe_validation_modules():
+    for result in probe_modules():
+        if not result["ok"]:
+            logger.warning("Validation module %s failed: %s", result["url"], result["error"])
+
+
+@celery.shared_task
+def reap_expired_leases():
+    """
+    Recovers validations whose worker died - see `leases`.
+    """
+    for _ in recover_expired_leases():
+        enqueue_validation()
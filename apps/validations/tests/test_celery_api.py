@@ -1,6 +1,11 @@
+from unittest.mock import patch
+
 import pytest
 from django.urls import reverse
 
+from validations.celery_queue import validation_started
+from validations.module_health import record_failure
+
 
 @pytest.mark.django_db
 class TestCeleryAPI:
@@ -19,7 +24,47 @@ class TestCeleryAPI:
         assert url == "/api/v1/validations/queue/"
         response = admin_client.get(url)
         assert response.status_code == 200
-        assert response.json() == {"queued": 0, "running": 0, "workers": expected_workers}
+        assert response.json() == {
+            "queued": 0,
+            "reserved": 0,
+            "running": 0,
+            "workers": expected_workers,
+            "modules": [
+                {
+                    "url": url,
+                    "validation": None,
+                    "started": None,
+                    "health": "closed",
+                    "latency": None,
+                    "last_error": "",
+                }
+                for url in validation_modules_urls
+            ],
+        }
+
+    def test_validation_queue_info_running(self, admin_client, settings):
+        settings.VALIDATION_MODULES_URLS = ["http://vm1/", "http://vm2/"]
+        with patch("validations.celery_queue.time.time", return_value=0):
+            validation_started("abc", "http://vm1/")
+        response = admin_client.get(reverse("validation-queue-info"))
+        assert response.status_code == 200
+        assert response.json()["running"] == 1
+        assert [
+            (rec["url"], rec["validation"], rec["started"]) for rec in response.json()["modules"]
+        ] == [
+            ("http://vm1/", "abc", "1970-01-01T00:00:00Z"),
+            ("http://vm2/", None, None),
+        ]
+
+    def test_validation_queue_info_health(self, admin_client, settings):
+        settings.VALIDATION_MODULES_URLS = ["http://vm1/"]
+        settings.VALIDATION_MODULE_FAILURE_THRESHOLD = 1
+        record_failure("http://vm1/", "Connection refused")
+        response = admin_client.get(reverse("validation-queue-info"))
+        assert response.status_code == 200
+        module = response.json()["modules"][0]
+        assert module["health"] == "open"
+        assert module["last_error"] == "Connection refused"
 
     @pytest.mark.parametrize(
         ["user_type", "can_access"],
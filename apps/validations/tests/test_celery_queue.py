@@ -1,25 +1,61 @@
+import time
+from types import SimpleNamespace
 from unittest.mock import patch
 
-import pytest
-from django_celery_results.models import TaskResult
+from validations.celery_queue import (
+    get_queue_state,
+    on_task_published,
+    on_task_received,
+    on_task_started,
+    validation_finished,
+    validation_started,
+)
 
-from validations.celery_queue import get_number_of_running_validations, get_validation_queue_length
+TASK_NAME = "validations.tasks.run_next_validation"
 
 
 class TestCeleryQueue:
-    def test_get_validation_queue_length(self):
-        with patch("validations.celery_queue.Redis") as redis_mock:
-            redis_mock.return_value.llen.return_value = 0
-            assert get_validation_queue_length() == 0
-            redis_mock.return_value.llen.assert_called_with("validation")
+    def test_task_lifecycle(self, settings):
+        settings.VALIDATION_MODULES_URLS = ["http://vm1/", "http://vm2/"]
+        for task_id in ("t1", "t2", "t3"):
+            on_task_published(sender=TASK_NAME, headers={"id": task_id})
+        on_task_published(sender="validations.tasks.sweep_counter_api", headers={"id": "t4"})
+        assert get_queue_state() == {
+            "queued": 3,
+            "reserved": 0,
+            "running": 0,
+            "modules": {"http://vm1/": None, "http://vm2/": None},
+        }
+        on_task_received(request=SimpleNamespace(name=TASK_NAME, id="t1"))
+        on_task_received(request=SimpleNamespace(name=TASK_NAME, id="t2"))
+        on_task_started(sender=SimpleNamespace(name=TASK_NAME), task_id="t1")
+        with patch("validations.celery_queue.time.time", return_value=1000.0):
+            validation_started("abc", "http://vm2/", "token")
+        state = get_queue_state()
+        assert (state["queued"], state["reserved"], state["running"]) == (1, 1, 1)
+        assert state["modules"] == {
+            "http://vm1/": None,
+            "http://vm2/": {"validation": "abc", "started": 1000.0, "token": "token"},
+        }
+        validation_finished("http://vm2/")
+        assert get_queue_state()["running"] == 0
 
-            redis_mock.return_value.llen.return_value = 1
-            assert get_validation_queue_length() == 1
-            redis_mock.return_value.llen.assert_called_with("validation")
+    def test_eager_task(self):
+        # eagerly run tasks are started without being published
+        on_task_started(sender=SimpleNamespace(name=TASK_NAME), task_id="t1")
+        assert get_queue_state()["reserved"] == 0
 
-    @pytest.mark.django_db
-    def test_get_number_of_running_validations(self):
-        assert get_number_of_running_validations() == 0
-        # create a task result with status "STARTED"
-        TaskResult.objects.create(task_id="123", status="STARTED")
-        assert get_number_of_running_validations() == 1
+    def test_redelivered_task(self):
+        # a task of a crashed worker is delivered to another worker
+        on_task_published(sender=TASK_NAME, headers={"id": "t1"})
+        on_task_received(request=SimpleNamespace(name=TASK_NAME, id="t1"))
+        on_task_received(request=SimpleNamespace(name=TASK_NAME, id="t1"))
+        state = get_queue_state()
+        assert (state["queued"], state["reserved"]) == (0, 1)
+
+    def test_stale_tasks(self, settings):
+        settings.VALIDATION_QUEUE_STATE_MAX_AGE = 60
+        with patch("validations.celery_queue.time.time", return_value=time.time() - 61):
+            on_task_published(sender=TASK_NAME, headers={"id": "lost"})
+        on_task_published(sender=TASK_NAME, headers={"id": "t1"})
+        assert get_queue_state()["queued"] == 1
@@ -0,0 +1,205 @@
+import asyncio
+import json
+from datetime import timedelta
+from unittest.mock import ANY, patch
+
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from core.fake_data import UserFactory
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils.timezone import now
+
+from validations.celery_queue import get_queue_state
+from validations.dispatcher import Dispatcher
+from validations.enums import ValidationStatus
+from validations.fake_data import CounterAPIValidationFactory, ValidationFactory
+from validations.models import Validation
+from validations.scheduling import wake_dispatcher
+from validations.storage import validation_result_storage
+from validations.tasks import enqueue_validation, ingest_validation_result
+from validations.tests.test_tasks import ResponseMock, ResponseMockCounterAPI
+from validations.validation_module_api import load_module_response
+from validations.validation_modules import (
+    create_validation_module_lock,
+    get_locking_redis,
+    lock_name,
+)
+
+VM_URL = "http://localhost:8180/"
+
+
+@pytest.fixture
+def dispatcher(settings):
+    settings.VALIDATION_MODULES_URLS = [VM_URL]
+    dispatcher = Dispatcher()
+    yield dispatcher
+    dispatcher.executor.shutdown()
+
+
+def dispatch_waiting(dispatcher: Dispatcher) -> int:
+    """
+    Dispatches the waiting validations and waits until the modules respond.
+    """
+
+    async def run():
+        tasks = await dispatcher.dispatch_waiting()
+        await asyncio.gather(*tasks)
+        return len(tasks)
+
+    return async_to_sync(run)()
+
+
+@pytest.mark.django_db
+class TestDispatcher:
+    def test_dispatch_file(self, settings, dispatcher, requests_mock):
+        settings.VALIDATION_INGESTION_TIMEOUT = 1000
+        obj = Validation.create_from_file(
+            user=UserFactory(), file=SimpleUploadedFile("tr.csv", b"test data")
+        )
+        mock = requests_mock.post(f"{VM_URL}file.php", json=ResponseMock.json())
+        with patch("validations.tasks.ingest_validation_result.delay") as delay:
+            assert dispatch_waiting(dispatcher) == 1
+        assert mock.last_request.qs == {"extension": ["csv"]}
+        delay.assert_called_once_with(obj.pk, ANY, ANY)
+        assert load_module_response(delay.call_args.args[1]) == ResponseMock.json()
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.RUNNING
+        # the lease covers the wait for the ingestion
+        assert obj.core.lease_expires > now() + timedelta(seconds=999)
+        # the module is free again
+        assert not get_locking_redis().exists(lock_name(VM_URL))
+        assert get_queue_state()["modules"] == {VM_URL: None}
+        assert dispatcher.dispatches == {}
+
+    def test_dispatch_counter_api(self, dispatcher, requests_mock):
+        obj = CounterAPIValidationFactory(core__status=ValidationStatus.WAITING)
+        mock = requests_mock.post(f"{VM_URL}api.php", json=ResponseMock.json())
+        with patch("validations.tasks.ingest_validation_result.delay") as delay:
+            assert dispatch_waiting(dispatcher) == 1
+        assert mock.last_request.json() == {"url": obj.get_url()}
+        delay.assert_called_once_with(obj.pk, ANY, ANY)
+
+    def test_dispatch_nothing_waiting(self, dispatcher, requests_mock):
+        mock = requests_mock.post(f"{VM_URL}file.php", json=ResponseMock.json())
+        assert dispatch_waiting(dispatcher) == 0
+        assert not mock.called
+        assert not get_locking_redis().exists(lock_name(VM_URL))
+
+    def test_dispatch_module_locked(self, dispatcher):
+        obj = ValidationFactory(core__status=ValidationStatus.WAITING)
+        create_validation_module_lock(VM_URL).acquire()
+        assert dispatch_waiting(dispatcher) == 0
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.WAITING
+
+    def test_dispatch_error(self, dispatcher, requests_mock):
+        obj = Validation.create_from_file(
+            user=UserFactory(), file=SimpleUploadedFile("tr.csv", b"test data")
+        )
+        requests_mock.post(f"{VM_URL}file.php", text="error", status_code=400)
+        with (
+            patch("validations.tasks.ingest_validation_result.delay") as delay,
+            patch("validations.dispatcher.report_failure") as report_failure,
+        ):
+            dispatch_waiting(dispatcher)
+        delay.assert_not_called()
+        report_failure.assert_called_once()
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.FAILURE
+        assert obj.core.error_message != ""
+        assert not any(
+            name.startswith(str(obj.pk)) for name in validation_result_storage().listdir("")[1]
+        )
+        assert not get_locking_redis().exists(lock_name(VM_URL))
+
+    def test_dispatch_module_failure_requeued(self, settings, dispatcher, requests_mock):
+        settings.VALIDATION_DISPATCHER = True
+        obj = Validation.create_from_file(
+            user=UserFactory(), file=SimpleUploadedFile("tr.csv", b"test data")
+        )
+        requests_mock.post(f"{VM_URL}file.php", status_code=503)
+        with patch("validations.tasks.run_next_validation.apply_async") as apply_async:
+            dispatch_waiting(dispatcher)
+        # the dispatcher picks the validation up by itself
+        apply_async.assert_not_called()
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.WAITING
+        assert obj.core.retries == 1
+        assert obj.core.retry_at is not None
+
+    def test_enqueue_wakes_dispatcher(self, settings, django_capture_on_commit_callbacks):
+        settings.VALIDATION_DISPATCHER = True
+        with (
+            patch("validations.tasks.wake_dispatcher") as wake,
+            patch("validations.tasks.run_next_validation.delay_on_commit") as delay,
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            enqueue_validation()
+        wake.assert_called_once_with()
+        delay.assert_not_called()
+
+    def test_listen(self, dispatcher):
+        async def run():
+            listener = asyncio.create_task(dispatcher.listen())
+            try:
+                # the listener may not be subscribed yet
+                while not dispatcher.wakeup.is_set():
+                    await sync_to_async(wake_dispatcher)()
+                    await asyncio.sleep(0.05)
+            finally:
+                listener.cancel()
+
+        async_to_sync(asyncio.wait_for)(run(), 5)
+
+
+@pytest.mark.django_db
+class TestIngestion:
+    @pytest.fixture
+    def result_name(self):
+        def store(data):
+            return validation_result_storage().save(
+                "result.json", ContentFile(json.dumps(data).encode())
+            )
+
+        return store
+
+    def test_ingest_file_result(self, result_name):
+        obj = ValidationFactory(core__status=ValidationStatus.RUNNING)
+        name = result_name(ResponseMock.json())
+        ingest_validation_result(obj.pk, name, 1.5)
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.SUCCESS
+        assert obj.core.duration == 1.5
+        assert obj.core.used_memory == ResponseMock.json()["memory"]
+        assert not validation_result_storage().exists(name)
+
+    def test_ingest_counter_api_result(self, result_name):
+        obj = CounterAPIValidationFactory(core__status=ValidationStatus.RUNNING)
+        ingest_validation_result(obj.pk, result_name(ResponseMockCounterAPI.json()), 1.5)
+        obj.refresh_from_db()
+        assert obj.core.status == ValidationStatus.SUCCESS
+        # the decoded report is stored
+        assert obj.core.file_size > 0
+        assert obj.file
+
+    def test_ingest_invalid_result(self):
+        obj = ValidationFactory(core__status=ValidationStatus.RUNNING)
+        name = validation_result_storage().save("result.json", ContentFile(b"not json"))
+        with patch("validations.tasks.report_failure") as report_failure:
+            ingest_validation_result(obj.pk, name, 1.5)
+        report_failure.assert_called_once()
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.FAILURE
+        assert not validation_result_storage().exists(name)
+
+    def test_ingest_not_running(self, result_name):
+        """
+        The result of a validation which was recovered in the meantime is dropped
+        """
+        obj = ValidationFactory(core__status=ValidationStatus.WAITING)
+        name = result_name(ResponseMock.json())
+        ingest_validation_result(obj.pk, name, 1.5)
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.WAITING
+        assert not validation_result_storage().exists(name)
@@ -0,0 +1,60 @@
+import pytest
+from django.core.cache import cache
+
+from validations.enums import ValidationStatus
+from validations.estimation import (
+    DURATION_MODEL_CACHE_KEY,
+    DurationModel,
+    get_duration_model,
+)
+from validations.fake_data import ValidationCoreFactory
+
+
+@pytest.mark.django_db
+class TestDurationModel:
+    def test_build(self):
+        for size in (100, 200, 300, 400, 500):
+            ValidationCoreFactory(
+                status=ValidationStatus.SUCCESS,
+                file_format="csv",
+                file_size=size,
+                duration=1 + size / 100,
+            )
+        # too few samples for a regression
+        for size, duration in ((100, 4), (1000, 6)):
+            ValidationCoreFactory(
+                status=ValidationStatus.SUCCESS,
+                file_format="json",
+                file_size=size,
+                duration=duration,
+            )
+        for duration in (10, 20):
+            ValidationCoreFactory(
+                status=ValidationStatus.SUCCESS,
+                sushi_credentials_checksum="x",
+                file_size=1000 * duration,
+                duration=duration,
+            )
+        # unfinished and failed validations are ignored
+        ValidationCoreFactory(status=ValidationStatus.FAILURE, file_format="csv", duration=100)
+        model = DurationModel.build()
+        assert model.predict("csv", 1000) == pytest.approx(11)
+        assert model.predict("json", 1_000_000) == pytest.approx(5)
+        assert model.predict("", 0) == pytest.approx(15)
+        assert model.predict("xlsx", 100) == pytest.approx(60 / 9)
+
+    def test_fit_negative_slope(self):
+        samples = [(100, 5), (200, 4), (300, 3), (400, 2), (500, 1)]
+        assert DurationModel.fit(samples, regression=True) == (3, 0)
+
+    def test_predict_not_negative(self):
+        assert DurationModel(coefficients={"csv": (-5, 0.001)}).predict("csv", 100) == 0
+
+    def test_no_data(self):
+        assert DurationModel.build().predict("csv", 100) is None
+
+    def test_cached(self, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            get_duration_model()
+            get_duration_model()
+        assert isinstance(cache.get(DURATION_MODEL_CACHE_KEY), DurationModel)
@@ -0,0 +1,24 @@
+import io
+
+import pytest
+
+from validations.hashing import checksum_bytes, checksum_fileobj
+
+
+class TestChecksumFileobj:
+    @pytest.mark.parametrize(
+        "make_file",
+        [
+            lambda content, path: io.BytesIO(content),
+            lambda content, path: io.StringIO(content.decode("utf-8")),
+            lambda content, path: path.open("rb"),
+        ],
+    )
+    def test_checksum(self, tmp_path, make_file):
+        content = b"Report_Header\n" * 100_000 + "žluťoučký kůň".encode()
+        path = tmp_path / "report.csv"
+        path.write_bytes(content)
+        fileobj = make_file(content, path)
+        fileobj.seek(10)
+        assert checksum_fileobj(fileobj) == (checksum_bytes(content), len(content))
+        assert fileobj.tell() == 10, "position is restored"
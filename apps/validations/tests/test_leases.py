@@ -0,0 +1,140 @@
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.utils.timezone import now
+
+from validations.celery_queue import get_queue_state, validation_started
+from validations.enums import ValidationStatus
+from validations.fake_data import ValidationFactory
+from validations.leases import Heartbeat, recover_expired_leases, renew_lease
+from validations.models import ValidationCore
+from validations.scheduling import claim_next_validation
+from validations.tasks import reap_expired_leases
+from validations.validation_modules import (
+    create_validation_module_lock,
+    get_locking_redis,
+    lock_name,
+    lock_token,
+)
+
+VM_URL = "http://vm1/"
+
+
+@pytest.mark.django_db
+class TestLeases:
+    def test_claim_leases_validation(self, settings):
+        settings.VALIDATION_LEASE_TIMEOUT = 100
+        ValidationFactory(core__status=ValidationStatus.WAITING)
+        validation = claim_next_validation()
+        remaining = validation.core.lease_expires - now()
+        assert timedelta(seconds=99) < remaining <= timedelta(seconds=100)
+
+    def test_renew_lease(self, settings):
+        settings.VALIDATION_LEASE_TIMEOUT = 100
+        validation = ValidationFactory(
+            core__status=ValidationStatus.RUNNING, core__lease_expires=now()
+        )
+        assert renew_lease(validation.core_id)
+        validation.core.refresh_from_db()
+        assert validation.core.lease_expires > now() + timedelta(seconds=99)
+        finished = ValidationFactory(core__status=ValidationStatus.SUCCESS)
+        assert not renew_lease(finished.core_id)
+
+    def test_heartbeat_extends_lock(self, settings):
+        settings.VALIDATION_MODULE_LOCK_TIMEOUT = 100
+        validation = ValidationFactory(core__status=ValidationStatus.RUNNING)
+        lock = create_validation_module_lock(VM_URL)
+        lock.acquire(blocking=False)
+        redis = get_locking_redis()
+        redis.pexpire(lock_name(VM_URL), 1000)
+        heartbeat = Heartbeat(validation.core_id)
+        heartbeat.lock = lock
+        # the heartbeat runs in its own thread, the lease is tested separately
+        with patch("validations.leases.renew_lease"):
+            thread = threading.Thread(target=heartbeat.beat)
+            thread.start()
+            thread.join()
+        assert redis.pttl(lock_name(VM_URL)) > 99_000
+        lock.release()
+
+    def test_heartbeat_thread(self):
+        with (
+            patch.object(Heartbeat, "interval", return_value=0.01),
+            patch.object(Heartbeat, "beat") as beat,
+        ):
+            with Heartbeat("abc") as heartbeat:
+                assert heartbeat.stopped.wait(0.2) is False
+            assert beat.call_count > 1
+            assert not heartbeat.thread.is_alive()
+
+    def test_recover_expired_leases(self, settings):
+        settings.VALIDATION_MAX_RETRIES = 1
+        settings.VALIDATION_MODULES_URLS = [VM_URL]
+        expired = ValidationFactory(
+            core__status=ValidationStatus.RUNNING,
+            core__lease_expires=now() - timedelta(seconds=1),
+        )
+        exhausted = ValidationFactory(
+            core__status=ValidationStatus.RUNNING,
+            core__lease_expires=now() - timedelta(seconds=1),
+            core__retries=1,
+        )
+        leased = ValidationFactory(
+            core__status=ValidationStatus.RUNNING,
+            core__lease_expires=now() + timedelta(seconds=10),
+        )
+        lock = create_validation_module_lock(VM_URL)
+        lock.acquire(blocking=False)
+        validation_started(expired.pk, VM_URL, lock_token(lock))
+
+        assert [core.pk for core in recover_expired_leases()] == [expired.core_id]
+        statuses = dict(ValidationCore.objects.values_list("pk", "status"))
+        assert statuses == {
+            expired.core_id: ValidationStatus.WAITING,
+            exhausted.core_id: ValidationStatus.FAILURE,
+            leased.core_id: ValidationStatus.RUNNING,
+        }
+        assert ValidationCore.objects.get(pk=expired.core_id).retries == 1
+        # the module used by the validation is free again
+        assert get_queue_state()["modules"] == {VM_URL: None}
+        assert not get_locking_redis().exists(lock_name(VM_URL))
+
+    def test_recover_keeps_lock_taken_over(self):
+        """
+        When the lock of the module expired and was acquired for another validation, recovering
+        the original validation must not release it.
+        """
+        expired = ValidationFactory(
+            core__status=ValidationStatus.RUNNING,
+            core__lease_expires=now() - timedelta(seconds=1),
+        )
+        old_lock = create_validation_module_lock(VM_URL)
+        old_lock.acquire(blocking=False)
+        validation_started(expired.pk, VM_URL, lock_token(old_lock))
+        # the lock expires and another validation takes the module
+        get_locking_redis().delete(lock_name(VM_URL))
+        new_lock = create_validation_module_lock(VM_URL)
+        assert new_lock.acquire(blocking=False)
+
+        recover_expired_leases()
+        assert new_lock.owned()
+
+    def test_recover_validations_without_lease(self, settings):
+        settings.VALIDATION_LEASE_TIMEOUT = 100
+        old = ValidationFactory(core__status=ValidationStatus.RUNNING)
+        ValidationCore.objects.filter(pk=old.core_id).update(
+            last_updated=now() - timedelta(seconds=101)
+        )
+        ValidationFactory(core__status=ValidationStatus.RUNNING)
+        assert [core.pk for core in recover_expired_leases()] == [old.core_id]
+
+    def test_reap_expired_leases_task(self):
+        ValidationFactory(
+            core__status=ValidationStatus.RUNNING,
+            core__lease_expires=now() - timedelta(seconds=1),
+        )
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as delay:
+            reap_expired_leases()
+        delay.assert_called_once_with()
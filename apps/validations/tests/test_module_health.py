@@ -0,0 +1,98 @@
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from validations.enums import CircuitState
+from validations.module_health import (
+    get_health_redis,
+    get_module_health,
+    is_module_available,
+    is_module_failure,
+    probe_modules,
+    record_failure,
+    record_success,
+)
+from validations.validation_modules import get_available_validation_module_url
+
+VM_URL = "http://vm1/"
+
+
+def http_error(status_code: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+class TestModuleHealth:
+    @pytest.mark.parametrize(
+        ["exc", "failure"],
+        [
+            (requests.ConnectionError(), True),
+            (requests.Timeout(), True),
+            (http_error(503), True),
+            (http_error(500), False),
+            (http_error(400), False),
+            (ValueError(), False),
+        ],
+    )
+    def test_is_module_failure(self, exc, failure):
+        assert is_module_failure(exc) is failure
+
+    def test_circuit_breaker(self, settings):
+        settings.VALIDATION_MODULE_FAILURE_THRESHOLD = 2
+        settings.VALIDATION_MODULE_OPEN_TIMEOUT = 60
+        redis = get_health_redis()
+        record_failure(VM_URL, "error")
+        assert get_module_health(VM_URL)["state"] == CircuitState.CLOSED
+        assert is_module_available(VM_URL, redis)
+        record_failure(VM_URL, "error")
+        assert get_module_health(VM_URL)["state"] == CircuitState.OPEN
+        assert not is_module_available(VM_URL, redis)
+
+        with patch("validations.module_health.time.time", return_value=time.time() + 61):
+            assert get_module_health(VM_URL)["state"] == CircuitState.HALF_OPEN
+            # only one validation tries the module
+            assert is_module_available(VM_URL, redis)
+            assert not is_module_available(VM_URL, redis)
+            # failed trial opens the circuit again
+            record_failure(VM_URL, "error")
+            assert get_module_health(VM_URL)["state"] == CircuitState.OPEN
+
+        with patch("validations.module_health.time.time", return_value=time.time() + 122):
+            assert is_module_available(VM_URL, redis)
+            record_success(VM_URL)
+            assert get_module_health(VM_URL)["state"] == CircuitState.CLOSED
+            assert get_module_health(VM_URL)["failures"] == 0
+            assert is_module_available(VM_URL, redis)
+
+    def test_latency(self):
+        record_success(VM_URL, 1.0)
+        assert get_module_health(VM_URL)["latency"] == 1.0
+        record_success(VM_URL, 2.0)
+        assert get_module_health(VM_URL)["latency"] == pytest.approx(1.3)
+
+    def test_probe_modules(self, settings, requests_mock):
+        settings.VALIDATION_MODULES_URLS = ["http://vm1/", "http://vm2/"]
+        requests_mock.get("http://vm1/", json={"version": "1.0"})
+        requests_mock.get("http://vm2/", status_code=503)
+        results = probe_modules()
+        assert [(result["url"], result["ok"]) for result in results] == [
+            ("http://vm1/", True),
+            ("http://vm2/", False),
+        ]
+        assert results[0]["data"] == {"version": "1.0"}
+        assert get_module_health("http://vm1/")["latency"] is not None
+        assert get_module_health("http://vm2/")["failures"] == 1
+
+    def test_available_module(self, settings):
+        settings.VALIDATION_MODULES_URLS = ["http://vm1/", "http://vm2/", "http://vm3/"]
+        settings.VALIDATION_MODULE_FAILURE_THRESHOLD = 2
+        record_failure("http://vm1/", "error")
+        record_failure("http://vm1/", "error")
+        record_failure("http://vm2/", "error")
+        # the failing module is skipped, the recently failed one is used as the last resort
+        assert get_available_validation_module_url() == "http://vm3/"
+        settings.VALIDATION_MODULES_URLS = ["http://vm1/", "http://vm2/"]
+        assert get_available_validation_module_url() == "http://vm2/"
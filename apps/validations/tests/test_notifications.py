@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+from django.core import mail
+from redis import RedisError
+
+from validations.notifications import mail_failures, report_failure
+
+
+class TestNotifications:
+    def test_failures_are_aggregated(self, settings):
+        settings.ADMINS = [("Admin", "admin@example.com")]
+        for i in range(3):
+            report_failure("Validation failed", f"Validation {i} failed: 503 Server Error")
+        report_failure("Validation update failed", "Validation 3 update failed: boom")
+        assert mail.outbox == []
+        assert mail_failures() == 4
+        assert len(mail.outbox) == 1
+        body = mail.outbox[0].body
+        assert "Validation failures (4)" in mail.outbox[0].subject
+        assert body.startswith("3x Validation failed\n1x Validation update failed\n")
+        assert "Validation 3 update failed: boom" in body
+        # the reported failures are sent only once
+        assert mail_failures() == 0
+        assert len(mail.outbox) == 1
+
+    def test_long_summary(self, settings):
+        settings.ADMINS = [("Admin", "admin@example.com")]
+        with patch("validations.notifications.MAX_LISTED_FAILURES", 2):
+            for i in range(5):
+                report_failure("Validation failed", f"Validation {i} failed")
+            mail_failures()
+        body = mail.outbox[0].body
+        assert "Validation 1 failed" in body
+        assert "Validation 2 failed" not in body
+        assert body.endswith("... and 3 more")
+
+    def test_redis_error(self):
+        with (
+            patch("validations.notifications.get_notification_redis") as get_redis,
+            patch("validations.notifications.async_mail_admins.delay") as mail_admins,
+        ):
+            get_redis.return_value.rpush.side_effect = RedisError("down")
+            report_failure("Validation failed", "Validation 1 failed")
+        mail_admins.assert_called_once_with("Validation failed", "Validation 1 failed")
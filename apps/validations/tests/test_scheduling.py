@@ -0,0 +1,170 @@
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from core.fake_data import UserFactory
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from validations.celery_queue import validation_started
+from validations.enums import ValidationPriority, ValidationStatus
+from validations.estimation import DurationModel
+from validations.fake_data import ValidationFactory
+from validations.models import ValidationCore
+from validations.scheduling import (
+    QueueEstimate,
+    claim_next_validation,
+    estimate_queue,
+    get_queue_estimates,
+    update_queue_estimates,
+    waiting_queue,
+)
+
+
+@pytest.mark.django_db
+class TestScheduling:
+    @classmethod
+    def create(cls, user, minutes_ago: int, **kwargs):
+        validation = ValidationFactory(
+            core__user=user, core__status=ValidationStatus.WAITING, **kwargs
+        )
+        validation.core.created = now() - timedelta(minutes=minutes_ago)
+        validation.core.save()
+        return validation
+
+    def test_priority(self):
+        user = UserFactory()
+        bulk = self.create(user, 10, core__priority=ValidationPriority.BULK)
+        api = self.create(user, 5, core__priority=ValidationPriority.API)
+        interactive = self.create(user, 1, core__priority=ValidationPriority.INTERACTIVE)
+        assert list(waiting_queue().values_list("pk", flat=True)) == [
+            interactive.core_id,
+            api.core_id,
+            bulk.core_id,
+        ]
+
+    def test_users_round_robin(self):
+        user1, user2 = UserFactory(), UserFactory()
+        # user1 submitted a lot of validations before user2
+        first = [self.create(user1, minutes) for minutes in (10, 9, 8)]
+        second = [self.create(user2, minutes) for minutes in (5, 4)]
+        assert list(waiting_queue().values_list("pk", flat=True)) == [
+            v.core_id for v in (first[0], second[0], first[1], second[1], first[2])
+        ]
+
+    def test_running_validations_count(self):
+        user1, user2 = UserFactory(), UserFactory()
+        ValidationFactory(core__user=user1, core__status=ValidationStatus.RUNNING)
+        waiting1 = self.create(user1, 10)
+        waiting2 = self.create(user2, 5)
+        assert list(waiting_queue().values_list("pk", flat=True)) == [
+            waiting2.core_id,
+            waiting1.core_id,
+        ]
+
+    def test_retry_delay(self):
+        user = UserFactory()
+        retried = self.create(user, 10, core__retry_at=now() + timedelta(seconds=30))
+        waiting = self.create(user, 5, core__retry_at=now() - timedelta(seconds=1))
+        assert list(waiting_queue().values_list("pk", flat=True)) == [waiting.core_id]
+        retried.core.retry_at = now()
+        retried.core.save()
+        assert list(waiting_queue().values_list("pk", flat=True)) == [
+            retried.core_id,
+            waiting.core_id,
+        ]
+
+    def test_claim_next_validation(self):
+        user = UserFactory()
+        later = self.create(user, 1)
+        sooner = self.create(user, 2)
+        claimed = claim_next_validation()
+        assert claimed.pk == sooner.pk
+        assert claimed.core.status == ValidationStatus.RUNNING
+        assert claim_next_validation().pk == later.pk
+        assert claim_next_validation() is None
+
+    @pytest.mark.django_db(transaction=True)
+    def test_claim_skips_locked_candidates(self):
+        first = self.create(UserFactory(), 2)
+        second = self.create(UserFactory(), 1)
+        locked, release = threading.Event(), threading.Event()
+
+        def claim_elsewhere():
+            # another worker in the middle of claiming the first validation
+            with transaction.atomic():
+                ValidationCore.objects.select_for_update().get(pk=first.core_id)
+                locked.set()
+                release.wait(5)
+            connection.close()
+
+        thread = threading.Thread(target=claim_elsewhere)
+        thread.start()
+        try:
+            assert locked.wait(5)
+            with patch("validations.scheduling.CLAIM_CANDIDATES", 1):
+                assert claim_next_validation().pk == second.pk
+        finally:
+            release.set()
+            thread.join()
+
+    def test_estimate_queue(self, settings):
+        settings.VALIDATION_MODULES_URLS = ["http://vm1/", "http://vm2/"]
+        user = UserFactory()
+        first, second, third = (
+            self.create(user, minutes, core__file_format="csv", core__file_size=100)
+            for minutes in (3, 2, 1)
+        )
+        ValidationFactory(core__user=user, core__status=ValidationStatus.SUCCESS)
+        model = DurationModel(coefficients={"csv": (10.0, 0.1)})
+        current_time = now()
+        with (
+            patch("validations.scheduling.get_duration_model", return_value=model),
+            patch("validations.scheduling.now", return_value=current_time),
+        ):
+            estimates = estimate_queue()
+        later = current_time + timedelta(seconds=20)
+        assert estimates == {
+            first.core_id: QueueEstimate(1, current_time, later),
+            second.core_id: QueueEstimate(2, current_time, later),
+            third.core_id: QueueEstimate(3, later, later + timedelta(seconds=20)),
+        }
+
+    def test_estimate_queue_running(self, settings):
+        settings.VALIDATION_MODULES_URLS = ["http://vm1/"]
+        running = ValidationFactory(
+            core__status=ValidationStatus.RUNNING, core__file_format="csv", core__file_size=0
+        )
+        waiting = self.create(UserFactory(), 1, core__file_format="json", core__file_size=0)
+        current_time = now()
+        started = current_time - timedelta(seconds=5)
+        with patch("validations.celery_queue.time.time", return_value=started.timestamp()):
+            validation_started(running.pk, "http://vm1/")
+        model = DurationModel(coefficients={"csv": (30.0, 0.0)}, default=10.0)
+        with (
+            patch("validations.scheduling.get_duration_model", return_value=model),
+            patch("validations.scheduling.now", return_value=current_time),
+        ):
+            estimates = estimate_queue()
+        finish = started + timedelta(seconds=30)
+        assert estimates == {
+            running.core_id: QueueEstimate(None, started, finish),
+            waiting.core_id: QueueEstimate(1, finish, finish + timedelta(seconds=10)),
+        }
+
+    def test_estimate_queue_without_data(self):
+        waiting = self.create(UserFactory(), 1)
+        assert estimate_queue() == {waiting.core_id: QueueEstimate(1, None, None)}
+
+    def test_cached_queue_estimates(self):
+        waiting = self.create(UserFactory(), 1)
+        finished = ValidationFactory(core__status=ValidationStatus.SUCCESS)
+        assert get_queue_estimates([waiting.core_id]) == {}
+        assert update_queue_estimates() == 1
+        # the estimates are only read, not computed again
+        with patch("validations.scheduling.estimate_queue") as estimate:
+            assert get_queue_estimates([waiting.core_id, finished.core_id]) == {
+                waiting.core_id: QueueEstimate(1, None, None)
+            }
+        estimate.assert_not_called()
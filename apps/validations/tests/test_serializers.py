@@ -1,6 +1,10 @@
 import pytest
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
 
-from validations.serializers import FileValidationCreateSerializer
+from validations.fake_data import CounterAPIValidationFactory
+from validations.models import Validation
+from validations.serializers import FileValidationCreateSerializer, ValidationDetailSerializer
 
 
 class TestFileValidationCreateSerializer:
@@ -16,3 +20,16 @@ class TestFileValidationCreateSerializer:
     def test_file_type_detection(self, filetype, filename):
         with open(f"test_data/reports/{filename}", "rb") as f:
             assert FileValidationCreateSerializer.file_to_type(f) == filetype
+
+
+@pytest.mark.django_db
+class TestValidationDetailSerializer:
+    def test_full_url_queries(self, django_assert_num_queries):
+        validations = CounterAPIValidationFactory.create_batch(3)
+        request = Request(APIRequestFactory().get("/", {"fields": "id,full_url"}))
+        serializer = ValidationDetailSerializer(context={"request": request})
+        # the validations and their COUNTER API data, but nothing per validation
+        with django_assert_num_queries(2):
+            qs = serializer.optimize_queryset(Validation.objects.order_by("core__created"))
+            data = ValidationDetailSerializer(qs, many=True, context={"request": request}).data
+        assert [rec["full_url"] for rec in data] == [v.get_url() for v in validations]
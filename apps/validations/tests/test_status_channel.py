@@ -0,0 +1,49 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from validations.enums import ValidationStatus
+from validations.fake_data import ValidationCoreFactory
+from validations.status_channel import StatusSubscription, get_pubsub_redis, publish_status
+
+
+class TestStatusSubscription:
+    def test_status_change(self):
+        with StatusSubscription("foo") as subscription:
+            timer = threading.Timer(0.1, publish_status, ("foo", ValidationStatus.SUCCESS))
+            timer.start()
+            start = time.monotonic()
+            assert subscription.wait(ValidationStatus.RUNNING, 5) is True
+            assert time.monotonic() - start < 5
+            timer.join()
+
+    def test_same_status_is_ignored(self):
+        with StatusSubscription("foo") as subscription:
+            publish_status("foo", ValidationStatus.RUNNING)
+            publish_status("bar", ValidationStatus.SUCCESS)
+            assert subscription.wait(ValidationStatus.RUNNING, 0.3) is False
+
+    def test_client_reused(self):
+        get_pubsub_redis.cache_clear()
+        with patch("validations.status_channel.Redis.from_url") as from_url:
+            publish_status("foo", ValidationStatus.RUNNING)
+            publish_status("foo", ValidationStatus.SUCCESS)
+        from_url.assert_called_once()
+        get_pubsub_redis.cache_clear()
+
+
+@pytest.mark.django_db
+class TestStatusPublishing:
+    def test_status_published_on_commit(self, django_capture_on_commit_callbacks):
+        with patch("validations.models.publish_status") as publish:
+            with django_capture_on_commit_callbacks(execute=True):
+                core = ValidationCoreFactory(status=ValidationStatus.WAITING)
+                core.status = ValidationStatus.RUNNING
+                core.save(update_fields=["status"])
+                core.save(update_fields=["expiration_date"])
+            assert [c.args for c in publish.call_args_list] == [
+                (core.pk, ValidationStatus.WAITING),
+                (core.pk, ValidationStatus.RUNNING),
+            ]
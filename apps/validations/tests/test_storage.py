@@ -0,0 +1,78 @@
+import gzip
+import json
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+from django.core.files.base import ContentFile
+
+from validations.fake_data import ValidationFactory
+from validations.storage import CompressedFileSystemStorage
+from validations.validation_module_api import (
+    delete_module_response,
+    delete_stale_module_responses,
+    load_module_response,
+    store_module_response,
+)
+
+
+class TestCompressedFileSystemStorage:
+    @pytest.fixture
+    def storage(self, tmp_path):
+        return CompressedFileSystemStorage(location=tmp_path)
+
+    def test_save_and_open(self, storage, tmp_path):
+        content = b"Report_Header,Value\n" * 10_000
+        name = storage.save(storage.generate_filename("tr.csv"), ContentFile(content))
+        assert name == "tr.csv.gz"
+        stored = (tmp_path / name).read_bytes()
+        assert len(stored) < len(content) / 10
+        assert gzip.decompress(stored) == content
+        assert storage.size(name) == len(content)
+        with storage.open(name) as f:
+            assert f.size == len(content)
+            assert f.read(100) == content[:100]
+            # reopening starts from the beginning
+            assert f.open().read() == content
+
+    def test_uncompressed_file(self, storage, tmp_path):
+        (tmp_path / "tr.csv").write_bytes(b"xxx")
+        assert storage.size("tr.csv") == 3
+        with storage.open("tr.csv") as f:
+            assert f.read() == b"xxx"
+
+    def test_open_for_writing(self, storage):
+        name = storage.save(storage.generate_filename("tr.csv"), ContentFile(b"xxx"))
+        with pytest.raises(ValueError):
+            storage.open(name, "wb")
+
+    @pytest.mark.django_db
+    def test_store_module_response(self, storage, tmp_path, requests_mock):
+        data = {"result": {"messages": [{"m": "Report header is messed up"}] * 1000}}
+        requests_mock.post("http://vm/file.php", json=data)
+        validation = ValidationFactory()
+        with (
+            patch("validations.validation_module_api.validation_result_storage") as get_storage,
+            requests.post("http://vm/file.php", stream=True) as response,
+        ):
+            get_storage.return_value = storage
+            name = store_module_response(validation, response)
+            assert name == f"{validation.pk}.json.gz"
+            assert (tmp_path / name).stat().st_size < len(json.dumps(data)) / 10
+            assert load_module_response(name) == data
+            delete_module_response(name)
+        assert not (tmp_path / name).exists()
+
+    def test_delete_stale_module_responses(self, storage, tmp_path, settings):
+        settings.VALIDATION_INGESTION_TIMEOUT = 60
+        stale = storage.save(storage.generate_filename("stale.json"), ContentFile(b"{}"))
+        fresh = storage.save(storage.generate_filename("fresh.json"), ContentFile(b"{}"))
+        modified = time.time() - 61
+        os.utime(tmp_path / stale, (modified, modified))
+        with patch("validations.validation_module_api.validation_result_storage") as get_storage:
+            get_storage.return_value = storage
+            assert delete_stale_module_responses() == 1
+        assert not storage.exists(stale)
+        assert storage.exists(fresh)
@@ -2,19 +2,34 @@
 File and SUSHI validation tests.
 """
 
+import json
 import re
 from base64 import b64encode
-from unittest.mock import patch
+from datetime import timedelta
+from unittest.mock import ANY, patch
 from zlib import compress
 
 import pytest
+import requests
 from core.fake_data import UserFactory
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils.timezone import now
 
 from validations.enums import SeverityLevel, ValidationStatus
 from validations.fake_data import CounterAPIValidationFactory
-from validations.models import Validation
-from validations.tasks import validate_counter_api, validate_file
+from validations.hashing import checksum_bytes
+from validations.models import CounterAPIValidation, Validation, ValidationBatch
+from validations.module_health import get_module_health
+from validations.storage import validation_result_storage
+from validations.tasks import (
+    ingest_validation_result,
+    run_next_validation,
+    sweep_counter_api,
+    validate_counter_api,
+    validate_file,
+)
+from validations.validation_module_api import decode_report_file
 
 
 class ResponseMock:
@@ -74,9 +89,9 @@ class TestFileValidationTask:
         obj = Validation.create_from_file(user=UserFactory(), file=file)
         json = ResponseMock.json()
         mock = requests_mock.post(re.compile(".*"), json=json, status_code=200)
-        with patch("validations.validation_module_api.async_mail_admins") as mock_mail_admins:
+        with patch("validations.validation_module_api.report_failure") as report_failure:
             validate_file(obj.pk)
-            assert mock_mail_admins.call_count == 0
+            assert report_failure.call_count == 0
             assert mock.call_count == 1
             obj.refresh_from_db()
         assert obj.core.status == ValidationStatus.SUCCESS
@@ -124,6 +139,39 @@ class TestFileValidationTask:
         assert obj.core.duration > 0
         assert obj.core.error_message != ""
 
+    @pytest.mark.parametrize(
+        "response",
+        [{"status_code": 503}, {"exc": requests.ConnectionError("Connection refused")}],
+    )
+    def test_task_module_failure_requeued(self, settings, response, requests_mock):
+        settings.VALIDATION_MAX_RETRIES = 1
+        obj = Validation.create_from_file(
+            user=UserFactory(), file=SimpleUploadedFile("tr.csv", b"test data")
+        )
+        settings.VALIDATION_RETRY_BACKOFF = 10
+        requests_mock.post(re.compile(".*"), **response)
+        with patch("validations.tasks.run_next_validation.apply_async") as apply_async:
+            validate_file(obj.pk)
+            apply_async.assert_called_once_with(countdown=ANY)
+        countdown = apply_async.call_args.kwargs["countdown"]
+        assert 0 <= countdown <= 10
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.WAITING
+        assert obj.core.retries == 1
+        expected_retry = now() + timedelta(seconds=countdown)
+        assert abs(obj.core.retry_at - expected_retry) < timedelta(seconds=1)
+        assert get_module_health("http://localhost:8180/")["failures"] == 1
+        # the validation is not returned to the queue forever
+        with (
+            patch("validations.tasks.run_next_validation.apply_async") as apply_async,
+            patch("validations.tasks.report_failure") as report_failure,
+        ):
+            validate_file(obj.pk)
+            apply_async.assert_not_called()
+            report_failure.assert_called_once()
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.FAILURE
+
     def test_task_result_save_error(self, requests_mock):
         """
         Test that when the task crashed during save of the model, the status will
@@ -134,9 +182,9 @@ class TestFileValidationTask:
         obj.core.status = ValidationStatus.WAITING
         obj.core.save()
         with patch("validations.tasks.requests.post") as mock:
-            # raise exception when json is called which should break the task
+            # raise exception when the response is read which should break the task
             # after the request status is checked
-            mock.return_value.json.side_effect = Exception("test")
+            mock.return_value.iter_content.side_effect = Exception("test")
             validate_file(obj.pk)
             assert mock.call_count == 1
         obj.refresh_from_db()
@@ -276,3 +324,166 @@ class TestCounterAPIValidationTask:
         assert mock.called_once
         sent_url = mock.last_request.json()["url"]
         assert sent_url.startswith(url)
+
+
+@pytest.mark.django_db
+class TestSweepCounterAPITask:
+    @pytest.fixture
+    def report_list(self):
+        def create(content: bytes | None, status=ValidationStatus.SUCCESS):
+            batch = ValidationBatch.objects.create(user=UserFactory(), sweep=True)
+            obj = CounterAPIValidationFactory(
+                url="https://sushi.example.com/",
+                core__api_endpoint="/reports",
+                core__status=status,
+                core__user=batch.user,
+                requested_cop_version="5.1",
+                batch=batch,
+            )
+            if content is not None:
+                obj.file.save("reports.json", ContentFile(content))
+            return obj
+
+        return create
+
+    def test_sweep(self, report_list, django_capture_on_commit_callbacks):
+        data = [{"Report_ID": "TR"}, {"Report_ID": "dr_d1"}, {"Report_ID": "TR"}, {"x": 1}]
+        report_list = report_list(json.dumps(data).encode())
+        with (
+            patch("celery.group.apply_async") as apply_async,
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            sweep_counter_api(report_list.pk)
+        apply_async.assert_called_once()
+        reports = CounterAPIValidation.objects.filter(
+            batch=report_list.batch, core__api_endpoint="/reports/[id]"
+        ).select_related("core")
+        assert sorted(v.requested_report_code for v in reports) == ["DR_D1", "TR"]
+        for validation in reports:
+            assert validation.url == report_list.url
+            assert validation.credentials == report_list.credentials
+            assert validation.requested_begin_date == report_list.requested_begin_date
+            assert validation.core.user == report_list.core.user
+            assert validation.core.status == ValidationStatus.WAITING
+            assert "/r51/reports/" in validation.get_url()
+
+    @pytest.mark.parametrize(
+        "content,status",
+        [
+            (None, ValidationStatus.FAILURE),
+            (b"secret response", ValidationStatus.SUCCESS),
+            (b'{"Code": 2000}', ValidationStatus.SUCCESS),
+        ],
+    )
+    def test_sweep_report_list_error(
+        self, report_list, content, status, django_capture_on_commit_callbacks
+    ):
+        report_list = report_list(content, status)
+        with (
+            patch("celery.group.apply_async") as apply_async,
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            sweep_counter_api(report_list.pk)
+        apply_async.assert_not_called()
+        report_list.batch.refresh_from_db()
+        assert report_list.batch.error_message.startswith("Could not get the list of reports")
+        # the response is not shown to the user
+        assert "secret" not in report_list.batch.error_message
+        assert CounterAPIValidation.objects.count() == 1
+
+    def test_sweep_after_ingestion(self, report_list):
+        report_list = report_list(None, ValidationStatus.RUNNING)
+        name = validation_result_storage().save("result.json", ContentFile(b"{}"))
+        with (
+            patch("validations.tasks.update_validation_result"),
+            patch("validations.tasks.sweep_counter_api") as sweep,
+        ):
+            ingest_validation_result(report_list.pk, name, 1.0)
+        sweep.assert_called_once_with(report_list.pk)
+
+    def test_no_sweep_of_ordinary_batch(self, report_list):
+        report_list = report_list(None, ValidationStatus.RUNNING)
+        ValidationBatch.objects.update(sweep=False)
+        name = validation_result_storage().save("result.json", ContentFile(b"{}"))
+        with (
+            patch("validations.tasks.update_validation_result"),
+            patch("validations.tasks.sweep_counter_api") as sweep,
+        ):
+            ingest_validation_result(report_list.pk, name, 1.0)
+        sweep.assert_not_called()
+
+
+@pytest.mark.django_db
+class TestRunNextValidationTask:
+    def test_runs_file_validation(self):
+        obj = Validation.create_from_file(
+            user=UserFactory(), file=SimpleUploadedFile("tr.csv", b"test data")
+        )
+        with (
+            patch("validations.tasks.validate_file") as validate_file_mock,
+            patch("validations.tasks.validate_counter_api") as validate_counter_api_mock,
+        ):
+            run_next_validation()
+        validate_file_mock.assert_called_once_with(obj.pk, heartbeat=ANY)
+        validate_counter_api_mock.assert_not_called()
+
+    def test_runs_counter_api_validation(self):
+        obj = CounterAPIValidationFactory(core__status=ValidationStatus.WAITING)
+        with patch("validations.tasks.validate_counter_api") as validate_counter_api_mock:
+            run_next_validation()
+        validate_counter_api_mock.assert_called_once_with(obj.pk, heartbeat=ANY)
+
+    def test_failure(self):
+        obj = Validation.create_from_file(
+            user=UserFactory(), file=SimpleUploadedFile("tr.csv", b"test data")
+        )
+        last_updated = obj.core.last_updated
+        with (
+            patch("validations.tasks.validate_file", side_effect=Exception("boom")),
+            patch("validations.tasks.report_failure") as report_failure,
+            pytest.raises(Exception, match="boom"),
+        ):
+            run_next_validation()
+        report_failure.assert_called_once()
+        obj.core.refresh_from_db()
+        assert obj.core.status == ValidationStatus.FAILURE
+        assert obj.core.error_message == "boom"
+        assert obj.core.last_updated > last_updated
+
+    def test_nothing_to_run(self):
+        with patch("validations.tasks.validate_file") as validate_file_mock:
+            run_next_validation()
+        validate_file_mock.assert_not_called()
+
+
+class TestDecodeReportFile:
+    @pytest.mark.parametrize("chunk_size", [8, 1024, 1024 * 1024])
+    def test_decode(self, chunk_size):
+        with open("test_data/reports/50-Sample-TR.json", "rb") as infile:
+            content = infile.read()
+        report = b64encode(compress(content, 3)).decode()
+        with patch("validations.validation_module_api.REPORT_DECODE_CHUNK_SIZE", chunk_size):
+            report_file = decode_report_file(report)
+        assert report_file.read() == content
+        assert report_file.size == len(content)
+        assert report_file.checksum == checksum_bytes(content)
+
+    @pytest.mark.parametrize("chunk_size", [7, 1024])
+    def test_decode_with_whitespace(self, chunk_size):
+        content = b"Report_Header,Value\n" * 100
+        encoded = b64encode(compress(content)).decode()
+        # e.g. MIME style line breaks
+        report = "\r\n".join(encoded[i : i + 76] for i in range(0, len(encoded), 76)) + "\n"
+        with patch("validations.validation_module_api.REPORT_DECODE_CHUNK_SIZE", chunk_size):
+            report_file = decode_report_file(report)
+        assert report_file.read() == content
+
+    @pytest.mark.parametrize("report", ["eJyrAAAAeQB5!", "eJyrAAAAeQB5A"])
+    def test_invalid_base64(self, report):
+        with pytest.raises(ValueError):
+            decode_report_file(report)
+
+    def test_truncated(self):
+        report = b64encode(compress(b"x" * 1000)[:-8]).decode()
+        with pytest.raises(ValueError):
+            decode_report_file(report)
@@ -1,19 +1,24 @@
+import gzip
+import hashlib
 import os
+import time
+import uuid
 from datetime import date, datetime, timedelta
 from unittest.mock import patch
 from urllib.parse import parse_qs, urlsplit
-from uuid import UUID, uuid4
+from uuid import uuid4
 
 import factory
 import pytest
 from core.fake_data import UserFactory
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.urls import reverse
+from django.urls import resolve, reverse
 from django.utils.timezone import make_aware, now, timezone
 from freezegun import freeze_time
 
 import validations.tasks
-from validations.enums import SeverityLevel
+from validations.enums import SeverityLevel, ValidationStatus
 from validations.fake_data import (
     CounterAPICredentialsFactory,
     CounterAPIValidationFactory,
@@ -21,7 +26,16 @@ from validations.fake_data import (
     ValidationFactory,
     ValidationMessageFactory,
 )
-from validations.models import CounterAPIValidation, Validation, ValidationCore
+from validations.hashing import checksum_bytes
+from validations.models import (
+    CounterAPIValidation,
+    Validation,
+    ValidationBatch,
+    ValidationCore,
+    upload_hashers,
+)
+from validations.scheduling import update_queue_estimates
+from validations.storage import CompressedFileSystemStorage
 
 expected_validation_keys = {
     "api_endpoint",
@@ -31,12 +45,15 @@ expected_validation_keys = {
     "credentials",
     "data_source",
     "error_message",
+    "estimated_finish",
+    "estimated_start",
     "expiration_date",
     "file_size",
     "file_url",
     "filename",
     "id",
     "public_id",
+    "queue_position",
     "report_code",
     "requested_begin_date",
     "requested_cop_version",
@@ -119,6 +136,244 @@ class TestValidationAPI:
             assert "full_url" in data
             assert data["full_url"] == v.get_url()
 
+    def test_validation_list_fields(
+        self, client_authenticated_user, normal_user, django_assert_max_num_queries
+    ):
+        ValidationFactory.create_batch(3, core__user=normal_user)
+        CounterAPIValidationFactory.create_batch(2, core__user=normal_user)
+        with django_assert_max_num_queries(8) as ctx:
+            res = client_authenticated_user.get(
+                reverse("validation-list"), {"fields": "id,status,data_source"}
+            )
+        assert res.status_code == 200
+        assert len(res.json()["results"]) == 5
+        for rec in res.json()["results"]:
+            assert set(rec.keys()) == {"id", "status", "data_source"}
+        sql = "\n".join(query["sql"] for query in ctx.captured_queries)
+        # neither the heavy columns nor the COUNTER API specific data are loaded
+        assert "result_data" not in sql
+        assert "file_size" not in sql
+        assert "validations_counterapivalidation" not in sql
+
+    def test_validation_list_omit(self, client_authenticated_user, normal_user):
+        CounterAPIValidationFactory(core__user=normal_user)
+        res = client_authenticated_user.get(
+            reverse("validation-list"), {"omit": "credentials,stats, url"}
+        )
+        assert res.status_code == 200
+        rec = res.json()["results"][0]
+        assert set(rec.keys()) == expected_validation_keys - {"credentials", "stats", "url"}
+        assert rec["requested_report_code"]
+
+    def test_validation_list_fields_counter_api(
+        self, client_authenticated_user, normal_user, django_assert_max_num_queries
+    ):
+        v = CounterAPIValidationFactory(core__user=normal_user)
+        with django_assert_max_num_queries(9) as ctx:
+            res = client_authenticated_user.get(
+                reverse("validation-list"), {"fields": "id,url,requested_report_code"}
+            )
+        assert res.status_code == 200
+        assert res.json()["results"] == [
+            {"id": str(v.pk), "url": v.url, "requested_report_code": v.requested_report_code}
+        ]
+        # only the needed columns of the COUNTER API validation are prefetched
+        (prefetch,) = [
+            query["sql"]
+            for query in ctx.captured_queries
+            if 'FROM "validations_counterapivalidation"' in query["sql"]
+        ]
+        assert "result_data" not in prefetch
+        assert "credentials" not in prefetch
+
+    def test_validation_detail_fields(self, client_authenticated_user, normal_user):
+        v = CounterAPIValidationFactory(core__user=normal_user)
+        res = client_authenticated_user.get(
+            reverse("validation-detail", args=[v.pk]), {"fields": "id,full_url,user"}
+        )
+        assert res.status_code == 200
+        data = res.json()
+        assert set(data.keys()) == {"id", "full_url", "user"}
+        assert data["full_url"] == v.get_url()
+        assert data["user"]["id"] == normal_user.pk
+
+    @pytest.mark.parametrize(
+        ["status", "waits"],
+        [
+            (ValidationStatus.WAITING, True),
+            (ValidationStatus.RUNNING, True),
+            (ValidationStatus.SUCCESS, False),
+            (ValidationStatus.FAILURE, False),
+        ],
+    )
+    def test_validation_detail_wait(self, client_authenticated_user, normal_user, status, waits):
+        v = ValidationFactory(core__user=normal_user, core__status=status)
+        with patch(
+            "validations.views.ValidationViewSet.wait_for_status_change", return_value=False
+        ) as wait_mock:
+            res = client_authenticated_user.get(
+                reverse("validation-detail", args=[v.pk]), {"wait": 10}
+            )
+        assert res.status_code == 200
+        assert res.json()["status"] == status
+        assert wait_mock.called is waits
+        if waits:
+            assert wait_mock.call_args.args[2] == 10
+
+    def test_validation_detail_wait_timeout(self, client_authenticated_user, normal_user):
+        v = ValidationFactory(core__user=normal_user, core__status=ValidationStatus.WAITING)
+        start = time.monotonic()
+        res = client_authenticated_user.get(
+            reverse("validation-detail", args=[v.pk]), {"wait": 0.3}
+        )
+        assert res.status_code == 200
+        assert res.json()["status"] == ValidationStatus.WAITING
+        assert time.monotonic() - start >= 0.3
+
+    @pytest.mark.parametrize(
+        ["url_name", "non_atomic"],
+        [
+            ("validation-detail", True),
+            ("validation-validation-status", True),
+            ("validation-publish", False),
+        ],
+    )
+    def test_long_poll_not_atomic(self, url_name, non_atomic):
+        view = resolve(reverse(url_name, args=[uuid.uuid4()])).func
+        assert ("default" in getattr(view, "_non_atomic_requests", set())) is non_atomic
+
+    def test_validation_detail_wait_capped(self, client_authenticated_user, normal_user, settings):
+        settings.VALIDATION_STATUS_MAX_WAIT = 2
+        v = ValidationFactory(core__user=normal_user, core__status=ValidationStatus.RUNNING)
+        with patch(
+            "validations.views.ValidationViewSet.wait_for_status_change", return_value=False
+        ) as wait_mock:
+            res = client_authenticated_user.get(
+                reverse("validation-detail", args=[v.pk]), {"wait": 1000}
+            )
+        assert res.status_code == 200
+        assert wait_mock.call_args.args[2] == 2
+
+    def test_validation_detail_wait_invalid(self, client_authenticated_user, normal_user):
+        v = ValidationFactory(core__user=normal_user)
+        res = client_authenticated_user.get(
+            reverse("validation-detail", args=[v.pk]), {"wait": "x"}
+        )
+        assert res.status_code == 400
+
+    def test_validation_status(
+        self, client_authenticated_user, normal_user, django_assert_max_num_queries
+    ):
+        v = ValidationFactory(
+            core__user=normal_user,
+            core__status=ValidationStatus.SUCCESS,
+            core__stats={"Warning": 2},
+        )
+        v.core.refresh_from_db()
+        # savepoint + session + user + the status itself + savepoint release
+        with django_assert_max_num_queries(5):
+            res = client_authenticated_user.get(
+                reverse("validation-validation-status", args=[v.pk])
+            )
+        assert res.status_code == 200
+        assert res.json() == {
+            "id": str(v.pk),
+            "status": ValidationStatus.SUCCESS,
+            "validation_result": v.core.get_validation_result_display(),
+            "stats": v.core.stats,
+            "queue_position": None,
+            "estimated_start": None,
+            "estimated_finish": None,
+        }
+
+    def test_validation_status_waiting(self, client_authenticated_user, normal_user, settings):
+        settings.VALIDATION_MODULES_URLS = ["http://localhost:8180/"]
+        ValidationFactory(core__status=ValidationStatus.SUCCESS, core__duration=10)
+        ValidationFactory(core__user=normal_user, core__status=ValidationStatus.WAITING)
+        v = ValidationFactory(core__user=normal_user, core__status=ValidationStatus.WAITING)
+        update_queue_estimates()
+        res = client_authenticated_user.get(reverse("validation-validation-status", args=[v.pk]))
+        assert res.status_code == 200
+        data = res.json()
+        assert data["queue_position"] == 2
+        start = datetime.fromisoformat(data["estimated_start"])
+        finish = datetime.fromisoformat(data["estimated_finish"])
+        assert finish - start == timedelta(seconds=10)
+        assert timedelta(seconds=9) < start - now() <= timedelta(seconds=10)
+
+    def test_validation_estimates(self, client_authenticated_user, normal_user):
+        v = ValidationFactory(core__user=normal_user, core__status=ValidationStatus.WAITING)
+        ValidationFactory(core__user=normal_user, core__status=ValidationStatus.SUCCESS)
+        update_queue_estimates()
+        res = client_authenticated_user.get(reverse("validation-list"))
+        assert res.status_code == 200
+        positions = {rec["id"]: rec["queue_position"] for rec in res.json()["results"]}
+        assert positions.pop(str(v.pk)) == 1
+        assert list(positions.values()) == [None]
+
+    @pytest.mark.parametrize(
+        ["user_type", "owner", "public", "use_public_id", "status_code"],
+        [
+            ("normal", True, False, False, 200),
+            ("normal", False, False, False, 404),
+            ("normal", False, True, False, 404),
+            ("normal", False, True, True, 200),
+            ("admin", False, False, False, 200),
+            ("su", False, False, False, 200),
+            ("api_key_normal", True, False, False, 200),
+            ("api_key_normal", False, False, False, 404),
+            ("unauthenticated", False, False, False, 404),
+            ("unauthenticated", False, True, False, 404),
+            ("unauthenticated", False, True, True, 200),
+        ],
+    )
+    def test_validation_status_visibility(
+        self, users_and_clients, normal_user, user_type, owner, public, use_public_id, status_code
+    ):
+        v = ValidationFactory(
+            core__user=normal_user if owner else UserFactory(),
+            public_id=uuid4() if public else None,
+        )
+        client = users_and_clients[user_type][1]
+        res = client.get(
+            reverse("validation-validation-status", args=[v.public_id if use_public_id else v.pk])
+        )
+        assert res.status_code == status_code
+        if status_code == 200:
+            assert res.json()["id"] == str(v.pk)
+
+    @pytest.mark.parametrize("use_public_id", [False, True])
+    def test_validation_status_expired(self, client_authenticated_user, normal_user, use_public_id):
+        v = ValidationFactory(
+            core__user=normal_user,
+            core__expiration_date=now() - timedelta(hours=1),
+            public_id=uuid4(),
+        )
+        res = client_authenticated_user.get(
+            reverse("validation-validation-status", args=[v.public_id if use_public_id else v.pk])
+        )
+        assert res.status_code == 404
+
+    def test_validation_status_invalid_id(self, client_authenticated_user):
+        res = client_authenticated_user.get(reverse("validation-validation-status", args=["foo"]))
+        assert res.status_code == 404
+
+    @pytest.mark.parametrize(
+        ["status", "waits"], [(ValidationStatus.RUNNING, True), (ValidationStatus.FAILURE, False)]
+    )
+    def test_validation_status_wait(self, client_authenticated_user, normal_user, status, waits):
+        v = ValidationFactory(core__user=normal_user, core__status=status)
+        with patch(
+            "validations.views.ValidationViewSet.wait_for_status_change", return_value=True
+        ) as wait_mock:
+            res = client_authenticated_user.get(
+                reverse("validation-validation-status", args=[v.pk]), {"wait": 5}
+            )
+        assert res.status_code == 200
+        assert wait_mock.called is waits
+        if waits:
+            assert wait_mock.call_args.args == (v.core_id, status, 5)
+
     def test_validation_detail_other_users(self, client_authenticated_user):
         v = ValidationFactory()  # this belongs to some randomly created user
         res = client_authenticated_user.get(reverse("validation-detail", args=[v.pk]))
@@ -722,6 +977,19 @@ class TestValidationAPI:
             "is_validator_admin",
         }
 
+    def test_all_validations_endpoint_fields(
+        self, normal_user, client_validator_admin_user, django_assert_max_num_queries
+    ):
+        ValidationFactory.create_batch(3, core__user=normal_user)
+        with django_assert_max_num_queries(8):
+            res = client_validator_admin_user.get(
+                reverse("validation-list-all"), {"fields": "id,user"}
+            )
+        assert res.status_code == 200
+        for rec in res.json()["results"]:
+            assert set(rec.keys()) == {"id", "user"}
+            assert rec["user"]["email"] == normal_user.email
+
     def test_validation_export(self, client_authenticated_user, normal_user):
         v = ValidationFactory.create(core__user=normal_user)
         res = client_authenticated_user.get(reverse("validation-export", args=[v.pk]))
@@ -769,14 +1037,14 @@ class TestFileValidationAPI:
         settings.VALIDATION_LIFETIME = 1
         filename = "tr.json"
         file = SimpleUploadedFile(filename, content=b"xxx")
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("validation-file"),
                 data={"file": file, "user_note": "test"},
                 format="multipart",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
         assert res.json()["filename"] == filename
         val = Validation.objects.select_related("core").get()
         assert val.filename == filename
@@ -788,9 +1056,34 @@ class TestFileValidationAPI:
         ), "We only compare the first 16 characters"
         assert res.json()["api_endpoint"] == "", "api_endpoint should be empty for file validations"
 
+    @pytest.mark.parametrize("max_memory_size", [2_621_440, 10])
+    def test_create_checksum_computed_during_upload(
+        self, client_authenticated_user, settings, max_memory_size
+    ):
+        """
+        The checksum and the file type are computed from the data received by the upload
+        handlers - both for files kept in memory and those stored in a temporary file.
+        """
+        settings.FILE_UPLOAD_MAX_MEMORY_SIZE = max_memory_size
+        with open("test_data/reports/50-Sample-TR.json", "rb") as f:
+            content = f.read()
+        file = SimpleUploadedFile("tr.json", content=content)
+        with (
+            patch("validations.tasks.run_next_validation.delay_on_commit"),
+            patch("validations.hashing.checksum_fileobj") as checksum_fileobj,
+        ):
+            res = client_authenticated_user.post(
+                reverse("validation-file"), data={"file": file}, format="multipart"
+            )
+        assert res.status_code == 201
+        checksum_fileobj.assert_not_called()
+        core = ValidationCore.objects.get()
+        assert core.file_size == len(content)
+        assert core.file_checksum == checksum_bytes(content)
+
     def test_create_with_empty_file(self, client_authenticated_user):
         file = SimpleUploadedFile("tr.json", content=b"")
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("validation-file"),
                 data={"file": file},
@@ -803,7 +1096,7 @@ class TestFileValidationAPI:
     def test_create_with_too_large_a_file(self, settings, client_authenticated_user):
         settings.FILE_SIZE_LIMITS = {"default": 1023}
         file = SimpleUploadedFile("tr.json", content=b"X" * 1024)
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("validation-file"),
                 data={"file": file},
@@ -813,17 +1106,99 @@ class TestFileValidationAPI:
         assert res.status_code == 400
         assert res.json()["file"][0].startswith("Max file size for type")
 
+    def test_create_with_compressed_file(self, client_authenticated_user):
+        with open("test_data/reports/50-Sample-TR.json", "rb") as f:
+            content = f.read()
+        file = SimpleUploadedFile("tr.json.gz", content=gzip.compress(content))
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
+            res = client_authenticated_user.post(
+                reverse("validation-file"), data={"file": file}, format="multipart"
+            )
+            p.assert_called_once()
+        assert res.status_code == 201
+        assert res.json()["filename"] == "tr.json"
+        val = Validation.objects.select_related("core").get()
+        assert val.file.read() == content
+        assert val.core.file_size == len(content)
+        assert val.core.file_checksum == checksum_bytes(content)
+
+    @pytest.mark.parametrize(
+        "content,error",
+        [
+            (b"not compressed", "Invalid compressed file"),
+            (gzip.compress(b"X" * 2000), "Max file size exceeded"),
+            (gzip.compress(b""), "The submitted file is empty."),
+        ],
+    )
+    def test_create_with_invalid_compressed_file(
+        self, settings, client_authenticated_user, content, error
+    ):
+        settings.FILE_SIZE_LIMITS = {"default": 1000}
+        file = SimpleUploadedFile("tr.json.gz", content=content)
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
+            res = client_authenticated_user.post(
+                reverse("validation-file"), data={"file": file}, format="multipart"
+            )
+            p.assert_not_called()
+        assert res.status_code == 400
+        assert res.json()["file"][0].startswith(error)
+
+    def test_download(self, client_authenticated_user, normal_user):
+        validation = ValidationFactory(core__user=normal_user)
+        res = client_authenticated_user.get(reverse("validation-download", args=[validation.pk]))
+        assert res.status_code == 200
+        assert b"".join(res.streaming_content) == validation.file.open("rb").read()
+        assert int(res["Content-Length"]) == validation.file.size
+
+    def test_download_other_user(self, client_authenticated_user):
+        validation = ValidationFactory()
+        res = client_authenticated_user.get(reverse("validation-download", args=[validation.pk]))
+        assert res.status_code == 404
+
+    @pytest.fixture
+    def compressed_storage(self, tmp_path):
+        # the storage of the field is instantiated when the model is defined
+        field = Validation._meta.get_field("file")
+        with patch.object(field, "storage", CompressedFileSystemStorage(location=tmp_path)):
+            yield field.storage
+
+    def test_download_compressed(
+        self, compressed_storage, client_authenticated_user, client_unauthenticated, normal_user
+    ):
+        validation = ValidationFactory(core__user=normal_user)
+        content = b"test data"
+        validation.file.save("tr.csv", ContentFile(content))
+        assert validation.file.name.endswith(".gz")
+        validation.publish()
+        own_url = client_authenticated_user.get(
+            reverse("validation-detail", args=[validation.pk])
+        ).json()["file_url"]
+        assert own_url == reverse("validation-download", args=[validation.pk])
+        # the public view links to the file by the public id
+        for url in (
+            reverse("public-validation-detail", args=[validation.public_id]),
+            reverse("validation-detail", args=[validation.public_id]),
+        ):
+            res = client_unauthenticated.get(url)
+            assert res.status_code == 200
+            public_url = res.json()["file_url"]
+            assert public_url == reverse("validation-download", args=[validation.public_id])
+            res = client_unauthenticated.get(public_url)
+            assert res.status_code == 200
+            assert b"".join(res.streaming_content) == content
+            assert int(res["Content-Length"]) == len(content)
+
     def test_create_with_api_key(self, client_with_api_key, normal_user):
         filename = "tr.json"
         file = SimpleUploadedFile(filename, content=b"xxx")
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_with_api_key.post(
                 reverse("validation-file"),
                 data={"file": file, "user_note": "test"},
                 format="multipart",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
         assert res.json()["filename"] == filename
         val = Validation.objects.select_related("core").get()
         assert val.filename == filename
@@ -837,7 +1212,7 @@ class TestFileValidationAPI:
         user = UserFactory(verified_email=False)
         client.force_login(user)
         file = SimpleUploadedFile("tr.json", content=b"xxx")
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client.post(
                 reverse("validation-file"),
                 data={"file": file},
@@ -850,7 +1225,7 @@ class TestFileValidationAPI:
         settings.FILE_SIZE_LIMITS = {"default": 1023}
         with open("test_data/reports/50-Sample-TR.json", "rb") as f:
             file = SimpleUploadedFile("tr.json", f.read())
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("validation-file"),
                 data={"file": file},
@@ -863,7 +1238,7 @@ class TestFileValidationAPI:
     def test_create_with_file_type_limit_unknown_type(self, settings, client_authenticated_user):
         settings.FILE_SIZE_LIMITS = {"default": 1023}
         file = SimpleUploadedFile("tr.json", b"x" * 1024)
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("validation-file"),
                 data={"file": file},
@@ -888,7 +1263,7 @@ class TestFileValidationAPI:
         settings.FILE_SIZE_LIMITS = {"default": 1023}
         with open(f"test_data/reports/{filename}", "rb") as f:
             file = SimpleUploadedFile(filename, f.read())
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("validation-file"),
                 data={"file": file},
@@ -901,6 +1276,349 @@ class TestFileValidationAPI:
             )
 
 
+@pytest.mark.django_db
+class TestUploadSessionAPI:
+    @pytest.fixture
+    def content(self, settings, tmp_path):
+        settings.UPLOAD_SESSION_DIR = str(tmp_path)
+        with open("test_data/reports/50-Sample-TR.json", "rb") as f:
+            return f.read()
+
+    @classmethod
+    def put_chunk(cls, client, session_id, content, start, end, **headers):
+        return client.put(
+            reverse("upload-chunk", args=[session_id]),
+            data=content[start:end],
+            content_type="application/octet-stream",
+            headers={"Content-Range": f"bytes {start}-{end - 1}/{len(content)}", **headers},
+        )
+
+    def test_upload(self, client_authenticated_user, content, django_capture_on_commit_callbacks):
+        res = client_authenticated_user.post(
+            reverse("upload-list"),
+            data={"filename": "tr.json", "size": len(content), "user_note": "test"},
+        )
+        assert res.status_code == 201
+        session_id = res.json()["id"]
+        assert res.json()["received"] == 0
+        half = len(content) // 2
+        res = self.put_chunk(client_authenticated_user, session_id, content, 0, half)
+        assert res.status_code == 200
+        assert res.json()["received"] == half
+        res = self.put_chunk(
+            client_authenticated_user,
+            session_id,
+            content,
+            half,
+            len(content),
+            **{"X-Chunk-Checksum": hashlib.sha256(content[half:]).hexdigest()},
+        )
+        assert res.status_code == 200
+        assert res.json()["received"] == len(content)
+        with (
+            patch("validations.tasks.run_next_validation.delay_on_commit") as p,
+            patch("validations.hashing.checksum_fileobj") as checksum_fileobj,
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            res = client_authenticated_user.post(reverse("upload-finalize", args=[session_id]))
+            assert res.status_code == 201
+            p.assert_called_once_with()
+        # the data was hashed as it was received
+        checksum_fileobj.assert_not_called()
+        assert session_id not in {str(pk) for pk in upload_hashers}
+        val = Validation.objects.select_related("core").get()
+        assert val.filename == "tr.json"
+        assert val.user_note == "test"
+        assert val.file.read() == content
+        assert val.core.file_size == len(content)
+        assert val.core.file_checksum == checksum_bytes(content)
+        assert client_authenticated_user.get(reverse("upload-detail", args=[session_id])).json()[
+            "validation"
+        ] == str(val.pk)
+
+    def test_upload_chunks_received_elsewhere(self, client_authenticated_user, content):
+        res = client_authenticated_user.post(
+            reverse("upload-list"), data={"filename": "tr.json", "size": len(content)}
+        )
+        session_id = res.json()["id"]
+        half = len(content) // 2
+        self.put_chunk(client_authenticated_user, session_id, content, 0, half)
+        # the first chunk was received by another process
+        upload_hashers.clear()
+        self.put_chunk(client_authenticated_user, session_id, content, half, len(content))
+        with patch("validations.tasks.run_next_validation.delay_on_commit"):
+            res = client_authenticated_user.post(reverse("upload-finalize", args=[session_id]))
+            assert res.status_code == 201
+        val = Validation.objects.select_related("core").get()
+        assert val.core.file_checksum == checksum_bytes(content)
+
+    def test_resume_from_wrong_offset(self, client_authenticated_user, content):
+        res = client_authenticated_user.post(
+            reverse("upload-list"), data={"filename": "tr.json", "size": len(content)}
+        )
+        session_id = res.json()["id"]
+        self.put_chunk(client_authenticated_user, session_id, content, 0, 100)
+        res = self.put_chunk(client_authenticated_user, session_id, content, 200, 300)
+        assert res.status_code == 409
+        assert res.json() == {"received": 100}
+        # the same chunk sent again is also rejected
+        res = self.put_chunk(client_authenticated_user, session_id, content, 0, 100)
+        assert res.status_code == 409
+
+    def test_chunk_checksum_mismatch(self, client_authenticated_user, content):
+        res = client_authenticated_user.post(
+            reverse("upload-list"), data={"filename": "tr.json", "size": len(content)}
+        )
+        session_id = res.json()["id"]
+        res = self.put_chunk(
+            client_authenticated_user,
+            session_id,
+            content,
+            0,
+            100,
+            **{"X-Chunk-Checksum": hashlib.sha256(b"foo").hexdigest()},
+        )
+        assert res.status_code == 400
+        assert res.json() == ["Chunk checksum does not match"]
+        # the chunk may be sent again
+        res = self.put_chunk(client_authenticated_user, session_id, content, 0, 100)
+        assert res.status_code == 200
+        assert res.json()["received"] == 100
+
+    @pytest.mark.parametrize(
+        "content_range", ["", "bytes 0-99", "bytes 0-99/10", "bytes 50-10/1000", "items 0-9/1000"]
+    )
+    def test_invalid_content_range(self, client_authenticated_user, content, content_range):
+        res = client_authenticated_user.post(
+            reverse("upload-list"), data={"filename": "tr.json", "size": 1000}
+        )
+        res = client_authenticated_user.put(
+            reverse("upload-chunk", args=[res.json()["id"]]),
+            data=content[:100],
+            content_type="application/octet-stream",
+            headers={"Content-Range": content_range},
+        )
+        assert res.status_code == 400
+        assert "Content-Range" in res.json()
+
+    def test_finalize_incomplete(self, client_authenticated_user, content):
+        res = client_authenticated_user.post(
+            reverse("upload-list"), data={"filename": "tr.json", "size": len(content)}
+        )
+        session_id = res.json()["id"]
+        self.put_chunk(client_authenticated_user, session_id, content, 0, 100)
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
+            res = client_authenticated_user.post(reverse("upload-finalize", args=[session_id]))
+            p.assert_not_called()
+        assert res.status_code == 400
+        assert not Validation.objects.exists()
+
+    def test_too_large_file(self, client_authenticated_user, settings):
+        settings.FILE_SIZE_LIMITS = {"default": 1000}
+        res = client_authenticated_user.post(
+            reverse("upload-list"), data={"filename": "tr.json", "size": 1001}
+        )
+        assert res.status_code == 400
+        assert "size" in res.json()
+
+    def test_other_user(self, client_authenticated_user, client_validator_admin_user, content):
+        res = client_authenticated_user.post(
+            reverse("upload-list"), data={"filename": "tr.json", "size": len(content)}
+        )
+        session_id = res.json()["id"]
+        other_client = client_validator_admin_user
+        assert other_client.get(reverse("upload-detail", args=[session_id])).status_code == 404
+        res = self.put_chunk(other_client, session_id, content, 0, 100)
+        assert res.status_code == 404
+
+    def test_unauthenticated(self, client_unauthenticated):
+        res = client_unauthenticated.post(
+            reverse("upload-list"), data={"filename": "tr.json", "size": 1000}
+        )
+        assert res.status_code == 403
+
+
+@pytest.mark.django_db
+class TestValidationBatchAPI:
+    def test_create_from_files(
+        self, client_with_api_key, normal_user, django_capture_on_commit_callbacks
+    ):
+        files = [SimpleUploadedFile(f"tr{i}.json", content=b"x" * (i + 1)) for i in range(3)]
+        with (
+            patch("celery.group.apply_async") as apply_async,
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            res = client_with_api_key.post(
+                reverse("validation-batch-list"),
+                data={"files": files, "user_note": "batch"},
+                format="multipart",
+            )
+            assert res.status_code == 201
+        apply_async.assert_called_once()
+        data = res.json()
+        assert data["status"] == ValidationStatus.WAITING
+        assert data["status_counts"] == {"waiting": 3, "running": 0, "success": 0, "failure": 0}
+        validations = Validation.objects.select_related("core").order_by("filename")
+        assert [v.filename for v in validations] == ["tr0.json", "tr1.json", "tr2.json"]
+        assert {v["id"] for v in data["validations"]} == {str(v.pk) for v in validations}
+        for i, validation in enumerate(validations):
+            assert str(validation.batch_id) == data["id"]
+            assert validation.user_note == "batch"
+            assert validation.file.read() == b"x" * (i + 1)
+            assert validation.core.user == normal_user
+            assert validation.core.file_size == i + 1
+            assert validation.core.file_checksum == checksum_bytes(b"x" * (i + 1))
+            assert validation.core.expiration_date is not None
+            assert validation.core.api_key_prefix != ""
+
+    def test_create_from_counter_api(
+        self, client_authenticated_user, django_capture_on_commit_callbacks
+    ):
+        specs = [
+            factory.build(dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory)
+            for _ in range(2)
+        ]
+        with (
+            patch("celery.group.apply_async") as apply_async,
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            res = client_authenticated_user.post(
+                reverse("validation-batch-list"), data={"counter_api": specs}, format="json"
+            )
+            assert res.status_code == 201
+        apply_async.assert_called_once()
+        assert res.json()["status_counts"]["waiting"] == 2
+        validations = CounterAPIValidation.objects.select_related("core").order_by("url")
+        assert len(validations) == 2
+        for validation, spec in zip(
+            validations, sorted(specs, key=lambda spec: spec["url"]), strict=True
+        ):
+            assert validation.url == spec["url"]
+            assert validation.user_note == spec["user_note"]
+            assert validation.core.api_endpoint == spec["api_endpoint"]
+            assert validation.core.sushi_credentials_checksum != ""
+
+    def test_create_is_throttled_per_batch(self, client_with_api_key):
+        files = [SimpleUploadedFile(f"tr{i}.json", content=b"xxx") for i in range(20)]
+        with patch("celery.group.apply_async"):
+            res = client_with_api_key.post(
+                reverse("validation-batch-list"), data={"files": files}, format="multipart"
+            )
+        assert res.status_code == 201
+        assert Validation.objects.count() == 20
+
+    @pytest.mark.parametrize(
+        "data,error",
+        [
+            ({}, "Exactly one of 'files' and 'counter_api' must be given"),
+            ({"user_note": "x"}, "Exactly one of 'files' and 'counter_api' must be given"),
+        ],
+    )
+    def test_create_invalid(self, client_authenticated_user, data, error):
+        res = client_authenticated_user.post(reverse("validation-batch-list"), data=data)
+        assert res.status_code == 400
+        assert res.json() == {"non_field_errors": [error]}
+        assert not ValidationBatch.objects.exists()
+
+    def test_create_too_many(self, client_authenticated_user, settings):
+        settings.VALIDATION_BATCH_MAX_SIZE = 2
+        files = [SimpleUploadedFile(f"tr{i}.json", content=b"xxx") for i in range(3)]
+        res = client_authenticated_user.post(
+            reverse("validation-batch-list"), data={"files": files}, format="multipart"
+        )
+        assert res.status_code == 400
+        assert not Validation.objects.exists()
+
+    def test_create_with_invalid_file(self, client_authenticated_user, settings):
+        settings.FILE_SIZE_LIMITS = {"default": 10}
+        files = [
+            SimpleUploadedFile("ok.json", content=b"xxx"),
+            SimpleUploadedFile("big.json", content=b"x" * 11),
+        ]
+        res = client_authenticated_user.post(
+            reverse("validation-batch-list"), data={"files": files}, format="multipart"
+        )
+        assert res.status_code == 400
+        assert list(res.json()["files"]) == ["1"]
+        assert not Validation.objects.exists()
+
+    def test_detail(self, client_authenticated_user, normal_user):
+        batch = ValidationBatch.objects.create(user=normal_user)
+        for status in (ValidationStatus.SUCCESS, ValidationStatus.RUNNING):
+            ValidationFactory(core__user=normal_user, core__status=status, batch=batch)
+        res = client_authenticated_user.get(reverse("validation-batch-detail", args=[batch.pk]))
+        assert res.status_code == 200
+        assert res.json()["status"] == ValidationStatus.RUNNING
+        assert res.json()["status_counts"] == {
+            "waiting": 0,
+            "running": 1,
+            "success": 1,
+            "failure": 0,
+        }
+        assert len(res.json()["validations"]) == 2
+
+    @pytest.mark.parametrize(
+        "statuses,expected",
+        [
+            ([ValidationStatus.WAITING], ValidationStatus.WAITING),
+            ([ValidationStatus.WAITING, ValidationStatus.SUCCESS], ValidationStatus.RUNNING),
+            ([ValidationStatus.SUCCESS, ValidationStatus.SUCCESS], ValidationStatus.SUCCESS),
+            ([ValidationStatus.SUCCESS, ValidationStatus.FAILURE], ValidationStatus.FAILURE),
+        ],
+    )
+    def test_detail_status(self, client_authenticated_user, normal_user, statuses, expected):
+        batch = ValidationBatch.objects.create(user=normal_user)
+        for status in statuses:
+            ValidationFactory(core__user=normal_user, core__status=status, batch=batch)
+        res = client_authenticated_user.get(reverse("validation-batch-detail", args=[batch.pk]))
+        assert res.json()["status"] == expected
+
+    def test_sweep(
+        self, client_authenticated_user, normal_user, django_capture_on_commit_callbacks
+    ):
+        data = factory.build(dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory)
+        del data["api_endpoint"], data["report_code"]
+        with (
+            patch("celery.group.apply_async") as apply_async,
+            django_capture_on_commit_callbacks(execute=True),
+        ):
+            res = client_authenticated_user.post(reverse("validation-batch-sweep"), data=data)
+            assert res.status_code == 201
+        # the endpoints are validated right away
+        apply_async.assert_called_once()
+        batch = ValidationBatch.objects.get(pk=res.json()["id"])
+        assert batch.user == normal_user
+        assert batch.sweep
+        validations = {
+            v.core.api_endpoint: v
+            for v in CounterAPIValidation.objects.filter(batch=batch).select_related("core")
+        }
+        assert validations.keys() == {"/status", "/members", "/reports"}
+        assert validations["/reports"].is_sweep_report_list
+        assert not validations["/status"].is_sweep_report_list
+        assert all(v.url == data["url"] for v in validations.values())
+        assert res.json()["status"] == ValidationStatus.WAITING
+
+    def test_sweep_requires_credentials(self, client_authenticated_user):
+        data = factory.build(dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory)
+        data["credentials"] = None
+        res = client_authenticated_user.post(reverse("validation-batch-sweep"), data=data)
+        assert res.status_code == 400
+        assert not ValidationBatch.objects.exists()
+
+    def test_detail_validation_result(self, client_authenticated_user, normal_user):
+        batch = ValidationBatch.objects.create(user=normal_user)
+        for result in ("Passed", "Warning"):
+            ValidationFactory(core__user=normal_user, result_data={"result": result}, batch=batch)
+        res = client_authenticated_user.get(reverse("validation-batch-detail", args=[batch.pk]))
+        assert res.json()["validation_result"] == "Warning"
+
+    def test_detail_other_user(self, client_authenticated_user):
+        batch = ValidationBatch.objects.create(user=UserFactory())
+        res = client_authenticated_user.get(reverse("validation-batch-detail", args=[batch.pk]))
+        assert res.status_code == 404
+
+
 @pytest.mark.django_db
 class TestCounterAPIValidationAPI:
     @pytest.mark.parametrize("expiration_days", [1, 3, 7])
@@ -910,14 +1628,14 @@ class TestCounterAPIValidationAPI:
             dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory, cop_version="5.1"
         )
         data["user_note"] = "Lorem ipsum"
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
                 format="json",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
         val = Validation.objects.select_related("core").get()
         out = res.json()
         assert str(val.pk) == out["id"]
@@ -953,14 +1671,14 @@ class TestCounterAPIValidationAPI:
         data = factory.build(
             dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory, cop_version="5.1"
         )
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
                 format="json",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
 
         val = Validation.objects.select_related("core").get()
         # Should use VALIDATION_LIFETIME (7 days) not PUBLIC_VALIDATION_LIFETIME (90 days)
@@ -984,7 +1702,7 @@ class TestCounterAPIValidationAPI:
             del data[empty_field]
         else:
             data[empty_field] = ""
-        with patch("validations.tasks.validate_counter_api.delay_on_commit"):
+        with patch("validations.tasks.run_next_validation.delay_on_commit"):
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
@@ -1014,7 +1732,7 @@ class TestCounterAPIValidationAPI:
         data = factory.build(dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory)
         for field in empty_credential_fields:
             data["credentials"][field] = ""
-        with patch("validations.tasks.validate_counter_api.delay_on_commit"):
+        with patch("validations.tasks.run_next_validation.delay_on_commit"):
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
@@ -1026,14 +1744,14 @@ class TestCounterAPIValidationAPI:
     def test_create_with_platform_in_credentials(self, client_authenticated_user, platform_present):
         data = factory.build(dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory)
         data["credentials"]["platform"] = "foobar" if platform_present else ""
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
                 format="json",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
         val = CounterAPIValidation.objects.select_related("core").get()
         assert str(val.pk) == res.json()["id"]
         if platform_present:
@@ -1044,14 +1762,14 @@ class TestCounterAPIValidationAPI:
     def test_create_with_attributes_to_show(self, client_authenticated_user):
         data = factory.build(dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory)
         data["extra_attributes"] = {"foo": "bar", "attributes_to_show": "YOP|Data_Type"}
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
                 format="json",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
         val = CounterAPIValidation.objects.select_related("core").get()
         assert str(val.pk) == res.json()["id"]
         assert val.requested_extra_attributes == {
@@ -1068,14 +1786,14 @@ class TestCounterAPIValidationAPI:
             "cop_version": "5",
             "url": "https://example.com",
         }
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
                 format="json",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
         val = CounterAPIValidation.objects.select_related("core").get()
         assert str(val.pk) == res.json()["id"]
         assert val.core.api_endpoint == endpoint
@@ -1097,14 +1815,14 @@ class TestCounterAPIValidationAPI:
 
     def test_create_with_api_key(self, client_with_api_key, normal_user):
         data = factory.build(dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory)
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_with_api_key.post(
                 reverse("counter-api-validation-list"),
                 data=data,
                 format="json",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
         val = Validation.objects.select_related("core").get()
         assert str(val.pk) == res.json()["id"]
         assert val.core.user == normal_user
@@ -1115,7 +1833,7 @@ class TestCounterAPIValidationAPI:
         user = UserFactory(verified_email=False)
         client.force_login(user)
         data = factory.build(dict, FACTORY_CLASS=CounterAPIValidationRequestDataFactory)
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client.post(
                 reverse("counter-api-validation-list"),
                 data=data,
@@ -1150,7 +1868,7 @@ class TestCounterAPIValidationAPI:
             url="https://foo.bar",
         )
         mock = requests_mock.post("http://localhost:8180/api.php", json={})
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
@@ -1184,14 +1902,14 @@ class TestCounterAPIValidationAPI:
         del data["end_date"]
         if missing_completely:
             del data["credentials"]
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
                 format="json",
             )
             assert res.status_code == 201
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
             rmock = requests_mock.post("http://localhost:8180/api.php", json={})
             validations.tasks.validate_counter_api(res.json()["id"])
             assert rmock.call_count == 1
@@ -1221,7 +1939,7 @@ class TestCounterAPIValidationAPI:
             api_endpoint=api_endpoint,
             cop_version=cop_version,
         )
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
@@ -1229,7 +1947,7 @@ class TestCounterAPIValidationAPI:
             )
             assert res.status_code == 201 if ok else 400
             if ok:
-                p.assert_called_once_with(UUID(res.json()["id"]))
+                p.assert_called_once_with()
             else:
                 assert p.call_count == 0
 
@@ -1249,7 +1967,7 @@ class TestCounterAPIValidationAPI:
             url=url,
             credentials=credentials_data,
         )
-        with patch("validations.tasks.validate_counter_api.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
@@ -1278,7 +1996,7 @@ class TestCounterAPIValidationAPI:
             credentials=credentials_data,
         )
 
-        with patch("validations.tasks.validate_counter_api.delay_on_commit"):
+        with patch("validations.tasks.run_next_validation.delay_on_commit"):
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
@@ -1311,7 +2029,7 @@ class TestCounterAPIValidationAPI:
             credentials=credentials_data,
         )
 
-        with patch("validations.tasks.validate_counter_api.delay_on_commit"):
+        with patch("validations.tasks.run_next_validation.delay_on_commit"):
             res = client_authenticated_user.post(
                 reverse("counter-api-validation-list"),
                 data=data,
@@ -1598,17 +2316,17 @@ class TestValidationAPIThrottling:
 
         filename = "tr.json"
         file = SimpleUploadedFile(filename, content=b"xxx")
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_with_api_key.post(
                 reverse("validation-file"),
                 data={"file": file, "user_note": "test"},
                 format="multipart",
             )
-            p.assert_called_once_with(UUID(res.json()["id"]))
+            p.assert_called_once_with()
             assert res.status_code == 201
 
         # second request should be throttled
-        with patch("validations.tasks.validate_file.delay_on_commit") as p:
+        with patch("validations.tasks.run_next_validation.delay_on_commit") as p:
             res = client_with_api_key.post(
                 reverse("validation-file"),
                 data={"file": file, "user_note": "test"},
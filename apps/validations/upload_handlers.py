@@ -0,0 +1,86 @@
+"""
+Upload handlers which compute the checksum of uploaded files and keep their first bytes for
+file type detection while the upload is being received. Thanks to this, the uploaded data
+does not have to be read again before the validation is created.
+"""
+
+import gzip
+import zlib
+from typing import IO
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+from validations.hashing import create_hasher
+from validations.storage import COMPRESSED_SUFFIX
+
+# number of bytes from the start of the file used for file type detection
+UPLOAD_HEAD_SIZE = 16384
+
+
+class HashingUploadHandlerMixin:
+    def new_file(self, *args, **kwargs):
+        # the parent may raise `StopFutureHandlers`, so the attributes must be set first
+        self.hasher = create_hasher()
+        self.head = bytearray()
+        super().new_file(*args, **kwargs)
+
+    def stores_data(self) -> bool:
+        return True
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.stores_data():
+            self.hasher.update(raw_data)
+            if (missing := UPLOAD_HEAD_SIZE - len(self.head)) > 0:
+                self.head += memoryview(raw_data)[:missing]
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if (file := super().file_complete(file_size)) is not None:
+            file.checksum = self.hasher.hexdigest()
+            file.head = bytes(self.head)
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    def stores_data(self) -> bool:
+        # when the file is too big, the data is passed to the next handler which hashes it
+        return self.activated
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def decompress_uploaded_file(file: IO, max_size: int) -> TemporaryUploadedFile:
+    """
+    Decompresses a gzip compressed upload into a temporary file, computing its checksum and
+    keeping its head on the way just like the upload handlers do. Raises ValueError when the
+    data is not valid or the decompressed file is larger than `max_size` bytes.
+    """
+    name = file.name.removesuffix(COMPRESSED_SUFFIX)
+    out = TemporaryUploadedFile(name, "application/octet-stream", 0, None)
+    hasher = create_hasher()
+    head = bytearray()
+    file.seek(0)
+    try:
+        with gzip.GzipFile(fileobj=file, mode="rb") as gz:
+            while chunk := gz.read(1024 * 1024):
+                out.size += len(chunk)
+                if out.size > max_size:
+                    # do not let a small file fill up the disk
+                    raise ValueError(f"Max file size exceeded: > {max_size} bytes")
+                hasher.update(chunk)
+                if (missing := UPLOAD_HEAD_SIZE - len(head)) > 0:
+                    head += chunk[:missing]
+                out.write(chunk)
+    except (OSError, EOFError, zlib.error) as e:
+        out.close()
+        raise ValueError(f"Invalid compressed file: {e}") from e
+    except ValueError:
+        out.close()
+        raise
+    out.seek(0)
+    out.checksum = hasher.hexdigest()
+    out.head = bytes(head)
+    return out
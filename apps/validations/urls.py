@@ -10,6 +10,8 @@ router.register(r"validation-core", views.ValidationCoreViewSet, basename="valid
 router.register(
     r"counter-api-validation", views.CounterAPIValidationViewSet, basename="counter-api-validation"
 )
+router.register(r"batch", views.ValidationBatchViewSet, basename="validation-batch")
+router.register(r"upload", views.UploadSessionViewSet, basename="upload")
 router.register("public/validation", views.PublicValidationViewSet, basename="public-validation")
 
 validation_router = NestedSimpleRouter(router, r"validation", lookup="validation")
@@ -1,14 +1,22 @@
 import base64
+import json
 import logging
 import zlib
-
-from core.tasks import async_mail_admins
-from django.core.files.uploadedfile import SimpleUploadedFile
+from collections.abc import Iterator
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.utils import timezone
 from rest_framework import serializers
 
 from validations.enums import SeverityLevel, ValidationStatus
-from validations.hashing import checksum_bytes
+from validations.hashing import checksum_uploaded_file, create_hasher
 from validations.models import Validation
+from validations.notifications import report_failure
+from validations.storage import validation_result_storage
 
 logger = logging.getLogger(__name__)
 
@@ -61,11 +69,112 @@ class ResultSerializer(serializers.Serializer):
 class ValidationResultSerializer(serializers.Serializer):
     result = ResultSerializer()
     memory = serializers.IntegerField(default=0)
-    report = serializers.CharField(required=False, allow_null=True)
-
-
-def decode_report_file(report: str) -> bytes:
-    return zlib.decompress(base64.b64decode(report.encode("utf-8")))
+    # the report may be huge, so it should not be copied by trimming
+    report = serializers.CharField(required=False, allow_null=True, trim_whitespace=False)
+
+
+# number of base64 characters decoded at once - it must be a multiple of 4
+REPORT_DECODE_CHUNK_SIZE = 1024 * 1024
+
+
+def iter_base64_chunks(data: str, chunk_size: int) -> Iterator[bytes]:
+    """
+    Decodes base64 encoded `data` by chunks of about `chunk_size` characters. Whitespace (e.g.
+    line breaks) is ignored - only whole quads of the remaining characters are decoded at once.
+    """
+    pending = ""
+    for start in range(0, len(data), chunk_size):
+        pending += "".join(data[start : start + chunk_size].split())
+        aligned = len(pending) - len(pending) % 4
+        yield base64.b64decode(pending[:aligned], validate=True)
+        pending = pending[aligned:]
+    if pending:
+        raise ValueError("The report is not valid base64 data")
+
+
+def decode_report_file(report: str) -> TemporaryUploadedFile:
+    """
+    Decodes the report (base64 encoded zlib compressed data) chunk by chunk into a temporary
+    file, computing its checksum on the way. This way the decoded report is never held in
+    memory as a whole.
+    """
+    out = TemporaryUploadedFile("report.json", "application/json", 0, None)
+    decompressor = zlib.decompressobj()
+    hasher = create_hasher()
+
+    def write(data: bytes):
+        hasher.update(data)
+        out.write(data)
+        out.size += len(data)
+
+    try:
+        for chunk in iter_base64_chunks(report, REPORT_DECODE_CHUNK_SIZE):
+            while chunk:
+                # the output is limited as well - the data may be compressed really well
+                write(decompressor.decompress(chunk, REPORT_DECODE_CHUNK_SIZE))
+                chunk = decompressor.unconsumed_tail
+        write(decompressor.flush())
+        if not decompressor.eof:
+            raise ValueError("The report is truncated")
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    out.checksum = hasher.hexdigest()
+    return out
+
+
+class ResponseFile(File):
+    """
+    Body of a streamed response which can be saved into a storage without holding it in memory.
+    """
+
+    def __init__(self, response: requests.Response):
+        super().__init__(None, name="response.json")
+        self.response = response
+
+    def chunks(self, chunk_size=None):
+        yield from self.response.iter_content(chunk_size or self.DEFAULT_CHUNK_SIZE)
+
+    def read(self):
+        # used by storages which do not write the data in chunks
+        return b"".join(self.chunks())
+
+
+def store_module_response(validation: Validation, response: requests.Response) -> str:
+    """
+    Stores the response of the validation module until it is ingested (see
+    `ingest_validation_result` task). Returns the name of the stored response.
+    """
+    storage = validation_result_storage()
+    return storage.save(storage.generate_filename(f"{validation.pk}.json"), ResponseFile(response))
+
+
+def load_module_response(name: str) -> dict:
+    with validation_result_storage().open(name, "rb") as fp:
+        return json.load(fp)
+
+
+def delete_module_response(name: str) -> None:
+    storage = validation_result_storage()
+    if storage.exists(name):
+        storage.delete(name)
+
+
+def delete_stale_module_responses() -> int:
+    """
+    Removes stored responses which were not ingested within `VALIDATION_INGESTION_TIMEOUT` -
+    their validations were recovered in the meantime, or the ingestion task got lost.
+    Returns the number of the removed responses.
+    """
+    storage = validation_result_storage()
+    threshold = timezone.now() - timedelta(seconds=settings.VALIDATION_INGESTION_TIMEOUT)
+    removed = 0
+    for name in storage.listdir("")[1]:
+        if storage.get_modified_time(name) < threshold:
+            storage.delete(name)
+            removed += 1
+    return removed
 
 
 def update_validation_result(validation: Validation, result: dict, duration: float):
@@ -75,7 +184,7 @@ def update_validation_result(validation: Validation, result: dict, duration: flo
         # send email to admins - this may be a bug in the validation module
         # or in the API
         logger.warning("Validation module returned invalid result: %s", serializer.errors)
-        async_mail_admins(
+        report_failure(
             "Validation module returned invalid result",
             f"Validation {validation.id} returned invalid result: {serializer.errors}",
         )
@@ -97,10 +206,18 @@ def update_validation_result(validation: Validation, result: dict, duration: flo
         # but we want to make 100% sure
         #
         # report is base64 encoded zlib compressed JSON
-        content = decode_report_file(report)
-        validation.core.file_checksum = checksum_bytes(content)
-        validation.core.file_size = len(content)
-        validation.file = SimpleUploadedFile(name="foo.json", content=content)
+        report_file = decode_report_file(report)
+        validation.core.file_checksum, validation.core.file_size = checksum_uploaded_file(
+            report_file
+        )
+        validation.file = report_file
         validation.filename = f"COUNTER API {validation.core.created.strftime('%Y-%m-%d %H:%M:%S')}"
-    validation.core.save()
-    validation.save()
+    else:
+        report_file = None
+    try:
+        validation.core.save()
+        validation.save()
+    finally:
+        if report_file:
+            # removes the temporary file
+            report_file.close()
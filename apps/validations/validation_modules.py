@@ -5,13 +5,17 @@ as there are validation modules available. But to protect against the case of in
 setup or other issues, we also implement a locking mechanism to ensure that only one validation
 task is running on a validation module at a time.
 
-This module contains functions to manage the locking mechanism.
+This module contains functions to manage the locking mechanism. Modules which do not work
+are not used at all (see `module_health`).
 """
 
 from django.conf import settings
 from redis import Redis
+from redis.exceptions import LockNotOwnedError
 from redis.lock import Lock
 
+from validations.module_health import get_module_health, is_module_available
+
 vm_lock_prefix = "vm_lock_"
 
 
@@ -29,13 +33,52 @@ def is_validation_module_locked(vm_url: str, redis: Redis) -> bool:
 
 
 def get_available_validation_module_url() -> str | None:
+    """
+    Returns an unlocked module which is not failing (see `module_health`). Modules which
+    failed recently are only used when no other module is available.
+    """
     redis = get_locking_redis()
-    for vm_url in settings.VALIDATION_MODULES_URLS:
-        if not is_validation_module_locked(vm_url, redis):
+    unlocked = [
+        vm_url
+        for vm_url in settings.VALIDATION_MODULES_URLS
+        if not is_validation_module_locked(vm_url, redis)
+    ]
+    unlocked.sort(key=lambda vm_url: get_module_health(vm_url, redis)["failures"])
+    for vm_url in unlocked:
+        if is_module_available(vm_url, redis):
             return vm_url
 
 
 def create_validation_module_lock(vm_url: str) -> Lock:
+    """
+    The lock expires unless it is extended by the heartbeat of the validation (see `leases`),
+    so that a module is not blocked forever by a worker which died. The heartbeat runs in another
+    thread than the one which acquired the lock, so the token of the lock is not thread local.
+    """
     redis = get_locking_redis()
-    lock = Lock(redis, lock_name(vm_url))
+    lock = Lock(
+        redis,
+        lock_name(vm_url),
+        timeout=settings.VALIDATION_MODULE_LOCK_TIMEOUT,
+        thread_local=False,
+    )
     return lock
+
+
+def lock_token(lock: Lock) -> str:
+    return lock.local.token.decode()
+
+
+def release_validation_module_lock(vm_url: str, token: str) -> bool:
+    """
+    Releases the lock of the module, but only if it is still held with `token` - the lock
+    may have expired in the meantime and be held by another validation now. Returns True if
+    the lock was released.
+    """
+    lock = create_validation_module_lock(vm_url)
+    lock.local.token = token.encode()
+    try:
+        lock.release()
+    except LockNotOwnedError:
+        return False
+    return True
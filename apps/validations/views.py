@@ -1,23 +1,30 @@
 import os
+import re
+from dataclasses import asdict
+from datetime import UTC, datetime
 
 from core.models import User
 from core.permissions import HasUserAPIKey, HasVerifiedEmail, IsValidatorAdminUser
 from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
 from django.db.models import Q
 from django.db.transaction import atomic
-from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.filters import SearchFilter
 from rest_framework.generics import get_object_or_404
-from rest_framework.mixins import CreateModelMixin, DestroyModelMixin
+from rest_framework.mixins import CreateModelMixin, DestroyModelMixin, RetrieveModelMixin
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet, ReadOnlyModelViewSet
 
-from validations.celery_queue import get_number_of_running_validations, get_validation_queue_length
+from validations.celery_queue import get_queue_state
+from validations.enums import SeverityLevel, ValidationStatus
 from validations.export import ValidationXlsxExporter
 from validations.filters import (
     OrderByFilter,
@@ -38,22 +45,36 @@ from validations.filters import (
     ValidationSourceFilter,
     ValidationValidationResultFilter,
 )
-from validations.models import Validation, ValidationCore, ValidationMessage
+from validations.models import (
+    UploadSession,
+    Validation,
+    ValidationBatch,
+    ValidationCore,
+    ValidationMessage,
+)
+from validations.module_health import get_module_health
+from validations.parsers import ChunkParser
 from validations.permissions import (
     IsAuthenticatedForListOrCreateAnyForDetail,
     IsValidationOwnerOrIsPublic,
 )
+from validations.scheduling import get_queue_estimates
 from validations.serializers import (
+    CounterAPISweepCreateSerializer,
     CounterAPIValidationCreateSerializer,
     FileValidationCreateSerializer,
     PublicValidationDetailSerializer,
+    UploadSessionSerializer,
+    ValidationBatchCreateSerializer,
+    ValidationBatchSerializer,
     ValidationCoreSerializer,
     ValidationDetailSerializer,
     ValidationMessageSerializer,
     ValidationSerializer,
     ValidationWithUserSerializer,
 )
-from validations.tasks import validate_counter_api, validate_file
+from validations.status_channel import UNFINISHED_STATUSES, StatusSubscription
+from validations.tasks import enqueue_validation, enqueue_validations
 
 
 class StandardPagination(PageNumberPagination):
@@ -81,9 +102,22 @@ class ValidationViewSet(DestroyModelMixin, ReadOnlyModelViewSet):
         ValidationDateFilter,
     ]
 
+    # actions which may wait for a change of status for a long time (see `get_wait_timeout`)
+    LONG_POLL_ACTIONS = {"retrieve", "validation_status"}
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if actions and cls.LONG_POLL_ACTIONS & set(actions.values()):
+            # waiting must not keep a transaction open (see `destroy`)
+            view = transaction.non_atomic_requests(view)
+        return view
+
     def get_serializer_class(self):
         if self.detail:
             return ValidationDetailSerializer
+        if self.action == "list_all":
+            return ValidationWithUserSerializer
         return ValidationSerializer
 
     def get_queryset(self, list_all=False):
@@ -114,17 +148,11 @@ class ValidationViewSet(DestroyModelMixin, ReadOnlyModelViewSet):
             # only public validations are visible to unauthenticated users in detail
             base = Validation.objects.public().filter(public_id=self.kwargs["pk"])
 
-        qs = (
-            base.current()
-            .select_related("core")
-            .annotate_source()
-            .prefetch_related("counterapivalidation")
-            .defer("result_data")
-            .order_by("-core__created")
-        )
-        if self.detail:
-            qs = qs.defer(None)
-        return qs
+        qs = base.current().select_related("core").annotate_source().order_by("-core__created")
+        if self.action in ("list", "list_all", "retrieve"):
+            # only the data needed for the requested fields (see `SparseFieldsetsMixin`) is loaded
+            return self.get_serializer().optimize_queryset(qs)
+        return qs.prefetch_related("counterapivalidation")
 
     def get_object(self):
         queryset = self.filter_queryset(self.get_queryset())
@@ -135,6 +163,106 @@ class ValidationViewSet(DestroyModelMixin, ReadOnlyModelViewSet):
         self.check_object_permissions(self.request, obj)
         return obj
 
+    def get_wait_timeout(self) -> float:
+        """
+        Number of seconds the client is willing to wait for a change of status of an unfinished
+        validation (the `wait` query param).
+        """
+        try:
+            wait = float(self.request.query_params.get("wait", 0))
+        except ValueError:
+            raise ValidationError({"wait": "Number of seconds is expected"}) from None
+        return max(0.0, min(wait, settings.VALIDATION_STATUS_MAX_WAIT))
+
+    @classmethod
+    def wait_for_status_change(cls, core_id, status: ValidationStatus, timeout: float) -> bool:
+        """
+        Blocks until the status of the validation changes from `status` or until
+        the timeout runs out. Returns True if the status changed.
+        """
+        with StatusSubscription(core_id) as subscription:
+            # the status might have changed before we subscribed
+            if ValidationCore.objects.filter(pk=core_id).exclude(status=status).exists():
+                return True
+            if not connection.in_atomic_block:
+                # the database connection is not needed while waiting
+                connection.close()
+            return subscription.wait(status, timeout)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Supports long polling - when the `wait` query param is given and the validation is
+        not finished yet, the response is delayed until its status changes (or `wait`
+        seconds pass).
+        """
+        instance = self.get_object()
+        timeout = self.get_wait_timeout()
+        if (
+            timeout
+            and instance.core.status in UNFINISHED_STATUSES
+            and self.wait_for_status_change(instance.core_id, instance.core.status, timeout)
+        ):
+            instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    @atomic
+    def destroy(self, request, *args, **kwargs):
+        # the detail route is not atomic because of long polling in `retrieve`
+        return super().destroy(request, *args, **kwargs)
+
+    @action(detail=True, methods=("GET",), url_path="status")
+    def validation_status(self, request, pk=None):
+        """
+        Lightweight alternative to `retrieve` for clients waiting for the validation to finish.
+        It only reads the core of the validation using one query and also supports the `wait`
+        query param.
+        """
+        core_data = self.get_status_data(pk)
+        timeout = self.get_wait_timeout()
+        if (
+            timeout
+            and core_data["status"] in UNFINISHED_STATUSES
+            and self.wait_for_status_change(core_data["pk"], core_data["status"], timeout)
+        ):
+            core_data = self.get_status_data(pk)
+        data = {
+            "id": core_data["validation__id"],
+            "status": core_data["status"],
+            "validation_result": SeverityLevel(core_data["validation_result"]).label,
+            "stats": core_data["stats"],
+            "queue_position": None,
+            "estimated_start": None,
+            "estimated_finish": None,
+        }
+        if core_data["status"] in UNFINISHED_STATUSES and (
+            estimate := get_queue_estimates([core_data["pk"]]).get(core_data["pk"])
+        ):
+            data.update(asdict(estimate))
+        return Response(data)
+
+    def get_status_data(self, pk) -> dict:
+        """
+        Returns a dict with status info of the validation identified by `pk` (which may also be
+        the public id). The filtering mirrors the visibility rules of `get_object`, including
+        the expiration.
+        """
+        user = self.request.user
+        if user.is_authenticated and user.has_admin_role:
+            query = Q(validation__pk=pk) | Q(validation__public_id=pk)
+        elif user.is_authenticated:
+            query = Q(validation__pk=pk, user=user) | Q(validation__public_id=pk)
+        else:
+            query = Q(validation__public_id=pk)
+        # the query is passed to `get_object_or_404`, so that invalid ids lead to 404
+        return get_object_or_404(
+            # expired validations are not visible (see `get_queryset`)
+            ValidationCore.objects.current().values(
+                "pk", "validation__id", "status", "validation_result", "stats"
+            ),
+            query,
+        )
+
     @action(
         detail=False,
         methods=["get"],
@@ -146,13 +274,11 @@ class ValidationViewSet(DestroyModelMixin, ReadOnlyModelViewSet):
         This is an almost one-to-one copy of the list method from `ListModelMixin`, but it passes
         the `list_all` attribute to `get_queryset`.
         """
-        queryset = self.filter_queryset(
-            self.get_queryset(list_all=True).select_related("core__user")
-        )
+        queryset = self.filter_queryset(self.get_queryset(list_all=True))
 
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = ValidationWithUserSerializer(page, many=True)
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
         serializer = self.get_serializer(queryset, many=True)
@@ -169,10 +295,22 @@ class ValidationViewSet(DestroyModelMixin, ReadOnlyModelViewSet):
         serializer = FileValidationCreateSerializer(data=request.data, context={"request": request})
         serializer.is_valid(raise_exception=True)
         obj = serializer.save()
-        validate_file.delay_on_commit(obj.pk)
+        enqueue_validation()
         out_serializer = self.get_serializer(obj)
         return Response(out_serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=True, methods=("GET",), url_path="download")
+    def download(self, request, pk=None):
+        validation: Validation = self.get_object()
+        if not validation.file:
+            raise Http404("The validation has no file")
+        response = FileResponse(
+            validation.file.open("rb"), as_attachment=True, filename=validation.filename
+        )
+        # the stored file may be compressed, so the size is not known to the response
+        response["Content-Length"] = validation.file.size
+        return response
+
     @action(detail=True, methods=("GET",), url_path="stats")
     def stats(self, request, pk=None):
         validation: Validation = self.get_object()
@@ -214,15 +352,14 @@ class PublicValidationViewSet(ReadOnlyModelViewSet):
     lookup_field = "public_id"
 
     def get_queryset(self):
-        return (
+        qs = (
             Validation.objects.current()
             .public()
             .select_related("core")
             .annotate_source()
-            .prefetch_related("counterapivalidation")
-            .defer("result_data")
             .order_by("-core__created")
         )
+        return self.get_serializer().optimize_queryset(qs)
 
     def list(self, request, *args, **kwargs):
         return HttpResponseForbidden({"detail": "Listing public validations is not allowed."})
@@ -243,11 +380,123 @@ class CounterAPIValidationViewSet(CreateModelMixin, GenericViewSet):
         )
         serializer.is_valid(raise_exception=True)
         obj = serializer.save()
-        validate_counter_api.delay_on_commit(obj.pk)
+        enqueue_validation()
         out_serializer = self.get_serializer(obj)
         return Response(out_serializer.data, status=status.HTTP_201_CREATED)
 
 
+class UploadSessionViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
+    """
+    Chunked upload of large files. A session is created with the file size, the data is
+    then uploaded in chunks using `PUT .../chunk/` with a `Content-Range` header and the
+    validation is created by `POST .../finalize/`. An interrupted upload may be resumed
+    from the `received` offset of the session.
+    """
+
+    permission_classes = [IsAuthenticated | HasUserAPIKey, HasVerifiedEmail]
+    serializer_class = UploadSessionSerializer
+    content_range_re = re.compile(r"^bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+)$")
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_destroy(self, instance: UploadSession):
+        transaction.on_commit(instance.delete_data)
+        instance.delete()
+
+    def parse_content_range(self, session: UploadSession) -> tuple[int, int]:
+        if not (m := self.content_range_re.match(self.request.headers.get("Content-Range", ""))):
+            raise ValidationError({"Content-Range": "Missing or invalid 'bytes start-end/total'"})
+        start, end, total = int(m["start"]), int(m["end"]), int(m["total"])
+        if total != session.size or end < start or end >= total:
+            raise ValidationError({"Content-Range": "Range does not match the file size"})
+        if end - start + 1 > settings.UPLOAD_CHUNK_MAX_SIZE:
+            raise ValidationError(
+                {"Content-Range": f"Max chunk size is {settings.UPLOAD_CHUNK_MAX_SIZE} bytes"}
+            )
+        return start, end - start + 1
+
+    @action(detail=True, methods=("PUT",), url_path="chunk", parser_classes=[ChunkParser])
+    def chunk(self, request, pk=None):
+        session: UploadSession = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+        if session.validation_id:
+            raise ValidationError("The upload was already finalized")
+        start, length = self.parse_content_range(session)
+        if start != session.received:
+            # the client has to continue from where the data ends on our side
+            return Response({"received": session.received}, status=status.HTTP_409_CONFLICT)
+        try:
+            session.append_chunk(
+                request.stream, length, checksum=request.headers.get("X-Chunk-Checksum", "")
+            )
+        except ValueError as e:
+            raise ValidationError(str(e)) from e
+        session.save(update_fields=["received", "last_updated"])
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=("POST",), url_path="finalize")
+    def finalize(self, request, pk=None):
+        session: UploadSession = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+        if session.validation_id:
+            return Response(ValidationSerializer(session.validation).data)
+        if session.received != session.size:
+            raise ValidationError(
+                f"The upload is incomplete: {session.received} of {session.size} bytes received"
+            )
+        with session.data_path.open("rb") as f:
+            data = {"file": File(f, name=session.filename)}
+            if checksum := session.file_checksum():
+                # the data was hashed as it was received (see `checksum_uploaded_file`)
+                data["file"].checksum = checksum
+            if session.user_note:
+                data["user_note"] = session.user_note
+            serializer = FileValidationCreateSerializer(data=data, context={"request": request})
+            serializer.is_valid(raise_exception=True)
+            validation = serializer.save()
+        session.validation = validation
+        session.save(update_fields=["validation", "last_updated"])
+        enqueue_validation()
+        transaction.on_commit(session.delete_data)
+        return Response(ValidationSerializer(validation).data, status=status.HTTP_201_CREATED)
+
+
+class ValidationBatchViewSet(CreateModelMixin, RetrieveModelMixin, GenericViewSet):
+    """
+    Submission of multiple validations in one request. Throttling counts the whole batch as
+    one request. A sweep is a batch validating all the reports (and other endpoints) of
+    a COUNTER API.
+    """
+
+    permission_classes = [IsAuthenticated | HasUserAPIKey, HasVerifiedEmail]
+    serializer_class = ValidationBatchSerializer
+
+    def get_queryset(self):
+        return ValidationBatch.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        serializer = ValidationBatchCreateSerializer(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        batch = serializer.save()
+        enqueue_validations(batch.created_validations)
+        out_serializer = self.get_serializer(batch)
+        return Response(out_serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=("POST",), url_path="sweep")
+    def sweep(self, request):
+        serializer = CounterAPISweepCreateSerializer(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        batch = serializer.save()
+        # validations of the reports are added once the `/reports` endpoint is validated
+        # (see `sweep_counter_api`)
+        enqueue_validations(batch.created_validations)
+        out_serializer = self.get_serializer(batch)
+        return Response(out_serializer.data, status=status.HTTP_201_CREATED)
+
+
 class ValidationCoreViewSet(ReadOnlyModelViewSet):
     permission_classes = [IsValidatorAdminUser]
     serializer_class = ValidationCoreSerializer
@@ -334,7 +583,26 @@ class ValidationQueueInfo(APIView):
     permission_classes = [IsValidatorAdminUser]
 
     def get(self, request):
-        queue_length = get_validation_queue_length()
-        running = get_number_of_running_validations()
-        worker_num = len(settings.VALIDATION_MODULES_URLS)
-        return Response({"queued": queue_length, "running": running, "workers": worker_num})
+        state = get_queue_state()
+        modules = []
+        for vm_url, rec in state["modules"].items():
+            health = get_module_health(vm_url)
+            modules.append(
+                {
+                    "url": vm_url,
+                    "validation": rec["validation"] if rec else None,
+                    "started": datetime.fromtimestamp(rec["started"], UTC) if rec else None,
+                    "health": health["state"],
+                    "latency": health["latency"],
+                    "last_error": health["last_error"],
+                }
+            )
+        return Response(
+            {
+                "queued": state["queued"],
+                "reserved": state["reserved"],
+                "running": state["running"],
+                "workers": len(modules),
+                "modules": modules,
+            }
+        )
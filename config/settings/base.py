@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import sys
+from datetime import timedelta
 from pathlib import Path
 
 from celery.schedules import crontab
@@ -97,27 +98,59 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 
 CELERY_VALIDATION_QUEUE = "validation"
+CELERY_INGESTION_QUEUE = "ingestion"
 
 CELERY_WORKER_PREFETCH_MULTIPLIER = 1
 
 CELERY_TASK_ROUTES = {
     "validations.tasks.validate_file": {"queue": CELERY_VALIDATION_QUEUE},
     "validations.tasks.validate_counter_api": {"queue": CELERY_VALIDATION_QUEUE},
+    "validations.tasks.run_next_validation": {"queue": CELERY_VALIDATION_QUEUE},
+    "validations.tasks.ingest_validation_result": {"queue": CELERY_INGESTION_QUEUE},
 }
 
+# intervals (in seconds) of the periodic tasks below: health probes of the validation modules,
+# refreshing the estimated start and finish of waiting validations and reporting failed
+# validations to the admins (in one email)
+VALIDATION_MODULE_PROBE_INTERVAL = config("VALIDATION_MODULE_PROBE_INTERVAL", cast=int, default=30)
+VALIDATION_QUEUE_ESTIMATE_INTERVAL = config(
+    "VALIDATION_QUEUE_ESTIMATE_INTERVAL", cast=int, default=15
+)
+VALIDATION_FAILURE_MAIL_INTERVAL = config("VALIDATION_FAILURE_MAIL_INTERVAL", cast=int, default=900)
+
 CELERY_BEAT_SCHEDULE = {
     "expired_validations_cleanup": {
         "task": "validations.tasks.expired_validations_cleanup",
         "schedule": crontab(minute="0", hour="0"),  # every day at midnight
     },
+    "refresh_duration_model": {
+        "task": "validations.tasks.refresh_duration_model",
+        "schedule": crontab(minute="*/10"),  # every 10 minutes
+    },
     "update_registry_models": {
         "task": "counter.tasks.update_registry_models",
-        "schedule": crontab(minute="10", hour="0"),  # every day at 00:10
+        "schedule": crontab(minute="10"),  # every hour at XX:10
     },
     "daily_validation_report": {
         "task": "core.tasks.daily_validation_report",
         "schedule": crontab(minute="0", hour="6"),  # every day at 6:00 AM
     },
+    "probe_validation_modules": {
+        "task": "validations.tasks.probe_validation_modules",
+        "schedule": VALIDATION_MODULE_PROBE_INTERVAL,
+    },
+    "refresh_queue_estimates": {
+        "task": "validations.tasks.refresh_queue_estimates",
+        "schedule": VALIDATION_QUEUE_ESTIMATE_INTERVAL,
+    },
+    "mail_validation_failures": {
+        "task": "validations.tasks.mail_validation_failures",
+        "schedule": VALIDATION_FAILURE_MAIL_INTERVAL,
+    },
+    "reap_expired_leases": {
+        "task": "validations.tasks.reap_expired_leases",
+        "schedule": crontab(),  # every minute
+    },
 }
 
 
@@ -203,6 +236,12 @@ AUTH_PASSWORD_VALIDATORS = (
 )
 
 AUTH_USER_MODEL = "core.User"
+AUTHENTICATION_BACKENDS = [
+    "core.backends.ValidatorModelBackend",
+    # sessions created before the custom backend was introduced remember this backend
+    # - keep it until all of them expire, so that their users are not logged out
+    "django.contrib.auth.backends.ModelBackend",
+]
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 WSGI_APPLICATION = "config.wsgi.application"
@@ -210,6 +249,16 @@ STATIC_URL = "static/"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = config("MEDIA_ROOT", default=str(BASE_DIR / "media/"))
 STATIC_ROOT = config("STATIC_ROOT", default=str(BASE_DIR / "static/"))
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    # uploaded files to validate are stored gzip compressed
+    "validation_files": {
+        "BACKEND": config(
+            "VALIDATION_FILE_STORAGE", default="validations.storage.CompressedFileSystemStorage"
+        ),
+    },
+}
 
 
 LOGGING = {
@@ -258,7 +307,69 @@ VALIDATION_MODULES_URLS = config(
 # access to the validation modules is controlled by a lock mechanism, to guard against
 # the lock being held indefinitely due to some error, we set a timeout for the lock
 VALIDATION_MODULE_LOCK_TIMEOUT = config("VALIDATION_MODULE_LOCK_TIMEOUT", cast=int, default=180)
+# timeout (in seconds) of the periodic health probes of the validation modules
+VALIDATION_MODULE_PROBE_TIMEOUT = config("VALIDATION_MODULE_PROBE_TIMEOUT", cast=int, default=5)
+# queued and reserved validation tasks are not counted in the state of the queue after this many
+# seconds, in case they got lost on the way (e.g. purged from the broker)
+VALIDATION_QUEUE_STATE_MAX_AGE = config(
+    "VALIDATION_QUEUE_STATE_MAX_AGE", cast=int, default=24 * 3600
+)
+# number of failures in a row after which a validation module is not used anymore and the time
+# (in seconds) after which it is tried again
+VALIDATION_MODULE_FAILURE_THRESHOLD = config(
+    "VALIDATION_MODULE_FAILURE_THRESHOLD", cast=int, default=3
+)
+VALIDATION_MODULE_OPEN_TIMEOUT = config("VALIDATION_MODULE_OPEN_TIMEOUT", cast=int, default=60)
+# how many times a validation is returned to the queue when the validation module fails
+# or when the worker processing it dies
+VALIDATION_MAX_RETRIES = config("VALIDATION_MAX_RETRIES", cast=int, default=3)
+# validations returned to the queue because of a failure of the validation module are retried
+# after a random delay of up to VALIDATION_RETRY_BACKOFF * 2^retries seconds, but at most
+# VALIDATION_RETRY_BACKOFF_MAX seconds
+VALIDATION_RETRY_BACKOFF = config("VALIDATION_RETRY_BACKOFF", cast=int, default=5)
+VALIDATION_RETRY_BACKOFF_MAX = config("VALIDATION_RETRY_BACKOFF_MAX", cast=int, default=300)
+# running validations are leased by workers for this many seconds and the lease is renewed
+# while they are alive - validations with expired leases are recovered every minute
+VALIDATION_LEASE_TIMEOUT = config("VALIDATION_LEASE_TIMEOUT", cast=int, default=120)
+# validations may be sent to the validation modules by the `run_validation_dispatcher` service
+# instead of by the celery workers of the validation queue
+VALIDATION_DISPATCHER = config("VALIDATION_DISPATCHER", cast=bool, default=False)
+# how often (in seconds) the dispatcher checks for waiting validations without being woken up
+VALIDATION_DISPATCHER_POLL_INTERVAL = config(
+    "VALIDATION_DISPATCHER_POLL_INTERVAL", cast=float, default=5
+)
+# directory where the results of the validation modules wait for the ingestion - they are kept
+# only for a short time, so the fastest compression is used; the results are written by
+# the workers of the validation queue (or the dispatcher) and read by the workers of
+# the ingestion queue, so the directory must be shared by all their hosts (e.g. an NFS volume)
+VALIDATION_RESULT_DIR = config(
+    "VALIDATION_RESULT_DIR", default=str(BASE_DIR / "validation_results/")
+)
+STORAGES["validation_results"] = {
+    "BACKEND": "validations.storage.CompressedFileSystemStorage",
+    "OPTIONS": {"location": VALIDATION_RESULT_DIR, "compresslevel": 1},
+}
+# how long (in seconds) a result may wait for the ingestion before its validation is recovered
+VALIDATION_INGESTION_TIMEOUT = config("VALIDATION_INGESTION_TIMEOUT", cast=int, default=3600)
+# how long (in seconds) a successfully verified API key is remembered, so that the (deliberately
+# slow) key hashing does not have to be repeated on every request
+API_KEY_CACHE_TIMEOUT = config("API_KEY_CACHE_TIMEOUT", cast=int, default=60)
+# how long (in seconds) the information whether the user has a verified email is cached
+VERIFIED_EMAIL_CACHE_TIMEOUT = config("VERIFIED_EMAIL_CACHE_TIMEOUT", cast=int, default=600)
+# maximum time (in seconds) a client may wait for a change of validation status when long polling
+# - each waiting client occupies a worker (or a thread) of the WSGI server for that long
+VALIDATION_STATUS_MAX_WAIT = config("VALIDATION_STATUS_MAX_WAIT", cast=int, default=30)
 REGISTRY_URL = config("REGISTRY_URL", default="https://registry.countermetrics.org")
+# number of SUSHI service records downloaded from the registry in parallel during the sync
+REGISTRY_SYNC_WORKERS = config("REGISTRY_SYNC_WORKERS", cast=int, default=8)
+# how long (in seconds) downloaded registry records are kept for conditional requests
+# (using ETag or Last-Modified) in the next sync
+REGISTRY_SYNC_CACHE_TIMEOUT = config("REGISTRY_SYNC_CACHE_TIMEOUT", cast=int, default=7 * 86400)
+# how long (in seconds) serialized registry data (platforms, SUSHI services) served by the API
+# is cached - the cache is invalidated by the registry sync whenever the data changes
+REGISTRY_CACHE_TIMEOUT = config("REGISTRY_CACHE_TIMEOUT", cast=int, default=86400)
+# the time in days changes made by the registry sync are kept in the change journal
+REGISTRY_CHANGE_LIFETIME = config("REGISTRY_CHANGE_LIFETIME", cast=int, default=90)
 # size of the hash in bytes. Blake 2b is used as the hashing algorithm
 HASHING_DIGEST_SIZE = config("FILE_HASHING_DIGEST_SIZE", cast=int, default=32)
 HASHING_SALT = config("FILE_HASHING_SALT", default=SECRET_KEY)
@@ -268,6 +379,22 @@ VALIDATION_LIFETIME = config("VALIDATION_LIFETIME", cast=int, default=7)
 # the time in days public validations are valid, after that they will no longer be available
 # and will be deleted at the next cleanup
 PUBLIC_VALIDATION_LIFETIME = config("PUBLIC_VALIDATION_LIFETIME", cast=int, default=90)
+# the time in days after which results of finished celery tasks are removed (by the built-in
+# `celery.backend_cleanup` task which celery beat runs daily)
+TASK_RESULT_LIFETIME = config("TASK_RESULT_LIFETIME", cast=int, default=7)
+CELERY_RESULT_EXPIRES = timedelta(days=TASK_RESULT_LIFETIME)
+# directory where data of chunked uploads is stored until the upload is finished - the chunks
+# of one upload may be received by any host serving the API, so it must be shared by all of them
+UPLOAD_SESSION_DIR = config("UPLOAD_SESSION_DIR", default=str(BASE_DIR / "upload_sessions/"))
+# the time in hours after which unfinished chunked uploads are removed
+UPLOAD_SESSION_LIFETIME = config("UPLOAD_SESSION_LIFETIME", cast=int, default=24)
+# maximum size of one chunk of a chunked upload in bytes
+UPLOAD_CHUNK_MAX_SIZE = config("UPLOAD_CHUNK_MAX_SIZE", cast=int, default=10_000_000)
+# checksums of uploaded files are computed while they are being received
+FILE_UPLOAD_HANDLERS = [
+    "validations.upload_handlers.HashingMemoryFileUploadHandler",
+    "validations.upload_handlers.HashingTemporaryFileUploadHandler",
+]
 # per-file type file size limit in bytes
 FILE_SIZE_LIMITS = {
     "json": config("FILE_SIZE_LIMIT_JSON", cast=int, default=100_000_000),
@@ -275,6 +402,8 @@ FILE_SIZE_LIMITS = {
     "csv": config("FILE_SIZE_LIMIT_CSV", cast=int, default=10_000_000),
     "default": config("FILE_SIZE_LIMIT_DEFAULT", cast=int, default=1_000_000),
 }
+# maximum number of validations submitted in one batch
+VALIDATION_BATCH_MAX_SIZE = config("VALIDATION_BATCH_MAX_SIZE", cast=int, default=50)
 ALLOW_USER_REGISTRATION = config("ALLOW_USER_REGISTRATION", cast=bool, default=True)
 
 EXPORTED_SETTINGS = [
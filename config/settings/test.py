@@ -5,4 +5,6 @@ STORAGES = {
     "staticfiles": {
         "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
     },
+    "validation_files": {"BACKEND": "inmemorystorage.InMemoryStorage"},
+    "validation_results": {"BACKEND": "inmemorystorage.InMemoryStorage"},
 }
@@ -164,6 +164,9 @@ export type Validation = {
   requested_begin_date: string | null
   requested_end_date: string | null
   use_short_dates: boolean
+  queue_position: number | null
+  estimated_start: string | null
+  estimated_finish: string | null
   public_id: string | null
   user_note: string | null
 } & ValidationBase
@@ -173,6 +176,16 @@ export type ValidationDetail = Validation & {
   full_url: string
 }
 
+export type ValidationStatusInfo = {
+  id: string
+  status: Status
+  validation_result: string
+  stats: Record<SeverityLevel, number>
+  queue_position: number | null
+  estimated_start: string | null
+  estimated_finish: string | null
+}
+
 export type Platform = {
   id: string
   name: string
@@ -230,10 +243,21 @@ export type SplitStatsRec = {
 
 export type SplitStats = SplitStatsRec[]
 
+export type QueueModuleInfo = {
+  url: string
+  validation: string | null
+  started: string | null
+  health: "closed" | "open" | "half_open"
+  latency: number | null
+  last_error: string
+}
+
 export type QueueInfo = {
   queued: number
+  reserved: number
   running: number
   workers: number
+  modules: QueueModuleInfo[]
 }
 
 export type SystemInfo = {
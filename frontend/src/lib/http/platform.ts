@@ -13,3 +13,8 @@ export async function loadPlatform(id: string) {
 export async function loadPlatforms() {
   return jsonFetch<Platform[]>(urls.platform)
 }
+
+export async function searchPlatforms(query: string, limit = 20) {
+  const params = new URLSearchParams({ q: query, limit: limit.toString() })
+  return jsonFetch<(Platform & { score: number })[]>(`${urls.platform}search/?${params}`)
+}
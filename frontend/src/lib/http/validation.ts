@@ -8,6 +8,7 @@ import {
   Validation,
   ValidationCore,
   ValidationDetail,
+  ValidationStatusInfo,
 } from "../definitions/api"
 import { FUpload } from "../definitions/upload"
 import { jsonFetch, wrapFetch } from "./util"
@@ -29,12 +30,20 @@ export const urls = {
   queueInfo: "validations/queue/",
 }
 
-export async function getValidationDetail(id: string) {
-  const url = `${urls.list}${id}/`
+export async function getValidationDetail(id: string, wait = 0) {
+  // with `wait`, the server holds the response until the status of the validation changes
+  const url = wait ? `${urls.list}${id}/?wait=${wait}` : `${urls.list}${id}/`
 
   return jsonFetch<ValidationDetail>(url)
 }
 
+export async function getValidationStatus(id: string, wait = 0) {
+  // lightweight alternative to `getValidationDetail` for waiting for the validation to finish
+  const url = wait ? `${urls.list}${id}/status/?wait=${wait}` : `${urls.list}${id}/status/`
+
+  return jsonFetch<ValidationStatusInfo>(url)
+}
+
 export async function getPublicValidationDetail(id: string) {
   const url = `${urls.publicList}${id}/`
 
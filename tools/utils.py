@@ -7,6 +7,10 @@ from decouple import config
 from termcolor import colored
 
 COUNTER_VALIDATOR_API_URL = "http://localhost:8028"
+# how long (in seconds) the server should hold a status request until the validation changes
+STATUS_WAIT_TIMEOUT = 30
+# how often (in seconds) the status of a batch is checked
+BATCH_POLL_INTERVAL = 5
 
 
 def pprint_response(response_data):
@@ -40,13 +44,22 @@ def make_request(
 
     if wait:
         print(f"Waiting for validation '{validation_id}' to finish...")
-        while response.json()["status"] <= 1:
-            sleep(1)
+        detail_url = urljoin(validator_url, f"/api/v1/validations/validation/{validation_id}/")
+        while (status := response.json()["status"]) <= 1:
+            # the server holds the request until the status changes (or `wait` seconds pass)
             response = requests.get(
-                urljoin(validator_url, f"/api/v1/validations/validation/{validation_id}/"),
+                urljoin(detail_url, "status/"),
+                params={"wait": STATUS_WAIT_TIMEOUT},
                 headers=headers,
             )
             response.raise_for_status()
+            if response.json()["status"] == status:
+                # nothing changed - do not hammer servers which do not support waiting
+                sleep(1)
+
+        # the status endpoint is lightweight, the full result is fetched only once
+        response = requests.get(detail_url, headers=headers)
+        response.raise_for_status()
 
         print(colored("Validation finished. API response:\n", "green"))
         pprint_response(response.json())
@@ -57,6 +70,43 @@ def make_request(
     )
 
 
+def make_batch_request(validator_url: str, path: str, api_key: str, data: dict, wait: bool = False):
+    """
+    Submits a batch of validations (e.g. a sweep of a COUNTER API) and optionally waits for
+    all of its validations to finish.
+    """
+    headers = {"Authorization": f"Api-Key {api_key}"}
+    response = requests.post(urljoin(validator_url, path), headers=headers, json=data)
+    try:
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        print(colored(f"Error: {e}", "red"))
+        print(colored(response.text, "yellow"))
+        exit(1)
+
+    batch_id = response.json()["id"]
+    print(colored(f"Batch '{batch_id}' created successfully.", "green"))
+
+    if wait:
+        print(f"Waiting for batch '{batch_id}' to finish...")
+        detail_url = urljoin(validator_url, f"/api/v1/validations/batch/{batch_id}/")
+        with requests.Session() as session:
+            session.headers.update(headers)
+            while response.json()["status"] <= 1:
+                sleep(BATCH_POLL_INTERVAL)
+                response = session.get(detail_url)
+                response.raise_for_status()
+
+        print(colored("Batch finished. Results:\n", "green"))
+        for validation in response.json()["validations"]:
+            endpoint = validation["report_code"] or validation["api_endpoint"]
+            print(" ", colored(f"{endpoint}: {validation['validation_result']}", "yellow"))
+            print("   ", f"{validator_url.rstrip('/')}/validation/{validation['id']}/")
+        if error_message := response.json()["error_message"]:
+            print(colored(error_message, "red"))
+        print(colored(f"Overall result: {response.json()['validation_result']}", "yellow"))
+
+
 def create_arg_parser(desc: str):
     parser = argparse.ArgumentParser(description=desc)
 
@@ -0,0 +1,217 @@
+"""
+CLI client to validate many files or COUNTER APIs at once using the COUNTER validator.
+The targets are either all files in a directory or COUNTER APIs listed in a CSV manifest with
+the columns url, customer_id, requestor_id, api_key, platform, cop_version, report,
+begin_date and end_date (only url and customer_id are required).
+
+Validations are submitted concurrently over a shared connection pool and the results are
+written into a JSONL file - one line per target. It relies on the API Key access to the COUNTER
+validator and requires an API key to be set in the environment variable
+COUNTER_VALIDATOR_API_KEY.
+"""
+
+import asyncio
+import csv
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from functools import partial
+from pathlib import Path
+from time import time
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from termcolor import colored
+from utils import STATUS_WAIT_TIMEOUT, create_arg_parser, validate_args
+from validate_counter_api import last_month_start, month_end
+
+# how many times a request is repeated when the server is busy or throttles us
+MAX_RETRIES = 10
+# how long to wait before repeating a request if the server does not say
+DEFAULT_RETRY_AFTER = 10
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# max number of validations waited for at the same time - waiting is cheap for the server
+WAIT_CONCURRENCY = 32
+
+
+def retry_after(response: requests.Response) -> float:
+    """
+    Returns the number of seconds to wait according to the `Retry-After` header, which may
+    contain either the number of seconds or a date.
+    """
+    value = response.headers.get("Retry-After", "")
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time(), 0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class BulkValidator:
+    def __init__(self, validator_url: str, api_key: str, concurrency: int, wait: bool):
+        self.validator_url = validator_url
+        self.wait = wait
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Api-Key {api_key}"
+        adapter = HTTPAdapter(pool_maxsize=concurrency + WAIT_CONCURRENCY)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency + WAIT_CONCURRENCY)
+        self.upload_semaphore = asyncio.Semaphore(concurrency)
+        self.wait_semaphore = asyncio.Semaphore(WAIT_CONCURRENCY)
+
+    def send(self, method: str, path: str, file_path: Path | None = None, **kwargs):
+        url = urljoin(self.validator_url, path)
+        if file_path is None:
+            return self.session.request(method, url, **kwargs)
+        # the file is opened only for the upload, so that thousands of files are not open at once
+        with file_path.open("rb") as f:
+            return self.session.request(method, url, files={"file": f}, **kwargs)
+
+    async def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Makes the request in a thread from the pool, repeating it when the server is busy.
+        """
+        loop = asyncio.get_running_loop()
+        for _ in range(MAX_RETRIES):
+            response = await loop.run_in_executor(
+                self.executor, partial(self.send, method, path, **kwargs)
+            )
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+            await asyncio.sleep(retry_after(response))
+        response.raise_for_status()
+        return response
+
+    async def wait_for_validation(self, validation_id: str) -> dict:
+        path = f"/api/v1/validations/validation/{validation_id}/status/"
+        async with self.wait_semaphore:
+            data = {"status": 0}
+            while data["status"] <= 1:
+                # the server holds the request until the status changes
+                response = await self.request("GET", path, params={"wait": STATUS_WAIT_TIMEOUT})
+                data = response.json()
+            return data
+
+    async def validate(self, target: str, path: str, **kwargs) -> dict:
+        result = {"target": target}
+        try:
+            async with self.upload_semaphore:
+                response = await self.request("POST", path, **kwargs)
+            data = response.json()
+            result |= {"id": data["id"], "status": data["status"]}
+            if self.wait:
+                data = await self.wait_for_validation(data["id"])
+                result |= {
+                    "status": data["status"],
+                    "validation_result": data["validation_result"],
+                    "stats": data["stats"],
+                }
+            result["url"] = f"{self.validator_url.rstrip('/')}/validation/{data['id']}/"
+        except requests.RequestException as e:
+            result["error"] = str(e)
+            if e.response is not None:
+                result["response"] = e.response.text
+        return result
+
+    async def validate_file(self, path: Path, note: str) -> dict:
+        return await self.validate(
+            str(path),
+            "/api/v1/validations/validation/file/",
+            data={"user_note": note},
+            file_path=path,
+        )
+
+    async def validate_counter_api(self, row: dict, note: str) -> dict:
+        credentials = {
+            key: row[key]
+            for key in ("customer_id", "requestor_id", "api_key", "platform")
+            if row.get(key)
+        }
+        begin_date = row.get("begin_date") or last_month_start()
+        data = {
+            "url": row["url"],
+            "credentials": credentials,
+            "cop_version": row.get("cop_version") or "5",
+            "report_code": row.get("report") or "TR",
+            "begin_date": begin_date,
+            "end_date": row.get("end_date") or month_end(begin_date),
+            "user_note": note,
+        }
+        return await self.validate(
+            f"{data['url']} {data['report_code']}",
+            "/api/v1/validations/counter-api-validation/",
+            json=data,
+        )
+
+
+def read_manifest(path: str) -> list[dict]:
+    with open(path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    if invalid := [i for i, row in enumerate(rows, 2) if not row.get("url")]:
+        raise ValueError(f"Missing url on lines {invalid} of the manifest")
+    return rows
+
+
+async def main(args):
+    validator = BulkValidator(
+        args.validator_url, args.validator_api_key, args.concurrency, args.wait
+    )
+    note = args.note or ""
+    if args.directory:
+        jobs = [
+            validator.validate_file(path, note)
+            for path in sorted(Path(args.directory).glob(args.pattern))
+            if path.is_file()
+        ]
+    else:
+        jobs = [validator.validate_counter_api(row, note) for row in read_manifest(args.manifest)]
+
+    print(f"Validating {len(jobs)} targets using {args.validator_url}...", file=sys.stderr)
+    counts = {"ok": 0, "error": 0}
+    with open(args.output, "w") if args.output != "-" else nullcontext(sys.stdout) as out:
+        for done, job in enumerate(asyncio.as_completed(jobs), 1):
+            result = await job
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            counts["error" if "error" in result else "ok"] += 1
+            color = "red" if "error" in result else "green"
+            status = result.get("error") or result.get("validation_result") or "submitted"
+            print(
+                colored(f"[{done}/{len(jobs)}] {result['target']}: {status}", color),
+                file=sys.stderr,
+            )
+    validator.executor.shutdown()
+    print(f"Finished: {counts['ok']} OK, {counts['error']} errors", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = create_arg_parser(__doc__)
+    targets = parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument("--directory", "-d", help="Directory with files to validate")
+    targets.add_argument("--manifest", "-m", help="CSV manifest of COUNTER APIs to validate")
+    parser.add_argument(
+        "--pattern", default="*", help="Glob pattern of files in the directory (default: *)"
+    )
+    parser.add_argument("--note", "-n", help="Free text note to attach to the validations")
+    parser.add_argument(
+        "--concurrency",
+        "-c",
+        type=int,
+        default=4,
+        help="Number of validations submitted at the same time (default: 4)",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        default="results.jsonl",
+        help="File to write the results into, use - for standard output (default: results.jsonl)",
+    )
+
+    args = parser.parse_args()
+    validate_args(args)
+    asyncio.run(main(args))
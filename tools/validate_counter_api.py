@@ -7,7 +7,7 @@ to be set in the environment variable COUNTER_VALIDATOR_API_KEY.
 from calendar import monthrange
 from datetime import date, timedelta
 
-from utils import create_arg_parser, make_request, validate_args
+from utils import create_arg_parser, make_batch_request, make_request, validate_args
 
 REPORTS = [
     "TR",
@@ -71,6 +71,12 @@ if __name__ == "__main__":
         default="TR",
         choices=REPORTS,
     )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Validate all the reports listed by the /reports endpoint together with the /status "
+        "and /members endpoints instead of a single report",
+    )
     parser.add_argument(
         "--begin-date",
         "-b",
@@ -104,17 +110,25 @@ if __name__ == "__main__":
         "begin_date": args.begin_date,
         "end_date": end_date,
         "url": args.url,
-        "report_code": args.report,
     }
 
     print(
         f"Sending request for validation of '{args.url}' for validation to {args.validator_url}..."
     )
 
-    response = make_request(
-        args.validator_url,
-        "/api/v1/validations/counter-api-validation/",
-        args.validator_api_key,
-        data,
-        wait=args.wait,
-    )
+    if args.sweep:
+        make_batch_request(
+            args.validator_url,
+            "/api/v1/validations/batch/sweep/",
+            args.validator_api_key,
+            data,
+            wait=args.wait,
+        )
+    else:
+        make_request(
+            args.validator_url,
+            "/api/v1/validations/counter-api-validation/",
+            args.validator_api_key,
+            data | {"report_code": args.report},
+            wait=args.wait,
+        )